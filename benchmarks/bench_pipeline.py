@@ -0,0 +1,213 @@
+""" Benchmarks for the parse -> schedule -> dispatch pipeline.
+
+Run from the top of the repository:
+
+    python -m benchmarks.bench_pipeline --sizes 10 100 1000 --output results.json
+    python -m benchmarks.bench_pipeline --sizes 10 100 1000 --compare results.json
+
+Each stage is timed on a synthetic corpus (see benchmarks.corpus) of each size. Results are
+saved as JSON and can be compared with a previous run; stages that got slower by more than
+--threshold are reported and make the command exit with status 1. etcd is replaced by a
+kvstore.MemoryStore, so no services are needed.
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import EarthLocation
+from observing import classes, commands, conflicts, kvstore, makesdf, parsesdf, pointing, schedule, sdfcache, tracking
+from benchmarks.corpus import make_corpus
+
+logger = logging.getLogger('observing')
+
+#: Most observations per corpus for which tracking updates are computed
+MAX_TRACKING = 20
+
+BUILDERS = {classes.ObsType.power: parsesdf.power_beam_obs, classes.ObsType.volt: parsesdf.volt_beam_obs,
+            classes.ObsType.voltraw: parsesdf.volt_beam_obs, classes.ObsType.fast: parsesdf.fast_vis_obs,
+            classes.ObsType.slow: parsesdf.slow_vis_obs}
+
+
+def timeit(func, repeat=5):
+    """ Call func repeat times. Returns list of durations in seconds.
+    """
+
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - t0)
+    return durations
+
+
+def get_site():
+    try:
+        return pointing.get_site()
+    except ImportError:
+        return EarthLocation.from_geodetic(-118.2817*u.deg, 37.2398*u.deg, 1183*u.m)
+
+
+def run_size(filenames, repeat=5):
+    """ Time each stage over a corpus. Returns {stage: (durations, number of items)}.
+    """
+
+    texts = []
+    for fn in filenames:
+        with open(fn) as fh:
+            texts.append(fh.read())
+
+    results = {}
+
+    def add(name, func, nitems, nrepeat=repeat):
+        results[name] = (timeit(func, nrepeat), nitems)
+
+    # parsing
+    def cold_parse():
+        sdfcache.get_cache().clear()
+        return [parsesdf.sdf_to_dict(fn) for fn in filenames]
+    add('sdf_to_dict', cold_parse, len(filenames))
+    add('sdf_to_dict_cached', lambda: [parsesdf.sdf_to_dict(fn) for fn in filenames], len(filenames))
+    dicts = [parsesdf._text_to_dict(text) for text in texts]
+    add('make_obs_list', lambda: [parsesdf.make_obs_list(dd) for dd in dicts], len(dicts))
+
+    # schedule frames per mode
+    obs_lists = [parsesdf.make_obs_list(dd) for dd in dicts]
+    by_type = {}
+    for session, obs_list in obs_lists:
+        by_type.setdefault(session.obs_type, []).append((session, obs_list))
+    for obs_type, sessions in sorted(by_type.items(), key=lambda kv: kv[0].value):
+        builder = BUILDERS[obs_type]
+        add(f'{builder.__name__}[{obs_type.value}]',
+            lambda: [builder(obs_list, session) for session, obs_list in sessions], len(sessions))
+    scheds = [BUILDERS[session.obs_type](obs_list, session) for session, obs_list in obs_lists]
+
+    def compile_cold():
+        commands._cache.clear()
+        for sched in scheds:
+            commands.compile_frame(sched.copy())
+    add('compile_frame', compile_cold, len(scheds))
+
+    # scheduling
+    add('sched_update', lambda: schedule.sched_update(list(scheds)), len(scheds))
+    add('create_dict', lambda: [schedule.create_dict(sched) for sched in scheds], len(scheds))
+
+    def check_all():
+        index = conflicts.ConflictIndex()
+        for sched in scheds:
+            if not schedule.is_conflicted(sched, index=index):
+                index.add_dict(schedule.create_dict(sched))
+    add('is_conflicted', check_all, len(scheds))
+
+    # beam pointing
+    site = get_site()
+    obs = [oo for dd in dicts for oo in pointing.tracking_obs(dd).values()][:MAX_TRACKING]
+    if obs:
+        add('get_tracking_updates', lambda: [tracking.get_tracking_updates(oo, site) for oo in obs], len(obs),
+            nrepeat=max(1, repeat//2))
+
+    # SDF generation
+    blocks = [(oo.obs_id, Time(oo.obs_start, format='mjd').isot, oo.obs_dur,
+               getattr(oo, 'ra', None), getattr(oo, 'dec', None))
+              for _, obs_list in obs_lists for oo in obs_list]
+
+    def make_blocks():
+        for obs_id, start, dur, ra, dec in blocks:
+            makesdf.make_obs_block(obs_id, start, dur, ra=ra, dec=dec, obs_mode=classes.EphemModes.trk_radec)
+    add('make_obs_block', make_blocks, len(blocks))
+
+    return results
+
+
+def summarize(durations, nitems):
+    return {'min': min(durations), 'median': statistics.median(durations), 'repeat': len(durations),
+            'nitems': nitems, 'per_item': min(durations)/max(nitems, 1)}
+
+
+def metadata():
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                             universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        rev = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'git': rev, 'python': platform.python_version(),
+            'machine': platform.node()}
+
+
+def run(sizes, repeat=5, nobs=2, directory=None):
+    """ Benchmark each corpus size. Returns dictionary with 'meta' and 'results' ({'stage[size]': summary}).
+    """
+
+    results = {}
+    with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+        for size in sizes:
+            filenames = make_corpus(size, os.path.join(tmpdir, str(size)), nobs=nobs)
+            for stage, (durations, nitems) in run_size(filenames, repeat=repeat).items():
+                results[f'{stage}[{size}]'] = summarize(durations, nitems)
+                print(f"{stage:>32s} {size:>6d}: {min(durations)*1e3:10.3f} ms "
+                      f"({min(durations)/max(nitems, 1)*1e6:10.1f} us/item)")
+
+    return {'meta': metadata(), 'results': results}
+
+
+def compare(new, old, threshold=0.2):
+    """ Compare results to those of a previous run. Returns list of (stage, old median, new median) that got
+    slower by more than threshold (fractional).
+    """
+
+    slower = []
+    for key, summary in new['results'].items():
+        if key not in old['results']:
+            continue
+        before, after = old['results'][key]['median'], summary['median']
+        ratio = after/before if before else float('inf')
+        flag = ' <-- slower' if ratio > 1 + threshold else ''
+        print(f"{key:>40s}: {before*1e3:10.3f} ms -> {after*1e3:10.3f} ms ({ratio:5.2f}x){flag}")
+        if flag:
+            slower.append((key, before, after))
+
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the parse -> schedule -> dispatch pipeline',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000],
+                        help='numbers of sessions in the synthetic corpora')
+    parser.add_argument('--repeat', type=int, default=5, help='times each stage is run')
+    parser.add_argument('--nobs', type=int, default=2, help='observations per session')
+    parser.add_argument('--output', type=str, default=None, help='file to save results (JSON)')
+    parser.add_argument('--compare', type=str, default=None, help='results file of a previous run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional slowdown reported as a regression')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.WARNING)
+    kvstore.set_store(kvstore.MemoryStore())
+
+    new = run(args.sizes, repeat=args.repeat, nobs=args.nobs)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            json.dump(new, fh, indent=1)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            old = json.load(fh)
+        if compare(new, old, threshold=args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+""" Load test of SDF submission through the etcd watch.
+
+Run from the top of the repository:
+
+    python -m benchmarks.bench_submit --nsessions 500 --latency 0.002
+
+A burst of submissions is put on /cmd/observing/submitsdf of a kvstore.MemoryStore, as
+'lwaobserving submit-sdf' does. A watch callback handles each one the way the executor does
+(make_sched, is_conflicted, enqueue, put_sched, put_dict). The test reports throughput and
+the delay from put to the end of each callback. latency and watch-latency emulate etcd
+round trips.
+"""
+
+import sys
+import time
+import logging
+import argparse
+import statistics
+import tempfile
+import threading
+
+from observing import conflicts, kvstore, parsesdf, schedule
+from observing.schedqueue import ScheduleQueue
+from benchmarks.corpus import make_corpus
+
+logger = logging.getLogger('observing')
+
+SUBMIT_KEY = '/cmd/observing/submitsdf'
+
+
+def run(nsessions, latency=0., watch_latency=0., conflict_fraction=0., directory=None):
+    """ Submit nsessions SDFs in a burst and wait for all to be handled. Returns dictionary of results.
+    """
+
+    store = kvstore.MemoryStore(latency=latency, watch_latency=watch_latency)
+    previous = kvstore.set_store(store)
+    queue = ScheduleQueue()
+    index = conflicts.ConflictIndex()
+    delays = []
+    nconflicts = [0]
+    done = threading.Event()
+
+    def callback(event):
+        try:
+            sched = parsesdf.make_sched(event['filename'], mode=event['mode'])
+            sched.sort_index(inplace=True)
+            if not schedule.is_conflicted(sched, index=index):
+                schedule.enqueue(queue, sched, mode=event['mode'])
+                index.add_dict(schedule.create_dict(sched))
+                schedule.put_sched(queue)
+                schedule.put_dict(event['filename'])
+            else:
+                nconflicts[0] += 1
+        finally:
+            delays.append(time.perf_counter() - event['t_put'])
+            if len(delays) == nsessions:
+                done.set()
+
+    try:
+        with tempfile.TemporaryDirectory(dir=directory) as tmpdir:
+            filenames = make_corpus(nsessions, tmpdir, conflicts=conflict_fraction)
+            wid = store.add_watch(SUBMIT_KEY, callback)
+            t0 = time.perf_counter()
+            for fn in filenames:
+                store.put_dict(SUBMIT_KEY, {'filename': fn, 'mode': 'buffer', 't_put': time.perf_counter()})
+            tput = time.perf_counter() - t0
+            done.wait()
+            elapsed = time.perf_counter() - t0
+            store.cancel(wid)
+    finally:
+        kvstore.set_store(previous)
+
+    return {'nsessions': nsessions, 'nconflicts': nconflicts[0], 'nscheduled': queue.nsessions,
+            'put_seconds': tput, 'elapsed_seconds': elapsed, 'sessions_per_second': nsessions/elapsed,
+            'median_delay': statistics.median(delays), 'max_delay': max(delays),
+            'nput': store.nput, 'nget': store.nget}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test of SDF submission through the etcd watch',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--nsessions', type=int, default=200, help='number of submissions in the burst')
+    parser.add_argument('--latency', type=float, default=0., help='seconds added to each get/put')
+    parser.add_argument('--watch-latency', type=float, default=0., help='seconds added before each watch callback')
+    parser.add_argument('--conflicts', type=float, default=0.1, help='fraction of sessions that conflict')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.WARNING)
+
+    results = run(args.nsessions, latency=args.latency, watch_latency=args.watch_latency,
+                  conflict_fraction=args.conflicts)
+    for key, value in results.items():
+        print(f"{key:>20s}: {value:.4g}" if isinstance(value, float) else f"{key:>20s}: {value}")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
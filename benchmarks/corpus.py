@@ -0,0 +1,49 @@
+""" Synthetic SDF corpora for benchmarks.
+
+Sessions are spread over independent lanes (POWER beams 2-16, VOLT beam 1, FAST and SLOW), each
+running its sessions back to back, so a corpus of any size has no conflicts unless asked for.
+"""
+
+import os
+import random
+from astropy.time import Time
+from observing import classes, makesdf
+
+#: (session mode, beam) of each lane
+LANES = [('POWER', 2), ('VOLT', 1), ('FAST', None), ('SLOW', None)] + [('POWER', beam) for beam in range(3, 17)]
+
+
+def make_corpus(nsessions, directory, start=None, nobs=2, obs_dur=300000, gap=60., conflicts=0., seed=0):
+    """ Write nsessions SDFs to directory and return their file names in order of session id.
+    Sessions start one day after start (unix time, default now) and have nobs observations of obs_dur ms each.
+    A fraction conflicts of sessions are placed over the previous session in their lane.
+    """
+
+    rng = random.Random(seed)
+    start = Time.now().unix + 86400 if start is None else start + 86400
+    session_len = nobs*obs_dur/1e3 + 120 + gap   # observations plus setup buffers and a gap
+    os.makedirs(directory, exist_ok=True)
+
+    filenames = []
+    for i in range(nsessions):
+        mode, beam = LANES[i % len(LANES)]
+        slot = i // len(LANES)
+        if slot and rng.random() < conflicts:
+            slot -= 1
+        t0 = start + slot*session_len + 120
+
+        text = makesdf.make_session_preamble(i + 1, classes.ObsType(mode), pi_id=1, pi_name='Benchmark',
+                                             beam_num=beam)
+        for obs_id in range(1, nobs + 1):
+            tt = Time(t0 + (obs_id - 1)*obs_dur/1e3, format='unix').isot[:23]
+            text += makesdf.make_obs_block(obs_id, tt, obs_dur, ra=rng.uniform(0, 360), dec=rng.uniform(-20, 85),
+                                           obj_name=f'src{i}', integration_time=None if mode == 'VOLT' else 1,
+                                           obs_mode=classes.EphemModes.trk_radec)
+            text += '\n'
+
+        filename = os.path.join(directory, f'session_{i + 1:05d}.sdf')
+        with open(filename, 'w') as fh:
+            fh.write(text)
+        filenames.append(filename)
+
+    return filenames
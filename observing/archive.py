@@ -0,0 +1,102 @@
+""" Streaming tar archive for session metadata.
+
+Members are written to the compressed archive as they are added, from bytes in memory or an
+open file, so nothing is staged in the working directory and an archive can be filled
+incrementally while a session runs. Compression is gzip (compatible with 'tar czf') or, if the
+zstandard package is installed, multi-threaded zstd.
+"""
+
+import io
+import gzip
+import time
+import tarfile
+import logging
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger('observing')
+
+#: File name extension for each compression
+EXTENSIONS = {'gz': '.tgz', 'zst': '.tar.zst'}
+
+
+class MetadataArchive:
+    """ Tar archive written as a stream to path.
+    compression is 'gz' or 'zst' (falls back to 'gz' if zstandard is not installed).
+    compresslevel trades speed for size (gzip 1-9, zstd 1-22). threads applies to zstd (-1 uses all cores).
+    """
+
+    def __init__(self, path, compression='gz', compresslevel=6, threads=-1):
+        if compression == 'zst' and zstandard is None:
+            logger.warning("zstandard not available. Using gzip compression.")
+            compression = 'gz'
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Compression {compression} must be one of {list(EXTENSIONS)}")
+
+        self.path = path
+        self.compression = compression
+        self._fh = open(path, 'wb')
+        if compression == 'zst':
+            self._stream = zstandard.ZstdCompressor(level=compresslevel, threads=threads).stream_writer(self._fh)
+        else:
+            self._stream = gzip.GzipFile(fileobj=self._fh, mode='wb', compresslevel=compresslevel)
+        self._tar = tarfile.open(fileobj=self._stream, mode='w')
+        self.names = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_bytes(self, name, data, mtime=None):
+        """ Add member name with contents data (bytes or str).
+        """
+
+        if isinstance(data, str):
+            data = data.encode()
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time() if mtime is None else mtime)
+        info.mode = 0o644
+        self._tar.addfile(info, io.BytesIO(data))
+        self.names.append(name)
+
+    def add_file(self, name, filename):
+        """ Add member name with the contents of filename.
+        """
+
+        self._tar.add(filename, arcname=name, recursive=False)
+        self.names.append(name)
+
+    def flush(self):
+        """ Push members added so far to disk, so a partial archive is readable up to them.
+        """
+
+        self._stream.flush()
+        self._fh.flush()
+
+    def close(self):
+        if self._tar is None:
+            return
+
+        self._tar.close()
+        self._stream.close()
+        if not self._fh.closed:
+            self._fh.close()
+        self._tar = None
+
+
+def open_archive(basename, compression='gz', compresslevel=6):
+    """ Open MetadataArchive at basename plus the extension for compression (e.g., '.tgz').
+    """
+
+    if compression == 'zst' and zstandard is None:
+        logger.warning("zstandard not available. Using gzip compression.")
+        compression = 'gz'
+
+    return MetadataArchive(basename + EXTENSIONS.get(compression, ''), compression=compression,
+                           compresslevel=compresslevel)
@@ -1,6 +1,9 @@
 from enum import Enum
 import os.path
 
+#: mnc configuration used when a session does not define CONFIG_FILE
+DEFAULT_CONFIG_FILE = '/home/pipeline/proj/lwa-shell/mnc_python/config/lwa_config_calim.yaml'
+
 class ObsType(Enum):
     volt = 'VOLT'
     voltraw = 'VOLTRAW'
@@ -39,7 +42,7 @@ class Session:
         self.session_id = session_id
         self.obs_type = ObsType(obs_type)
         if config_file is None:
-            self.config_file = '/home/pipeline/proj/lwa-shell/mnc_python/config/lwa_config_calim.yaml'
+            self.config_file = DEFAULT_CONFIG_FILE
         elif config_file is not None:
             self.config_file = config_file
         self.cal_directory = cal_directory
@@ -48,6 +51,11 @@ class Session:
         self.__validate()
         return
     
+    def validate(self):
+        """ Check the settings again, e.g., for a Session taken from the SDF cache.
+        """
+        self.__validate()
+
     def __validate(self):
         if self.beam_num is not None:
             self.beam_num = int(self.beam_num)
@@ -1,17 +1,16 @@
 import os.path
 import click
 from time import sleep
-from dsautils import dsa_store
 from observing import schedule, makesdf, parsesdf
+from observing.kvstore import get_store
+from observing.clock import now_mjd
 from mnc import control
 import sys
 import logging
 import warnings
-from astropy.time import Time
 
 warnings.filterwarnings('ignore', module='astropy._erfa')
 logger = logging.getLogger('observing')
-ls = dsa_store.DsaStore()
 
 
 @click.group('lwaobserving')
@@ -46,7 +45,7 @@ def submit_sdf(sdffile, asap, reset):
         session_mode_name = f"{dd['SESSION']['SESSION_ID']}_{dd['SESSION']['SESSION_MODE']}"
         if 'SESSION_DRX_BEAM' in dd['SESSION']:
             session_mode_name += dd['SESSION']['SESSION_DRX_BEAM']
-        if session_mode_name in ls.get_dict('/mon/observing/sdfdict'):
+        if session_mode_name in get_store().get_dict('/mon/observing/sdfdict'):
             print(f"Warning: SDF {sdffile} was parsed by scheduler before. Was this SDF already submitted?")
 
         sched = parsesdf.make_sched(sdffile)
@@ -58,22 +57,21 @@ def submit_sdf(sdffile, asap, reset):
         return
 
     if reset:
-        ls.put_dict('/mon/observing/schedule', {})
-        ls.put_dict('/mon/observing/submitted', {})
-        ls.put_dict('/cmd/observing/submitsdf', {'sdffile': None, 'mode': 'reset'})
+        get_store().put_dict('/mon/observing/schedule', {})
+        get_store().put_dict('/mon/observing/submitted', {})
+        get_store().put_dict('/cmd/observing/submitsdf', {'sdffile': None, 'mode': 'reset'})
 
     mode = 'asap' if asap else 'buffer'
-    ls.put_dict('/cmd/observing/submitsdf', {'filename': sdffile, 'mode': mode})
+    get_store().put_dict('/cmd/observing/submitsdf', {'filename': sdffile, 'mode': mode})
 
     # wait, then see if it got parsed and scheduled
     sleep(1)
-    sdfdict = ls.get_dict('/mon/observing/sdfdict')
+    sdfdict = get_store().get_dict('/mon/observing/sdfdict')
     if session_mode_name not in sdfdict:
         print(f"SDF failed to get parsed by scheduler (session mode name: {session_mode_name})")
         return
 
-    scheduled = ls.get_dict('/mon/observing/schedule')
-    active = ls.get_dict('/mon/observing/submitted')
+    scheduled, active = schedule.get_sched(modes=[session_mode_name.split('_')[1]])
     any_scheduled = any([key for key in scheduled if session_mode_name in scheduled[key]])
     any_active = any([key for key in active if session_mode_name in active[key]])
     if not any_scheduled and not any_active:
@@ -118,9 +116,9 @@ def submit_command(command, mjd):
     """
 
     if mjd is None:
-        mjd = Time.now().mjd + 1/(24*3600)  # give it a little delay
+        mjd = now_mjd() + 1/(24*3600)  # give it a little delay
     
-    ls.put_dict('/cmd/observing/submitsdf', {'mjd': mjd, 'command': command, 'mode': 'buffer'})
+    get_store().put_dict('/cmd/observing/submitsdf', {'mjd': mjd, 'command': command, 'mode': 'buffer'})
 
 
 @cli.command()
@@ -130,7 +128,7 @@ def reset_schedule(hard):
     hard reset will cancel observation currently being observed (experimental).
     """
 
-    ls.put_dict('/cmd/observing/submitsdf', {'filename': None, 'mode': 'reset'})
+    get_store().put_dict('/cmd/observing/submitsdf', {'filename': None, 'mode': 'reset'})
     if hard:
         raise NotImplementedError
 
@@ -141,7 +139,7 @@ def cancel_sdf(sdffile):
     """ Use SDF to remove session from schedule
     """
 
-    ls.put_dict('/cmd/observing/submitsdf', {'filename': sdffile, 'mode': 'cancel'})
+    get_store().put_dict('/cmd/observing/submitsdf', {'filename': sdffile, 'mode': 'cancel'})
 
 
 @cli.command()
@@ -173,3 +171,18 @@ def stop_dr(recorder):
 
     con = control.Controller(recorders=recorder)
     con.stop_dr(recorder)
+
+
+@cli.command()
+@click.argument('sdffiles', nargs=-1)
+@click.option('--speed', type=float, default=1000., show_default=True, help='Times faster than real time')
+@click.option('--processes', type=int, default=8, show_default=True, help='Number of execution threads')
+def simulate_sdf(sdffiles, speed, processes):
+    """ Run SDFs through the scheduler on a virtual clock against stub controllers and print a report.
+    """
+
+    from observing import simulate
+
+    dd = simulate.run(sdffiles, speed=speed, processes=processes)
+    for key, value in dd.items():
+        print(f'{key}: {value}')
@@ -0,0 +1,181 @@
+""" Clocks used for scheduling and waiting.
+
+Code that schedules or waits gets the current time from get_clock() rather than from the
+system, so that a simulation can install a VirtualClock that runs faster than real time.
+The virtual time is a fixed function of the system clock, so all threads see the same time.
+MJDs are computed from unix time without building astropy Time objects; a cached leap
+second table gives TAI where needed.
+"""
+
+import time
+import bisect
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger('observing')
+
+#: MJD of the unix epoch
+UNIX_EPOCH_MJD = 40587
+
+_MJD_ZERO = datetime.date(1858, 11, 17)
+
+#: TAI-UTC (s) since 2017 January 1, used if the leap second table cannot be loaded
+TAI_UTC = 37.
+
+_leap_mjds = None
+_leap_offsets = None
+_leap_lock = threading.Lock()
+
+
+class SystemClock:
+    """ Real time.
+    """
+
+    speed = 1.
+
+    def time(self):
+        """ Return unix time in seconds.
+        """
+
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def mjd(self, scale='utc'):
+        """ Return MJD in scale 'utc' (default) or 'tai'.
+        Unix time counts UTC days of 86400 s, so the UTC MJD follows from it directly.
+        """
+
+        return unix_to_mjd(self.time(), scale=scale)
+
+
+class VirtualClock(SystemClock):
+    """ Clock that starts at unix time start (default now) and runs speed times faster than real time.
+    advance() jumps it forward, e.g., over idle time in a simulation.
+    """
+
+    def __init__(self, start=None, speed=1000.):
+        self.speed = float(speed)
+        self._origin = (time.monotonic(), time.time() if start is None else float(start))   # (real, virtual)
+        self._lock = threading.Lock()
+
+    def time(self):
+        real0, virtual0 = self._origin
+        return virtual0 + (time.monotonic() - real0)*self.speed
+
+    def monotonic(self):
+        return self.time()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds/self.speed)
+
+    def advance(self, seconds):
+        """ Jump forward by seconds. Threads sleeping at the time still sleep their full (real) time.
+        """
+
+        if seconds > 0:
+            with self._lock:
+                real0, virtual0 = self._origin
+                self._origin = (real0, virtual0 + seconds)
+
+
+def _from_table(table):
+    # leap seconds take effect on the first of a month
+    mjds = [float((datetime.date(int(year), int(month), 1) - _MJD_ZERO).days)
+            for year, month in zip(table['year'], table['month'])]
+    return mjds, [float(tai_utc) for tai_utc in table['tai_utc']]
+
+
+def _erfa_table(erfa):
+    return _from_table(erfa.leap_seconds.get())
+
+
+def _read_leap_seconds():
+    # pyerfa (astropy >= 4.2), then astropy's bundled erfa (astropy 4.0/4.1, e.g., on Python 3.6), then the IERS table
+    try:
+        import erfa
+        return _erfa_table(erfa)
+    except Exception as exc:
+        logger.debug(f"Could not read leap seconds from erfa: {str(exc)}")
+
+    try:
+        from astropy import _erfa
+        return _erfa_table(_erfa)
+    except Exception as exc:
+        logger.debug(f"Could not read leap seconds from astropy._erfa: {str(exc)}")
+
+    from astropy.utils.iers import LeapSeconds
+    return _from_table(LeapSeconds.auto_open())
+
+
+def leap_seconds():
+    """ Return the leap second table as lists of MJDs and the TAI-UTC (s) that applies from each.
+    The table is read once from erfa (as used by astropy) and cached. If it cannot be read, TAI_UTC is used for
+    all dates, with a warning.
+    """
+
+    global _leap_mjds, _leap_offsets
+    with _leap_lock:
+        if _leap_mjds is None:
+            try:
+                _leap_mjds, _leap_offsets = _read_leap_seconds()
+            except Exception as exc:
+                logger.warning(f"Could not read leap second table ({str(exc)}). Using TAI-UTC = {TAI_UTC} s "
+                               "for all dates, which is wrong before 2017.")
+                _leap_mjds, _leap_offsets = [57754.], [TAI_UTC]
+        return _leap_mjds, _leap_offsets
+
+
+def tai_minus_utc(mjd):
+    """ Return TAI-UTC in seconds at UTC MJD (from 1972, when UTC started counting whole leap seconds).
+    """
+
+    mjds, offsets = leap_seconds()
+    i = bisect.bisect_right(mjds, mjd) - 1
+    return offsets[max(i, 0)]
+
+
+def unix_to_mjd(unix, scale='utc'):
+    """ Convert unix time (seconds) to MJD in scale 'utc' or 'tai'.
+    """
+
+    mjd = UNIX_EPOCH_MJD + unix/86400
+    if scale == 'tai':
+        mjd += tai_minus_utc(mjd)/86400
+    elif scale != 'utc':
+        raise ValueError(f"Scale {scale} must be 'utc' or 'tai'")
+    return mjd
+
+
+def now_mjd():
+    """ Return current UTC MJD from the clock in use. Cheaper than astropy Time.now().mjd.
+    """
+
+    return _clock.mjd()
+
+
+_clock = SystemClock()
+
+
+def get_clock():
+    """ Return the clock in use.
+    """
+
+    return _clock
+
+
+def set_clock(clock=None):
+    """ Use clock (SystemClock if None) for scheduling and waiting. Returns the previous clock.
+    """
+
+    global _clock
+    previous = _clock
+    _clock = clock if clock is not None else SystemClock()
+    return previous
@@ -0,0 +1,70 @@
+""" Precompiled schedule commands.
+
+Commands in a schedule are Python statements generated by parsesdf. Command is a str that
+also holds the statement compiled to bytecode, so a command is parsed once, when the
+schedule is made, and a syntax error rejects the session at submission instead of stopping
+it partway. Commands pickle with their bytecode (marshal), so pool workers do not recompile
+them. Compiled code is cached by source, since most commands repeat across sessions.
+"""
+
+import marshal
+import logging
+import threading
+
+logger = logging.getLogger('observing')
+
+#: Most distinct command sources kept in the cache
+CACHE_SIZE = 4096
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class Command(str):
+    """ Command source with its compiled code. Raises SyntaxError if source does not compile.
+    """
+
+    def __new__(cls, source, code=None):
+        self = super().__new__(cls, source)
+        self.code = code if code is not None else compile(source, '<command>', 'exec')
+        return self
+
+    def __reduce__(self):
+        return (_unmarshal, (str(self), marshal.dumps(self.code)))
+
+    def run(self, namespace):
+        """ Execute command with namespace (dict) as its globals, shared by the commands of a session.
+        """
+
+        exec(self.code, namespace)
+
+
+def _unmarshal(source, data):
+    return Command(source, code=marshal.loads(data))
+
+
+def compile_command(source):
+    """ Return Command for source (str or Command), compiling it or reusing a compiled one.
+    """
+
+    if isinstance(source, Command):
+        return source
+
+    command = _cache.get(source)
+    if command is None:
+        command = Command(source)
+        with _lock:
+            if len(_cache) >= CACHE_SIZE:
+                _cache.clear()
+            _cache[source] = command
+
+    return command
+
+
+def compile_frame(sched):
+    """ Replace the command column of a schedule DataFrame with Commands. Raises SyntaxError for a bad command.
+    """
+
+    if len(sched) and 'command' in sched.columns:
+        sched['command'] = [compile_command(cmd) for cmd in sched.command]
+    return sched
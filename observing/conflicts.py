@@ -0,0 +1,263 @@
+""" Interval indexes used to check new sessions against the schedule.
+
+Each observing mode (e.g., 'POWER3', 'VOLT1', 'FAST') keeps its sessions as closed
+[start, stop] MJD intervals sorted by start time. A query bisects into the sorted starts and
+only inspects intervals that start within the longest duration currently indexed before the
+query range. Durations are kept sorted, so the longest is updated as intervals are removed or
+pruned, and lookups cost O(log n) plus the number of sessions that start in that window.
+
+Sessions of different modes can also clash, if the modes use the same beam or recorder (e.g.,
+POWER1, VOLT1 and VOLTRAW1 all use beam 1). find_conflict checks those modes too (see mode_resources),
+so such sessions are rejected when they are submitted, and every session is dispatched as
+its own task.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+import logging
+
+logger = logging.getLogger('observing')
+
+
+class IntervalIndex:
+    """ Sorted index of named, closed time intervals for a single mode.
+    """
+
+    def __init__(self):
+        self._items = []   # sorted (start, stop, name)
+        self._starts = []   # sorted start times, parallel to _items
+        self._names = {}   # name -> (start, stop)
+        self._durations = []   # sorted durations of indexed intervals
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        for start, stop, name in self._items:
+            yield name, (start, stop)
+
+    def add(self, name, start, stop):
+        """ Add or replace the interval for name.
+        """
+
+        if name in self._names:
+            self.remove(name)
+        start, stop = min(start, stop), max(start, stop)
+        item = (start, stop, name)
+        i = bisect_right(self._items, item)
+        self._items.insert(i, item)
+        self._starts.insert(i, start)
+        self._names[name] = (start, stop)
+        insort(self._durations, stop - start)
+
+    def remove(self, name):
+        """ Remove the interval for name. Returns False if it was not indexed.
+        """
+
+        if name not in self._names:
+            return False
+        start, stop = self._names.pop(name)
+        i = bisect_left(self._items, (start, stop, name))
+        del self._items[i]
+        del self._starts[i]
+        del self._durations[bisect_left(self._durations, stop - start)]
+        return True
+
+    @property
+    def _maxdur(self):
+        return self._durations[-1] if self._durations else 0.
+
+    def _candidates(self, start, stop):
+        lo = bisect_left(self._starts, start - self._maxdur)
+        hi = bisect_right(self._starts, stop)
+        return self._items[lo:hi]
+
+    def overlapping(self, start, stop):
+        """ Return names of intervals that share any time with [start, stop], in start order.
+        """
+
+        return [name for (t0, t1, name) in self._candidates(start, stop) if t1 >= start]
+
+    def first_conflict(self, start, stop):
+        """ Return the earliest-starting name overlapping [start, stop] or None.
+        """
+
+        for t0, t1, name in self._candidates(start, stop):
+            if t1 >= start:
+                return name
+        return None
+
+    def containing(self, start, stop):
+        """ Return names of intervals that fully contain [start, stop].
+        """
+
+        return [name for (t0, t1, name) in self._candidates(start, stop) if t0 <= start and t1 >= stop]
+
+    def contained(self, start, stop):
+        """ Return names of intervals that lie fully within [start, stop].
+        """
+
+        lo = bisect_left(self._starts, start)
+        hi = bisect_right(self._starts, stop)
+        return [name for (t0, t1, name) in self._items[lo:hi] if t1 <= stop]
+
+    def prune(self, mjd):
+        """ Remove intervals that stopped before mjd. Returns the removed names.
+        """
+
+        hi = bisect_left(self._starts, mjd)
+        removed = [name for (t0, t1, name) in self._items[:hi] if t1 < mjd]
+        for name in removed:
+            self.remove(name)
+        return removed
+
+
+class ConflictIndex:
+    """ Per-mode interval indexes for scheduled and active sessions.
+    Sessions are identified by session_mode_name and grouped by mode (as in schedule.create_dict).
+    """
+
+    def __init__(self):
+        self._modes = {}   # mode -> IntervalIndex
+        self._session_modes = {}   # session_mode_name -> mode
+
+    def __len__(self):
+        return len(self._session_modes)
+
+    def __contains__(self, name):
+        return name in self._session_modes
+
+    @classmethod
+    def from_dicts(cls, *dicts):
+        """ Build index from one or more dicts of {mode: {session_mode_name: [start, stop]}}.
+        """
+
+        index = cls()
+        for dd in dicts:
+            index.add_dict(dd)
+        return index
+
+    def add(self, mode, name, start, stop):
+        """ Add a session time range for mode.
+        """
+
+        if name in self._session_modes and self._session_modes[name] != mode:
+            self.remove(name)
+        self._modes.setdefault(mode, IntervalIndex()).add(name, start, stop)
+        self._session_modes[name] = mode
+
+    def add_dict(self, dd):
+        """ Add sessions from a dict of {mode: {session_mode_name: [start, stop]}}.
+        """
+
+        for mode, sessions in (dd or {}).items():
+            for name, (start, stop) in sessions.items():
+                self.add(mode, name, start, stop)
+
+    def remove(self, name):
+        """ Remove a session by session_mode_name. Returns False if it was not indexed.
+        """
+
+        mode = self._session_modes.pop(name, None)
+        if mode is None:
+            return False
+        self._modes[mode].remove(name)
+        if not len(self._modes[mode]):
+            del self._modes[mode]
+        return True
+
+    def clear(self):
+        self._modes.clear()
+        self._session_modes.clear()
+
+    def prune(self, mjd):
+        """ Remove sessions that ended before mjd. Returns the removed names.
+        """
+
+        removed = []
+        for mode in list(self._modes):
+            for name in self._modes[mode].prune(mjd):
+                self._session_modes.pop(name, None)
+                removed.append(name)
+            if not len(self._modes[mode]):
+                del self._modes[mode]
+        return removed
+
+    def first_conflict(self, mode, start, stop):
+        """ Return the session_mode_name of the first session in mode that overlaps [start, stop] or None.
+        """
+
+        index = self._modes.get(mode)
+        if index is None:
+            return None
+        return index.first_conflict(start, stop)
+
+    def overlapping(self, mode, start, stop):
+        index = self._modes.get(mode)
+        return index.overlapping(start, stop) if index is not None else []
+
+    def containing(self, mode, start, stop):
+        index = self._modes.get(mode)
+        return index.containing(start, stop) if index is not None else []
+
+    def contained(self, mode, start, stop):
+        index = self._modes.get(mode)
+        return index.contained(start, stop) if index is not None else []
+
+    def find_conflict(self, dd):
+        """ Check a dict of {mode: {session_mode_name: [start, stop]}} against the index, including modes that
+        share a beam or recorder.
+        Returns (new session_mode_name, existing session_mode_name) for the first conflict or None.
+        """
+
+        for mode, sessions in dd.items():
+            modes = [mode] + self.sharing_modes(mode)
+            for name, (start, stop) in sessions.items():
+                for other in modes:
+                    existing = self.first_conflict(other, start, stop)
+                    if existing is not None:
+                        return name, existing
+        return None
+
+    def sharing_modes(self, mode):
+        """ Return the other indexed modes that use a beam or recorder of mode.
+        """
+
+        resources = mode_resources(mode)
+        if not resources:
+            return []
+        return [other for other in self._modes if other != mode and resources & mode_resources(other)]
+
+    def to_dict(self):
+        """ Return index as a dict of {mode: {session_mode_name: [start, stop]}}.
+        """
+
+        return {mode: {name: list(trange) for name, trange in index} for mode, index in self._modes.items()}
+
+
+def mode_resources(mode):
+    """ Return set of beams/recorders used by a mode. Settings and single commands use none.
+    """
+
+    if mode.startswith('POWER') and mode[5:].isdigit():
+        return {f'dr{mode[5:]}'}
+    elif mode.startswith('VOLTRAW') and mode[7:].isdigit():
+        return {f'dr{mode[7:]}', f'drt{mode[7:]}'}
+    elif mode.startswith('VOLT') and mode[4:].isdigit():
+        return {f'dr{mode[4:]}', f'drt{mode[4:]}'}   # beam is configured in x-engine and recorded by the t-engine
+    elif mode == 'FAST':
+        return {'drvf'}
+    elif mode == 'SLOW':
+        return {'drvs'}
+    else:
+        return set()
+
+
+def session_resources(session_mode_name):
+    """ Return set of beams/recorders used by a session (see mode_resources).
+    """
+
+    return mode_resources(session_mode_name.split('_', 1)[1])
+
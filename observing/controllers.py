@@ -0,0 +1,120 @@
+""" Cache of mnc Controller objects for execution workers.
+
+Building a Controller reads its YAML configuration and creates recorder and x-engine
+clients, which dominates the start of a session. The cache lets the worker initializer
+(workers.warm) build the Controller before the worker is given a session, so the session's
+get_controller call returns it at once. With the executor's maxtasksperchild=1, a worker runs
+one session, so the cache does not outlive that session. Across sessions in a longer-lived
+process, a cached Controller is reused as long as the file is unchanged and it passes a
+health check. Each checkout restores the configuration as loaded, so changes a session makes
+to con.conf (e.g., cal_directory) do not carry over to the next one.
+"""
+
+import os
+import copy
+import time
+import logging
+import threading
+
+logger = logging.getLogger('observing')
+
+_controllers = {}   # abspath -> _Entry
+_lock = threading.Lock()
+_factory = None   # default factory, if not mnc.control.Controller
+
+
+class _Entry:
+    def __init__(self, controller, mtime):
+        self.controller = controller
+        self.mtime = mtime
+        self.created = time.time()
+        self.conf = copy.deepcopy(getattr(controller, 'conf', None))
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _healthy(entry, path, max_age=None, check=None):
+    if entry.mtime != _mtime(path):
+        logger.info(f"Configuration {path} changed. Rebuilding controller.")
+        return False
+
+    if max_age is not None and time.time() - entry.created > max_age:
+        logger.info(f"Controller for {path} is older than {max_age} s. Rebuilding controller.")
+        return False
+
+    if check is not None:
+        try:
+            if not check(entry.controller):
+                logger.warning(f"Controller for {path} failed health check. Rebuilding controller.")
+                return False
+        except Exception as exc:
+            logger.warning(f"Controller for {path} failed health check ({str(exc)}). Rebuilding controller.")
+            return False
+
+    return True
+
+
+def get_controller(config_file, max_age=None, check=None, factory=None):
+    """ Return a Controller for config_file, reusing a cached one if it is still valid.
+    max_age (seconds) and check (callable taking the controller and returning bool) add health checks.
+    factory builds a new controller from the config file (default set by set_factory or mnc.control.Controller).
+    """
+
+    path = os.path.abspath(config_file)
+    with _lock:
+        entry = _controllers.get(path)
+        if entry is not None and _healthy(entry, path, max_age=max_age, check=check):
+            if entry.conf is not None:
+                entry.controller.conf = copy.deepcopy(entry.conf)
+            return entry.controller
+
+        if factory is None:
+            factory = _factory
+        if factory is None:
+            from mnc import control
+            factory = control.Controller
+
+        t0 = time.time()
+        controller = factory(config_file)
+        _controllers[path] = _Entry(controller, _mtime(path))
+        logger.info(f"Built controller for {config_file} in {time.time()-t0:.3f} s")
+
+    return controller
+
+
+def is_warm(config_file):
+    """ Return True if a Controller for config_file is cached and its configuration is unchanged.
+    """
+
+    path = os.path.abspath(config_file)
+    entry = _controllers.get(path)
+    return entry is not None and entry.mtime == _mtime(path)
+
+
+def invalidate(config_file=None):
+    """ Drop cached Controller for config_file (or all, if None).
+    """
+
+    with _lock:
+        if config_file is None:
+            _controllers.clear()
+        else:
+            _controllers.pop(os.path.abspath(config_file), None)
+
+
+def set_factory(factory=None):
+    """ Set the default factory used to build Controllers (None for mnc.control.Controller) and drop cached ones.
+    Returns the previous factory.
+    """
+
+    global _factory
+    with _lock:
+        previous = _factory
+        _factory = factory
+        _controllers.clear()
+    return previous
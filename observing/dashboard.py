@@ -0,0 +1,131 @@
+""" Cached reads of the obsstate database for the dashboard (scripts/obsstate.py).
+
+Results are kept for at most ttl seconds. They are dropped earlier if the database changes,
+which is detected with PRAGMA data_version on a connection kept for that purpose, so a page
+that auto-refreshes only queries again after a write. Rows are namedtuples with the fields
+of the obsstate models, built without validation. The methods block; the dashboard runs them
+in a thread pool so the event loop is not stalled.
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from observing import obsstate
+
+logger = logging.getLogger('observing')
+
+#: Seconds a result is reused if the database has not changed
+TTL = 5.
+#: Most results kept
+MAX_ENTRIES = 256
+
+SessionRow = namedtuple('SessionRow', ['time_loaded', 'PI_ID', 'PI_NAME', 'PROJECT_ID', 'SESSION_ID', 'SESSION_MODE',
+                                       'SESSION_DRX_BEAM', 'CONFIG_FILE', 'CAL_DIR', 'STATUS'])
+SettingsRow = namedtuple('SettingsRow', ['time_loaded', 'user', 'filename'])
+CalibrationRow = namedtuple('CalibrationRow', ['time_loaded', 'filename', 'beam'])
+
+
+class DashboardData:
+    """ Reads of sessions, settings and calibrations from the database at path, cached for ttl seconds or until
+    the database changes.
+    """
+
+    def __init__(self, path=None, ttl=TTL):
+        self.path = path or obsstate.DBPATH
+        self.ttl = ttl
+        self.nqueries = 0
+        self._cache = {}    # key -> (data version, expiry, result)
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._version_conn = None
+
+    def data_version(self):
+        """ Return a number that changes when the database is written by any connection.
+        """
+
+        with self._lock:
+            if self._version_conn is None:
+                self._version_conn = sqlite3.connect(self.path, check_same_thread=False)
+            return self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def invalidate(self):
+        """ Drop all cached results.
+        """
+
+        with self._lock:
+            self._cache.clear()
+
+    def _cached(self, key, func):
+        version = self.data_version()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            return entry[2]
+
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            # another request may have run the query while this one waited
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                return entry[2]
+            result = func()
+            self.nqueries += 1
+            with self._lock:
+                if len(self._cache) >= MAX_ENTRIES:
+                    now = time.monotonic()
+                    self._cache = {kk: ee for kk, ee in self._cache.items() if ee[0] == version and ee[1] > now}
+                    if len(self._cache) >= MAX_ENTRIES:
+                        self._cache.clear()
+                    self._locks = {kk: ll for kk, ll in self._locks.items() if kk in self._cache or kk == key}
+                self._cache[key] = (version, time.monotonic() + self.ttl, result)
+
+        return result
+
+    def sessions(self):
+        """ Return all sessions, newest first.
+        """
+
+        return self._cached(('sessions',), lambda: [SessionRow._make(row)
+                                                    for row in obsstate.read_sessions(path=self.path)])
+
+    def settings(self):
+        """ Return all settings, newest first.
+        """
+
+        return self._cached(('settings',), lambda: [SettingsRow._make(row)
+                                                    for row in obsstate.read_settings(path=self.path)])
+
+    def calibrations(self):
+        """ Return all calibrations, newest first.
+        """
+
+        return self._cached(('calibrations',), lambda: [CalibrationRow._make(row)
+                                                        for row in obsstate.read_calibrations(path=self.path)])
+
+    def query_sessions(self, start=None, stop=None, status=None, mode=None, pi=None, limit=obsstate.PAGE_SIZE,
+                       before=None):
+        """ Return a page of sessions and the cursor for the next page (see obsstate.query_sessions).
+        """
+
+        def query():
+            rows, cursor = obsstate.query_sessions(start=start, stop=stop, status=status, mode=mode, pi=pi,
+                                                   limit=limit, before=before, path=self.path)
+            return [SessionRow._make(row) for row in rows], cursor
+
+        key = ('query_sessions', start, stop, status if isinstance(status, (str, type(None))) else tuple(status),
+               mode, pi, limit, before)
+        return self._cached(key, query)
+
+    def combined(self):
+        """ Return (sessions, settings, calibrations) for the summary page.
+        """
+
+        return self.sessions(), self.settings(), self.calibrations()
+
+    def close(self):
+        with self._lock:
+            if self._version_conn is not None:
+                self._version_conn.close()
+                self._version_conn = None
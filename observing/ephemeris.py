@@ -0,0 +1,141 @@
+""" Cached positions of solar system bodies.
+
+Geocentric (GCRS) positions of the Sun, Moon and Jupiter are computed with astropy's
+get_body on a GRID_STEP grid spanning each UTC day and kept as cartesian tables. Positions at
+other times are linearly interpolated from the tables, which costs microseconds instead of an
+ephemeris evaluation. Tables are kept in memory and can optionally be persisted to disk
+(e.g., to share them between processes and restarts) by setting LWA_EPHEM_CACHE_DIR.
+"""
+
+import os
+import logging
+import threading
+import numpy
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import SkyCoord, GCRS, CartesianRepresentation, get_body
+
+logger = logging.getLogger('observing')
+
+#: Bodies available from the ephemeris (as used in TRK_SOL, TRK_LUN and TRK_JOV observations)
+BODIES = ('sun', 'moon', 'jupiter')
+
+#: Spacing of the tabulated positions (seconds). Interpolation error is < 0.1 arcsec for the Moon.
+GRID_STEP = 600
+
+# bump when the table format changes to ignore old files on disk
+_CACHE_VERSION = 1
+
+
+class Ephemeris:
+    """ Per-UTC-day tables of body positions.
+    """
+
+    def __init__(self, step=GRID_STEP, cache_dir=None):
+        self.step = step
+        self.cache_dir = cache_dir
+        self._tables = {}   # (body, mjd day) -> (mjd array, xyz array in AU with shape (3, n))
+        self._lock = threading.Lock()
+
+    def table(self, body, day):
+        """ Return (mjd, xyz) table for body covering the UTC day starting at integer MJD day.
+        """
+
+        body = body.lower()
+        if body not in BODIES:
+            raise ValueError(f"{body} is not one of {BODIES}")
+
+        key = (body, int(day))
+        with self._lock:
+            table = self._tables.get(key)
+        if table is not None:
+            return table
+
+        table = self._load(*key)
+        if table is None:
+            mjd = int(day) + numpy.arange(0, 86400 + self.step, self.step)/86400
+            pos = get_body(body, Time(mjd, format='mjd', scale='utc'))
+            xyz = pos.cartesian.xyz.to_value(u.AU)
+            table = (mjd, xyz)
+            self._dump(*key, table)
+
+        with self._lock:
+            self._tables[key] = table
+        return table
+
+    def xyz(self, body, mjd):
+        """ Return GCRS cartesian position (AU) of body at UTC mjd (float or array) with shape (3,) + shape of mjd.
+        """
+
+        mjd = numpy.asarray(mjd, dtype=float)
+        days = numpy.unique(numpy.floor(mjd).astype(int))
+        if len(days) == 1:
+            grid, xyz = self.table(body, days[0])
+        else:
+            tables = [self.table(body, day) for day in days]
+            grid = numpy.concatenate([table[0] for table in tables])
+            xyz = numpy.concatenate([table[1] for table in tables], axis=1)
+
+        return numpy.array([numpy.interp(mjd, grid, xyz[i]) for i in range(3)])
+
+    def radec(self, body, mjd):
+        """ Return apparent geocentric (ra, dec) of body in degrees at UTC mjd (float or array).
+        """
+
+        x, y, z = self.xyz(body, mjd)
+        ra = numpy.degrees(numpy.arctan2(y, x)) % 360
+        dec = numpy.degrees(numpy.arctan2(z, numpy.hypot(x, y)))
+        return ra, dec
+
+    def position(self, body, t):
+        """ Return SkyCoord (GCRS) of body at Time t (scalar or array).
+        """
+
+        xyz = self.xyz(body, t.utc.mjd)
+        return SkyCoord(CartesianRepresentation(xyz*u.AU), frame=GCRS(obstime=t))
+
+    def clear(self):
+        """ Drop all in-memory tables (files on disk are kept).
+        """
+
+        with self._lock:
+            self._tables.clear()
+
+    def _filename(self, body, day):
+        return os.path.join(self.cache_dir, f"{body}_{day}_{self.step}.v{_CACHE_VERSION}.npz")
+
+    def _load(self, body, day):
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with numpy.load(self._filename(body, day)) as dd:
+                return dd['mjd'], dd['xyz']
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Could not load cached ephemeris for {body} on MJD {day}: {str(exc)}")
+            return None
+
+    def _dump(self, body, day, table):
+        if self.cache_dir is None:
+            return
+
+        fn = self._filename(body, day)
+        tmp = f"{fn}.{os.getpid()}.tmp.npz"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            numpy.savez(tmp, mjd=table[0], xyz=table[1])
+            os.replace(tmp, fn)
+        except Exception as exc:
+            logger.warning(f"Could not persist ephemeris for {body} on MJD {day}: {str(exc)}")
+
+
+_ephemeris = Ephemeris(cache_dir=os.environ.get('LWA_EPHEM_CACHE_DIR', None))
+
+
+def get_ephemeris():
+    """ Return the process-wide ephemeris.
+    """
+
+    return _ephemeris
@@ -0,0 +1,203 @@
+""" Append-only journal of executor schedule changes.
+
+The executor keeps its schedule in memory, and etcd only holds session time ranges, so a
+restart loses the commands. Each change to the schedule (add, cancel, reset, dispatch,
+complete) is appended to a local JSON-lines file and flushed to disk before the executor
+moves on. The journal is periodically compacted into a snapshot of the current sessions.
+On startup, replay() loads the snapshot and the records written after it to rebuild the
+schedule without parsing any SDFs.
+
+Every record has a sequence number and the snapshot stores the last one it includes, so a
+crash between writing the snapshot and truncating the journal does not apply records twice.
+An "add" record holds all rows of a session and replaces any rows already replayed for it.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from pandas import DataFrame
+from observing import commands
+from observing.schedqueue import ScheduleQueue
+
+logger = logging.getLogger('observing')
+
+JOURNAL_PATH = os.environ.get('LWA_SCHEDULE_JOURNAL', '/opt/devel/pipeline/schedule.journal')
+
+
+def _default(obj):
+    # numpy scalars in DataFrame values and index
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"{type(obj)} is not JSON serializable")
+
+
+def rows_to_json(rows):
+    """ Convert session rows (DataFrame indexed by MJD) to a JSON-compatible dict.
+    """
+
+    return {'index': [float(mjd) for mjd in rows.index], 'columns': list(rows.columns),
+            'data': rows.values.tolist()}
+
+
+def rows_from_json(dd):
+    """ Inverse of rows_to_json.
+    """
+
+    return commands.compile_frame(DataFrame(dd['data'], index=dd['index'], columns=dd['columns']))
+
+
+def _session_ids(rows):
+    return [str(sid) for sid in rows.session_id.unique()]
+
+
+class ScheduleJournal:
+    """ Journal of schedule changes at path, with snapshot at path + '.snapshot'.
+    compact_every sets the number of records after which needs_compaction is True.
+    fsync=False skips syncing each record to disk (e.g., for tests).
+    """
+
+    def __init__(self, path=JOURNAL_PATH, compact_every=1000, fsync=True):
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._file = None
+        self._seq = 0
+        self._nrecords = 0
+        self._dispatched = {}   # session_id -> rows as json, until completed
+
+    @property
+    def needs_compaction(self):
+        return self._nrecords >= self.compact_every
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def _append(self, op, **kwargs):
+        with self._lock:
+            self._seq += 1
+            record = dict(seq=self._seq, op=op, time=time.time(), **kwargs)
+            ff = self._open()
+            ff.write(json.dumps(record, default=_default) + '\n')
+            ff.flush()
+            if self.fsync:
+                os.fsync(ff.fileno())
+            self._nrecords += 1
+
+    def add(self, rows):
+        """ Record all rows of the sessions in rows.
+        """
+
+        for session_id, srows in rows.groupby('session_id', sort=False):
+            self._append('add', session_id=str(session_id), rows=rows_to_json(srows))
+
+    def cancel(self, session_id):
+        self._append('cancel', session_id=str(session_id))
+
+    def reset(self):
+        self._append('reset')
+
+    def dispatch(self, rows):
+        """ Record that session rows were removed from the schedule and given to a worker.
+        """
+
+        with self._lock:
+            for session_id in _session_ids(rows):
+                self._dispatched[session_id] = rows_to_json(rows[rows.session_id.astype(str) == session_id])
+                self._append('dispatch', session_id=session_id)
+
+    def complete(self, session_id):
+        with self._lock:
+            self._dispatched.pop(str(session_id), None)
+            self._append('complete', session_id=str(session_id))
+
+    def replay(self):
+        """ Rebuild schedule from snapshot and journal.
+        Returns a ScheduleQueue and a dict of session_id to rows of sessions that were dispatched but not completed.
+        """
+
+        t0 = time.time()
+        with self._lock:
+            sessions = {}
+            dispatched = {}
+            seq = 0
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path) as ff:
+                    snapshot = json.load(ff)
+                seq = snapshot['seq']
+                sessions = snapshot['sessions']
+                dispatched = snapshot['dispatched']
+
+            nrecords = 0
+            if os.path.exists(self.path):
+                with open(self.path) as ff:
+                    for line in ff:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            logger.warning(f"Skipping incomplete record in {self.path}")
+                            continue
+                        nrecords += 1
+                        if record['seq'] <= seq:
+                            continue
+                        seq = record['seq']
+                        op = record['op']
+                        if op == 'add':
+                            sessions[record['session_id']] = record['rows']
+                        elif op == 'cancel':
+                            sessions.pop(record['session_id'], None)
+                        elif op == 'reset':
+                            sessions.clear()
+                        elif op == 'dispatch':
+                            rows = sessions.pop(record['session_id'], None)
+                            if rows is not None:
+                                dispatched[record['session_id']] = rows
+                        elif op == 'complete':
+                            dispatched.pop(record['session_id'], None)
+
+            self._seq = seq
+            self._nrecords = nrecords
+            self._dispatched = dict(dispatched)
+
+        queue = ScheduleQueue()
+        for dd in sessions.values():
+            queue.add(rows_from_json(dd))
+        logger.info(f"Replayed {queue.nsessions} sessions ({len(dispatched)} dispatched) from journal in {time.time()-t0:.3f} s")
+
+        return queue, {sid: rows_from_json(dd) for sid, dd in dispatched.items()}
+
+    def compact(self, queue):
+        """ Write snapshot of queue and dispatched sessions, then truncate the journal.
+        """
+
+        with self._lock:
+            sessions = {}
+            for session_id in queue.session_ids():
+                rows = queue.get(session_id)
+                if rows is not None:
+                    sessions[session_id] = rows_to_json(rows)
+            snapshot = {'seq': self._seq, 'sessions': sessions, 'dispatched': self._dispatched}
+
+            tmp = self.snapshot_path + '.tmp'
+            with open(tmp, 'w') as ff:
+                json.dump(snapshot, ff, default=_default)
+                ff.flush()
+                os.fsync(ff.fileno())
+            os.replace(tmp, self.snapshot_path)
+
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, 'w')
+            self._nrecords = 0
+        logger.info(f"Compacted schedule journal to {len(sessions)} sessions")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,141 @@
+""" Key-value store used for etcd keys.
+
+Modules get the store with get_store() rather than creating a dsautils DsaStore, so the
+backend can be replaced. By default it is a DsaStore (etcd). MemoryStore keeps keys in
+process and runs watch callbacks in a thread per watch, like DsaStore, with optional latency
+on every call. Use it for offline runs and load tests with set_store(MemoryStore()), or
+by setting LWA_KVSTORE=memory in the environment.
+"""
+
+import os
+import copy
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger('observing')
+
+_store = None
+_lock = threading.Lock()
+_STOP = object()
+
+
+class MemoryStore:
+    """ In-process store with the DsaStore interface (put_dict, get_dict, add_watch, cancel, watch_ids).
+    latency (seconds) is added to every put_dict and get_dict, watch_latency before every watch callback.
+    """
+
+    def __init__(self, latency=0., watch_latency=0.):
+        self.latency = latency
+        self.watch_latency = watch_latency
+        self._data = {}
+        self._watches = {}   # watch id -> (key, queue, thread)
+        self._ids = iter(range(1, 2**62))
+        self._lock = threading.Lock()
+        self.nput = 0
+        self.nget = 0
+        self.ncallbacks = 0
+
+    @property
+    def watch_ids(self):
+        return list(self._watches)
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def put_dict(self, key, value):
+        """ Set key to value (a dict) and notify watches on key.
+        """
+
+        self._delay(self.latency)
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._data[key] = value
+            self.nput += 1
+            queues = [qq for kk, qq, _ in self._watches.values() if kk == key]
+        for qq in queues:
+            qq.put(copy.deepcopy(value))
+
+    def get_dict(self, key):
+        """ Return value of key or an empty dict if it is not set.
+        """
+
+        self._delay(self.latency)
+        with self._lock:
+            self.nget += 1
+            return copy.deepcopy(self._data.get(key, {}))
+
+    def add_watch(self, key, callback):
+        """ Call callback with the new value each time key is set. Returns a watch id.
+        """
+
+        qq = queue.Queue()
+        thread = threading.Thread(target=self._watch, args=(qq, callback), daemon=True,
+                                  name=f'kvstore-watch {key}')
+        with self._lock:
+            wid = next(self._ids)
+            self._watches[wid] = (key, qq, thread)
+        thread.start()
+
+        return wid
+
+    def _watch(self, qq, callback):
+        while True:
+            value = qq.get()
+            try:
+                if value is _STOP:
+                    return
+                self._delay(self.watch_latency)
+                callback(value)
+                with self._lock:
+                    self.ncallbacks += 1
+            except Exception as exc:
+                logger.warning(f"Watch callback failed: {str(exc)}")
+            finally:
+                qq.task_done()
+
+    def cancel(self, wid):
+        """ Stop a watch. Callbacks already queued are run first.
+        """
+
+        with self._lock:
+            entry = self._watches.pop(wid, None)
+        if entry is not None:
+            entry[1].put(_STOP)
+
+    def join(self):
+        """ Wait until all pending watch callbacks have run.
+        """
+
+        with self._lock:
+            queues = [qq for _, qq, _ in self._watches.values()]
+        for qq in queues:
+            qq.join()
+
+
+def get_store():
+    """ Return the store in use, creating it on first use.
+    """
+
+    global _store
+    with _lock:
+        if _store is None:
+            if os.environ.get('LWA_KVSTORE', '').lower() == 'memory':
+                _store = MemoryStore()
+            else:
+                from dsautils import dsa_store
+                _store = dsa_store.DsaStore()
+        return _store
+
+
+def set_store(store=None):
+    """ Use store for etcd keys (None to create the default on next use). Returns the previous store.
+    """
+
+    global _store
+    with _lock:
+        previous = _store
+        _store = store
+    return previous
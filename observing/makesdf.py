@@ -58,7 +58,7 @@ def create(out_name, sess_id=None, sess_mode=None, beam_num=None, cal_dir='/home
 
     if config_file is None:
         print("No configuration file specified. Assuming the standard path.")
-        config_file = "/home/pipeline/proj/lwa-shell/mnc_python/config/lwa_config_calim.yaml"
+        config_file = classes.DEFAULT_CONFIG_FILE
 
     try:
         session_preamble = make_session_preamble(sess_id, sess_mode, pi_id, pi_name, beam_num, config_file, cal_dir, do_cal)
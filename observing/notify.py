@@ -0,0 +1,236 @@
+""" Notifications to the #observing Slack channel, sent in the background.
+
+notify() only puts a message on a queue, so submission does not wait on (or fail with) Slack.
+A Notifier thread collects messages for a short window and sends them as one post; messages
+of the same kind are coalesced into a summary (e.g., "12 sessions submitted") when there are
+many. Posts are spaced by at least min_interval seconds and retried with backoff, honoring
+Slack's Retry-After. The sink is chosen from the environment: Slack if SLACK_TOKEN_LWA is set,
+else a file if LWA_NOTIFY_FILE is set, else nothing is sent.
+"""
+
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger('observing')
+
+CHANNEL = '#observing'
+#: Seconds messages are collected before they are sent together
+BATCH_INTERVAL = 2.
+#: Least seconds between posts
+MIN_INTERVAL = 1.
+#: Times a post is retried before it is dropped
+MAX_RETRIES = 5
+#: Messages of one kind in a batch above which they are replaced by a summary
+COALESCE_MIN = 4
+#: Most messages waiting to be sent; more are dropped
+MAX_PENDING = 1000
+
+_notifier = None
+_lock = threading.Lock()
+
+
+class NullSink:
+    """ Sink that discards messages.
+    """
+
+    def send(self, text):
+        pass
+
+
+class FileSink:
+    """ Sink that appends messages to a file, for offline use.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, text):
+        with open(self.path, 'a') as fh:
+            fh.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {text}\n")
+
+
+class SlackSink:
+    """ Sink that posts messages to a Slack channel.
+    """
+
+    def __init__(self, token, channel=CHANNEL):
+        from slack_sdk import WebClient
+
+        self.client = WebClient(token=token)
+        self.channel = channel
+
+    def send(self, text):
+        from slack_sdk.errors import SlackApiError
+
+        try:
+            self.client.chat_postMessage(channel=self.channel, text=text, icon_emoji=":robot_face::")
+        except SlackApiError as exc:
+            # let the notifier wait as long as Slack asks to
+            retry_after = exc.response.headers.get('Retry-After') if exc.response is not None else None
+            if retry_after is not None:
+                exc.retry_after = float(retry_after)
+            raise
+
+
+class Notifier:
+    """ Thread that sends queued messages to sink in batches.
+    """
+
+    def __init__(self, sink, interval=BATCH_INTERVAL, min_interval=MIN_INTERVAL, max_retries=MAX_RETRIES,
+                 coalesce_min=COALESCE_MIN, max_pending=MAX_PENDING):
+        self.sink = sink
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_retries = max_retries
+        self.coalesce_min = coalesce_min
+        self.messages = queue.Queue(maxsize=max_pending)
+        self.nsent = 0
+        self.ndropped = 0
+        self._last_send = 0.
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name='notifier')
+                self._thread.start()
+        return self
+
+    def post(self, text, kind=None, summary=None, item=None):
+        """ Queue a message. Messages of the same kind are replaced by summary (formatted with n, the number of
+        messages, and items, a list of their item) when there are many in a batch. Does not block or raise.
+        """
+
+        self.start()
+        try:
+            self.messages.put_nowait((text, kind, summary, item))
+        except queue.Full:
+            self.ndropped += 1
+            logger.warning(f"Too many notifications waiting. Dropping: {text}")
+
+    def stop(self, timeout=10.):
+        """ Send the messages queued so far and stop the thread.
+        """
+
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self.messages.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            message = self.messages.get()
+            if message is None:
+                break
+            batch = [message]
+
+            # collect what arrives in the batch window
+            deadline = time.monotonic() + self.interval
+            while True:
+                try:
+                    message = self.messages.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if message is None:
+                    stopping = True
+                    break
+                batch.append(message)
+
+            self._send(self.format(batch))
+
+    def format(self, batch):
+        """ Return text of one post for a batch of (text, kind, summary, item), coalescing by kind.
+        """
+
+        groups = {}
+        for message in batch:
+            groups.setdefault(message[1] or id(message), []).append(message)
+
+        lines = []
+        for messages in groups.values():
+            summary = messages[0][2]
+            if summary is not None and len(messages) >= self.coalesce_min:
+                items = ', '.join(str(message[3]) for message in messages if message[3] is not None)
+                lines.append(summary.format(n=len(messages), items=items))
+            else:
+                lines.extend(message[0] for message in messages)
+
+        return '\n'.join(lines)
+
+    def _send(self, text):
+        delay = self.min_interval
+        for attempt in range(self.max_retries + 1):
+            wait = self._last_send + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.sink.send(text)
+                self.nsent += 1
+                return True
+            except Exception as exc:
+                delay = max(getattr(exc, 'retry_after', 0), delay)
+                logger.warning(f"Could not send notification (attempt {attempt+1}): {str(exc)}")
+                if attempt < self.max_retries:
+                    time.sleep(delay)
+                    delay *= 2
+            finally:
+                self._last_send = time.monotonic()
+
+        self.ndropped += text.count('\n') + 1
+        logger.warning(f"Dropping notification: {text}")
+        return False
+
+
+def default_sink():
+    """ Return sink chosen from the environment (SLACK_TOKEN_LWA, LWA_NOTIFY_FILE).
+    """
+
+    if "SLACK_TOKEN_LWA" in os.environ:
+        try:
+            return SlackSink(os.environ["SLACK_TOKEN_LWA"])
+        except ImportError:
+            logger.warning("slack_sdk not available. No slack updates.")
+    else:
+        logger.warning("No SLACK_TOKEN_LWA found. No slack updates.")
+
+    if "LWA_NOTIFY_FILE" in os.environ:
+        return FileSink(os.environ["LWA_NOTIFY_FILE"])
+    return NullSink()
+
+
+def get_notifier():
+    """ Return the notifier in use, creating it on first use.
+    """
+
+    global _notifier
+    with _lock:
+        if _notifier is None:
+            _notifier = Notifier(default_sink())
+            atexit.register(_notifier.stop)
+        return _notifier
+
+
+def set_notifier(notifier=None):
+    """ Use notifier for notifications (None to create the default on next use). Returns the previous notifier.
+    """
+
+    global _notifier
+    with _lock:
+        previous = _notifier
+        _notifier = notifier
+    return previous
+
+
+def notify(text, kind=None, summary=None, item=None):
+    """ Send text to the observing channel in the background. See Notifier.post.
+    """
+
+    get_notifier().post(text, kind=kind, summary=summary, item=item)
@@ -1,23 +1,78 @@
 import os
 import getpass
-from astropy.time import Time
+from observing.clock import now_mjd
 from pydantic import BaseModel
 import sqlite3
-from observing import parsesdf
-from slack_sdk import WebClient
+import threading
+from observing import parsesdf, notify
 import logging
 
 logger = logging.getLogger(__name__)
-if "SLACK_TOKEN_LWA" in os.environ:
-    cl = WebClient(token=os.environ["SLACK_TOKEN_LWA"])
-else:
-    cl = None
-    logging.warning("No SLACK_TOKEN_LWA found. No slack updates.")
 
 # TODO: figure out how to make it r/w for all users
 DBPATH = '/opt/devel/pipeline/ovrolwa.db'
 #DBPATH = '/home/pipeline/proj/lwa-shell/lwa-observing/ovrolwa.db'
 
+#: sqlite journal mode set on each connection. WAL lets readers and a writer work at once.
+JOURNAL_MODE = os.environ.get('LWA_OBSSTATE_JOURNAL_MODE', 'WAL')
+#: Seconds to wait for a lock held by another connection before raising "database is locked"
+BUSY_TIMEOUT = 30.
+#: Prepared statements kept per connection
+CACHED_STATEMENTS = 64
+
+_local = threading.local()   # path -> connection, per thread
+
+_TABLES = {
+    'sessions': "(time_loaded float, PI_ID text, PI_NAME text, PROJECT_ID text, SESSION_ID integer, SESSION_MODE text, SESSION_DRX_BEAM text, CONFIG_FILE text, CAL_DIR text, STATUS text)",
+    'settings': "(time_loaded float, user text, filename text)",
+    'calibrations': "(time_loaded float, filename text, beam text)",
+    'pis': "(PI_ID integer, PI_NAME text)",
+    'status_history': "(SESSION_ID integer, STATUS text, time float)",
+}
+
+_INDEXES = {
+    'sessions': ["CREATE INDEX IF NOT EXISTS sessions_session_id ON sessions (SESSION_ID)",
+                 "CREATE INDEX IF NOT EXISTS sessions_time_loaded ON sessions (time_loaded)",
+                 "CREATE INDEX IF NOT EXISTS sessions_status ON sessions (STATUS, time_loaded)"],
+    'settings': ["CREATE INDEX IF NOT EXISTS settings_time_loaded ON settings (time_loaded)"],
+    'calibrations': ["CREATE INDEX IF NOT EXISTS calibrations_time_loaded ON calibrations (time_loaded)"],
+    'pis': ["CREATE INDEX IF NOT EXISTS pis_pi_name ON pis (PI_NAME)"],
+    'status_history': ["CREATE INDEX IF NOT EXISTS status_history_session_id ON status_history (SESSION_ID, time)"],
+}
+
+
+def _create_tables(conn, tables=None):
+    for table in (tables or _TABLES):
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} {_TABLES[table]}")
+
+
+def _create_indexes(conn, tables=None):
+    for table in (tables or _INDEXES):
+        for statement in _INDEXES[table]:
+            conn.execute(statement)
+
+
+def _add_indexes(conn):
+    tables = ['sessions', 'settings', 'calibrations', 'pis']
+    _create_tables(conn, tables=tables)
+    _create_indexes(conn, tables=tables)
+
+
+def _add_status_history(conn):
+    _create_tables(conn, tables=['status_history'])
+    _create_indexes(conn, tables=['status_history'])
+
+
+#: Schema migrations. The database's PRAGMA user_version is the number of migrations applied.
+MIGRATIONS = [
+    _add_indexes,   # 1: indexes for lookups by SESSION_ID, STATUS and PI_NAME and ordering by time_loaded
+    _add_status_history,   # 2: status_history table of every status change
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+#: Rows per page returned by the query_* functions by default
+PAGE_SIZE = 100
+
 class Session(BaseModel):
     time_loaded: float
     PI_ID: str
@@ -50,35 +105,79 @@ class PIs(BaseModel):
     PI_NAME: str
 
 
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+    conn.execute(f"PRAGMA busy_timeout = {int(BUSY_TIMEOUT*1000)}")
+    if JOURNAL_MODE:
+        try:
+            conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        except sqlite3.OperationalError as exc:
+            logger.warning(f"Could not set journal mode {JOURNAL_MODE} for {path}: {str(exc)}")
+    try:
+        migrate(conn)
+    except sqlite3.OperationalError as exc:
+        logger.warning(f"Could not migrate {path} to schema version {SCHEMA_VERSION}: {str(exc)}")
+    return conn
+
+
+def migrate(conn):
+    """Apply schema migrations that the database has not had yet. Returns the schema version."""
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    with conn:
+        for i in range(version, SCHEMA_VERSION):
+            logger.info(f"Migrating obsstate schema to version {i+1}")
+            MIGRATIONS[i](conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    return SCHEMA_VERSION
+
+
 def connection_factory(path=DBPATH):
-    """Create a connection to the database."""
-    return sqlite3.connect(path)
+    """Return a connection to the database.
+    Connections are kept open and reused by the same thread of the same process, so statements stay prepared.
+    As a context manager, the connection commits (or rolls back on error) but is not closed.
+    """
+
+    conns = getattr(_local, 'conns', None)
+    if conns is None or _local.pid != os.getpid():
+        # new thread, or process forked from one that had connections
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = _connect(path)
+    return conn
+
+
+def close_connections():
+    """Close the connections of this thread."""
+
+    conns = getattr(_local, 'conns', None)
+    if conns and _local.pid == os.getpid():
+        for conn in conns.values():
+            conn.close()
+    _local.conns = {}
+    _local.pid = os.getpid()
 
 
 def create_db(path=DBPATH):
     """Create database if it doesn't exist."""
 
     with connection_factory(path=path) as conn:
-        c = conn.cursor()
-        c.executescript('''
-            CREATE TABLE IF NOT EXISTS sessions
-            (time_loaded float, PI_ID text, PI_NAME text, PROJECT_ID text, SESSION_ID integer, SESSION_MODE text, SESSION_DRX_BEAM text, CONFIG_FILE text, CAL_DIR text, STATUS text);
-            
-            CREATE TABLE IF NOT EXISTS settings
-            (time_loaded float, user text, filename text);
-            
-            CREATE TABLE IF NOT EXISTS calibrations
-            (time_loaded float, filename text, beam text);
-                        
-            CREATE TABLE IF NOT EXISTS pis
-            (PI_ID integer, PI_NAME text);
-        ''')
-
-
-def read_sessions():
+        _create_tables(conn)
+        _create_indexes(conn)
+
+
+def read_sessions(path=DBPATH):
     """Read all sessions from the database"""
 
-    with connection_factory() as conn:
+    with connection_factory(path) as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM sessions ORDER BY time_loaded DESC")
         rows = c.fetchall()
@@ -86,10 +185,10 @@ def read_sessions():
     return rows
 
 
-def read_settings():
+def read_settings(path=DBPATH):
     """Read all settings from the database"""
 
-    with connection_factory() as conn:
+    with connection_factory(path) as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM settings ORDER BY time_loaded DESC")
         rows = c.fetchall()
@@ -97,10 +196,10 @@ def read_settings():
     return rows
 
 
-def read_calibrations():
+def read_calibrations(path=DBPATH):
     """Read all calibrations from the database"""
 
-    with connection_factory() as conn:
+    with connection_factory(path) as conn:
         c = conn.cursor()
         c.execute("SELECT * FROM calibrations ORDER BY time_loaded DESC")
         rows = c.fetchall()
@@ -119,21 +218,89 @@ def read_pis():
     return rows
 
 
+def _query_page(table, conditions, params, limit, before, path):
+    """Return a page of rows from table, newest first, and the cursor for the next page (None if there are no more).
+    The cursor is (time_loaded, rowid) of the last row, so pages stay consistent while rows are added.
+    """
+
+    if before is not None:
+        conditions = conditions + ["(time_loaded, rowid) < (?, ?)"]
+        params = params + [float(before[0]), int(before[1])]
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+    with connection_factory(path) as conn:
+        rows = conn.execute(f"SELECT rowid, * FROM {table} {where}ORDER BY time_loaded DESC, rowid DESC LIMIT ?",
+                            params + [int(limit)]).fetchall()
+
+    cursor = (rows[-1][1], rows[-1][0]) if len(rows) == limit else None
+    return [row[1:] for row in rows], cursor
+
+
+def _time_conditions(start, stop):
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("time_loaded >= ?")
+        params.append(float(start))
+    if stop is not None:
+        conditions.append("time_loaded < ?")
+        params.append(float(stop))
+    return conditions, params
+
+
+def query_sessions(start=None, stop=None, status=None, mode=None, pi=None, limit=PAGE_SIZE, before=None,
+                   path=DBPATH):
+    """Return a page of sessions, newest first, and the cursor to pass as before for the next page.
+    start and stop (MJD) select by time_loaded. status is a status or list of them, mode a SESSION_MODE
+    and pi a PI_ID or PI_NAME. Rows have the columns of read_sessions.
+    """
+
+    conditions, params = _time_conditions(start, stop)
+    if status is not None:
+        status = [status] if isinstance(status, str) else list(status)
+        conditions.append(f"STATUS IN ({', '.join('?'*len(status))})")
+        params += status
+    if mode is not None:
+        conditions.append("SESSION_MODE = ?")
+        params.append(str(mode))
+    if pi is not None:
+        conditions.append("(PI_NAME = ? OR PI_ID = ?)")
+        params += [str(pi), str(pi)]
+
+    return _query_page('sessions', conditions, params, limit, before, path)
+
+
+def query_settings(start=None, stop=None, limit=PAGE_SIZE, before=None, path=DBPATH):
+    """Return a page of settings, newest first, and the cursor for the next page (see query_sessions)."""
+
+    conditions, params = _time_conditions(start, stop)
+    return _query_page('settings', conditions, params, limit, before, path)
+
+
+def query_calibrations(start=None, stop=None, beam=None, limit=PAGE_SIZE, before=None, path=DBPATH):
+    """Return a page of calibrations, newest first, and the cursor for the next page (see query_sessions)."""
+
+    conditions, params = _time_conditions(start, stop)
+    if beam is not None:
+        conditions.append("beam = ?")
+        params.append(str(beam))
+    return _query_page('calibrations', conditions, params, limit, before, path)
+
+
 def add_session(sdffile: str):
     """Parse SDF to create and add new session to the database."""
 
     assert os.path.exists(sdffile), f"{sdffile} does not exist"
-    dd = parsesdf.sdf_to_dict(sdffile)
-    now = Time.now().mjd
-    if 'CAL_DIR' not in dd['SESSION']:
-        dd['SESSION']['CAL_DIR'] = ''
+    fields = dict(parsesdf.sdf_to_dict(sdffile)['SESSION'])   # the parsed SDF is shared, so change a copy
+    now = now_mjd()
+    if 'CAL_DIR' not in fields:
+        fields['CAL_DIR'] = ''
 
     # convert lists to comma-separated strings
-    for key, value in dd['SESSION'].items():
+    for key, value in fields.items():
         if isinstance(value, list):
-            dd['SESSION'][key] = ', '.join(map(str, value))
+            fields[key] = ', '.join(map(str, value))
 
-    session = Session(**dd['SESSION'], time_loaded=float(now), STATUS='scheduled')
+    session = Session(**fields, time_loaded=float(now), STATUS='scheduled')
 
     with connection_factory() as conn:
         c = conn.cursor()
@@ -148,11 +315,11 @@ def add_session(sdffile: str):
                   (session.time_loaded, session.PI_ID, session.PI_NAME, session.PROJECT_ID, session.SESSION_ID,
                    session.SESSION_MODE, session.SESSION_DRX_BEAM, session.CONFIG_FILE, session.CAL_DIR,
                    session.STATUS))
+        c.execute("INSERT INTO status_history VALUES (?, ?, ?)",
+                  (session.SESSION_ID, session.STATUS, session.time_loaded))
 
-    if cl is not None:
-        response = cl.chat_postMessage(channel="#observing",
-                                       text=f"Session {session.SESSION_ID} submitted for {session.PI_NAME} for mode {session.SESSION_MODE}",
-                                       icon_emoji = ":robot_face::")
+    notify.notify(f"Session {session.SESSION_ID} submitted for {session.PI_NAME} for mode {session.SESSION_MODE}",
+                  kind='session', summary="{n} sessions submitted: {items}", item=session.SESSION_ID)
 
 
 def add_settings(filename: str):
@@ -166,24 +333,21 @@ def add_settings(filename: str):
 
     assert os.path.exists(filename), f"{filename} does not exist"
     user = getpass.getuser()
-    time_loaded = Time.now().mjd
+    time_loaded = now_mjd()
 
     with connection_factory() as conn:
         c = conn.cursor()
         c.execute("INSERT INTO settings VALUES (?, ?, ?)",
                   (time_loaded, str(user), os.path.basename(filename)))
 
-    if cl is not None:
-        response = cl.chat_postMessage(channel="#observing",
-                                       text=f"Settings updated by {user} with file {filename}",
-                                       icon_emoji = ":robot_face::")
+    notify.notify(f"Settings updated by {user} with file {filename}")
 
 
 def add_calibrations(filename, beam):
     """Add a new calibration to the calibrations table."""
 
 
-    now = Time.now().mjd
+    now = now_mjd()
     with connection_factory() as conn:
         c = conn.cursor()
         c.execute("INSERT INTO calibrations (time_loaded, filename, beam) VALUES (?, ?, ?)", (float(now), str(filename), str(beam)))
@@ -206,8 +370,8 @@ def read_latest_setting():
     """
 
     with connection_factory() as conn:
-        conn.row_factory = sqlite3.Row  # This enables column access by name: row['column_name'] 
         c = conn.cursor()
+        c.row_factory = sqlite3.Row  # This enables column access by name: row['column_name'] 
         c.execute("SELECT * FROM settings ORDER BY time_loaded DESC LIMIT 1")
         row = c.fetchone()
 
@@ -215,11 +379,61 @@ def read_latest_setting():
     return dict(row) if row else None
 
 
-def update_session(session_id, status):
-    """ Update a status of a session in the database. """
+def read_session_status(session_ids=None):
+    """ Return dict of SESSION_ID to STATUS for all sessions or those in session_ids. """
+
     with connection_factory() as conn:
         c = conn.cursor()
-        c.execute("UPDATE sessions SET status = ? WHERE SESSION_ID = ?", (status, session_id))
+        if session_ids is None:
+            c.execute("SELECT SESSION_ID, STATUS FROM sessions")
+        else:
+            session_ids = [int(sid) for sid in session_ids]
+            c.execute(f"SELECT SESSION_ID, STATUS FROM sessions WHERE SESSION_ID IN ({', '.join('?'*len(session_ids))})",
+                      session_ids)
+        rows = c.fetchall()
+
+    return {int(sid): status for sid, status in rows}
+
+
+def update_session(session_id, status, mjd=None):
+    """ Update a status of a session in the database and record the change at mjd (default now). """
+
+    write_status([(session_id, status, now_mjd() if mjd is None else mjd)])
+
+
+def write_status(events, path=DBPATH):
+    """ Apply status changes, a list of (session_id, status, mjd) in order, in one transaction.
+    All changes are kept in status_history, but a change older than the latest one recorded for its session does
+    not set the session status (e.g., 'observing' arriving after the worker's 'completed').
+    """
+
+    events = [(int(sid), str(status), float(mjd)) for sid, status, mjd in events]
+    with connection_factory(path) as conn:
+        for sid, status, mjd in events:
+            conn.execute("UPDATE sessions SET STATUS = ? WHERE SESSION_ID = ? AND ? >= "
+                         "COALESCE((SELECT MAX(time) FROM status_history WHERE SESSION_ID = ?), ?)",
+                         (status, sid, mjd, sid, mjd))
+            conn.execute("INSERT INTO status_history VALUES (?, ?, ?)", (sid, status, mjd))
+
+
+def read_status_history(session_ids=None, path=DBPATH):
+    """ Return dict of SESSION_ID to list of (STATUS, mjd) in time order, for all sessions or those in session_ids.
+    Differences between the times give, e.g., dispatch ('scheduled' to 'observing') and run time ('observing' to
+    'completed').
+    """
+
+    with connection_factory(path) as conn:
+        if session_ids is None:
+            rows = conn.execute("SELECT SESSION_ID, STATUS, time FROM status_history ORDER BY time").fetchall()
+        else:
+            session_ids = [int(sid) for sid in session_ids]
+            rows = conn.execute(f"SELECT SESSION_ID, STATUS, time FROM status_history WHERE SESSION_ID IN "
+                                f"({', '.join('?'*len(session_ids))}) ORDER BY time", session_ids).fetchall()
+
+    history = {}
+    for sid, status, mjd in rows:
+        history.setdefault(int(sid), []).append((status, mjd))
+    return history
 
 
 def iterate_max_session_id():
@@ -263,28 +477,11 @@ def check_and_create_pi(pi_name):
 def reset_table(table):
     """Reset the sessions table."""
 
+    if table not in _TABLES:
+        raise ValueError(f"{table} is not a valid table name")
+
     with connection_factory() as conn:
         c = conn.cursor()
         c.execute(f"DROP TABLE IF EXISTS {table}")
-        if table == 'sessions':
-            c.execute('''
-                CREATE TABLE sessions
-                (time_loaded float, PI_ID text, PI_NAME text, PROJECT_ID text, SESSION_ID integer, SESSION_MODE text, SESSION_DRX_BEAM text, CONFIG_FILE text, CAL_DIR text, STATUS text)
-            ''')
-        elif table == 'settings':
-            c.execute('''
-                CREATE TABLE settings
-                (time_loaded float, user text, filename text)
-            ''')
-        elif table == 'calibrations':
-            c.execute('''
-                CREATE TABLE calibrations
-                (time_loaded float, filename text, beam text)
-            ''')
-        elif table == 'pis':
-            c.execute('''
-                CREATE TABLE pis
-                (PI_ID integer, PI_NAME text)
-            ''')
-        else:
-            raise ValueError(f"{table} is not a valid table name")
+        c.execute(f"CREATE TABLE {table} {_TABLES[table]}")
+        _create_indexes(conn, tables=[table])
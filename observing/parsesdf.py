@@ -1,28 +1,35 @@
 import pandas as pd
 from observing.classes import ObsType, Session, Observation
+from observing import sdfcache, commands
 from astropy.time import Time
 import logging
 
 logger = logging.getLogger('observing')
 
+#: Time (s) allowed to get a Controller in buffer mode when workers already hold one for the config file
+WARM_CONTROLLER_BUFFER = 2
 
-def make_sched(sdf_fn, mode='buffer'):
+
+def make_sched(sdf_fn, mode='buffer', warm_configs=()):
     """ Use SDF to create a schedule dataframe.
     mode can be 'buffer' (sets up before running at scheduled time) or 'asap' (runs sequence of commands immediately)
+    warm_configs lists config files for which execution workers already hold a Controller (see workers.warm_configs).
+    Commands are compiled (see observing.commands), so a command that does not compile raises SyntaxError here.
     """
 
-    d = sdf_to_dict(sdf_fn)
-    session, obs_list = make_obs_list(d)
+    session, obs_list = read_obs_list(sdf_fn)
+    warm = session.config_file in warm_configs
 
     if session.obs_type is ObsType.power:
-        sched = power_beam_obs(obs_list, session, mode=mode)
+        sched = power_beam_obs(obs_list, session, mode=mode, warm=warm)
     if session.obs_type in [ObsType.volt, ObsType.voltraw]:
-        sched = volt_beam_obs(obs_list, session, mode=mode)
+        sched = volt_beam_obs(obs_list, session, mode=mode, warm=warm)
     if session.obs_type is ObsType.fast:
         sched = fast_vis_obs(obs_list, session, mode=mode)
     if session.obs_type is ObsType.slow:
         sched = slow_vis_obs(obs_list, session, mode=mode)
 
+    commands.compile_frame(sched)
     logger.info(f"Parsed {sdf_fn} into {len(sched)} commands.")
 
     return sched
@@ -42,6 +49,12 @@ def make_command(mjd, command):
         return None
 
     assert isinstance(mjd, float)
+
+    try:
+        command = commands.compile_command(command)
+    except SyntaxError as exc:
+        print(f"Command does not compile: {str(exc)}")
+        return None
     
     d = {mjd: command}
     df = pd.DataFrame(d, index = ['command'])
@@ -52,25 +65,48 @@ def make_command(mjd, command):
 
 def sdf_to_dict(filename:str):
     """
-    
+    Parsed dictionaries are shared through the SDF cache, so repeat calls for an unchanged file
+    only cost a stat call. Copy the dictionary before changing it.
+
     :param filename: name of the sdf file
     :type filename: str
     :return: Dictionary of session
     :rtype: dict
 
     """
+
+    return sdfcache.get_cache().get(filename, 'dict', _text_to_dict)
+
+
+def read_obs_list(filename:str):
+    """
+    :param filename: name of the sdf file
+    :type filename: str
+    :return: Objects of the session and associated observations, cached (and shared) like sdf_to_dict()
+    :rtype: Session object, list of Observation objects
+
+    """
+
+    session, obs_list = sdfcache.get_cache().get(filename, 'obs_list',
+                                                 lambda text: make_obs_list(_text_to_dict(text)))
+    session.validate()   # e.g., the calibration directory may have gone since the SDF was parsed
+    return session, obs_list
+
+
+def _text_to_dict(text:str):
+    """ Parse the text of an SDF into a dictionary of session and observations
+    """
+
     # Start a dictionary
     d = {'SESSION':{},'OBSERVATIONS':{}}
     
-    # Open file and read lines
-    lines = open(filename).readlines()
+    # Split text into lines
+    lines = text.splitlines()
     
     # Assert that each session has at least one observation
     n_obs = 1
     d['OBSERVATIONS']['OBSERVATION_'+str(n_obs)] = {}
     for l in lines:
-        l = l.strip('\n')
-        
         # skip empty lines:
         if len(l) != 0:
             # Assume first word of the line is a key and the rest is information pertaining to that key:
@@ -196,12 +232,12 @@ def fast_vis_obs(obs_list, session, mode="buffer"):
 
     start = obs_list[0].obs_start
     ts = start - startbuffer/3600/24  # do the control command  before the start of the first observation
-    cmd = f"from mnc import control"
+    cmd = f"from observing import controllers"
     d = {ts:cmd}
 
 
     ts += 3/(24*3600)
-    cmd = f"con = control.Controller('{session.config_file}')"
+    cmd = f"con = controllers.get_controller('{session.config_file}')"
     d.update({ts:cmd})
 
     # handy name 
@@ -237,11 +273,11 @@ def slow_vis_obs(obs_list, session, mode="buffer"):
 
     start = obs_list[0].obs_start
     ts = start - startbuffer/3600/24  # do the control command  before the start of the first observation
-    cmd = f"from mnc import control"
+    cmd = f"from observing import controllers"
     d = {ts:cmd}
 
     ts += 0.5/(24*3600)
-    cmd = f"con = control.Controller('{session.config_file}')"
+    cmd = f"con = controllers.get_controller('{session.config_file}')"
     d.update({ts:cmd})
 
     # handy name 
@@ -266,8 +302,9 @@ def slow_vis_obs(obs_list, session, mode="buffer"):
     return df
 
 
-def power_beam_obs(obs_list, session, mode='buffer'):
+def power_beam_obs(obs_list, session, mode='buffer', warm=False):
     """ Generate dataframe for power beam observing mode
+    If warm, the controller buffer is shortened since the worker already holds a Controller.
     """
 
     if mode == 'buffer':
@@ -283,6 +320,9 @@ def power_beam_obs(obs_list, session, mode='buffer'):
         pointing_buffer = 1
         recording_buffer = 1
 
+    if warm:
+        controller_buffer = min(controller_buffer, WARM_CONTROLLER_BUFFER)
+
     calibratebeams = session.cal_directory is not None and session.do_cal
 
     if calibratebeams or session.do_cal:
@@ -300,11 +340,11 @@ def power_beam_obs(obs_list, session, mode='buffer'):
 
     t0 = obs_list[0].obs_start
     ts = t0 - dt
-    cmd = f"from mnc import control"
+    cmd = f"from observing import controllers"
     d = {ts:cmd}
 
     ts += 0.5/(24*3600)
-    cmd = f"con = control.Controller('{session.config_file}')"
+    cmd = f"con = controllers.get_controller('{session.config_file}')"
     d.update({ts:cmd})
     # okay. originally, I was trying to avoid having two commands have the same timestamp to avoid confusing 
     # the scheduler. I'm deciding that should not be the perogative of the parser.
@@ -361,8 +401,9 @@ def power_beam_obs(obs_list, session, mode='buffer'):
     return df
 
 
-def volt_beam_obs(obs_list, session, mode='buffer'):
+def volt_beam_obs(obs_list, session, mode='buffer', warm=False):
     """ Generate dataframe for volteage beam observing mode
+    If warm, the controller buffer is shortened since the worker already holds a Controller.
     """
 
     if mode == 'buffer':
@@ -378,6 +419,9 @@ def volt_beam_obs(obs_list, session, mode='buffer'):
         pointing_buffer = 1
         recording_buffer = 1
 
+    if warm:
+        controller_buffer = min(controller_buffer, WARM_CONTROLLER_BUFFER)
+
     calibratebeams = session.cal_directory is not None and session.do_cal
 
     if calibratebeams or session.do_cal:
@@ -400,11 +444,11 @@ def volt_beam_obs(obs_list, session, mode='buffer'):
 
     t0 = obs_list[0].obs_start
     ts = t0 - dt
-    cmd = f"from mnc import control"
+    cmd = f"from observing import controllers"
     d = {ts:cmd}
 
     ts += 0.5/(24*3600)
-    cmd = f"con = control.Controller('{session.config_file}')"
+    cmd = f"con = controllers.get_controller('{session.config_file}')"
     d.update({ts:cmd})
     # okay. originally, I was trying to avoid having two commands have the same timestamp to avoid confusing 
     # the scheduler. I'm deciding that should not be the perogative of the parser.
@@ -0,0 +1,165 @@
+""" Precomputed beam pointing tables.
+
+When run_sdf starts, the tracking updates (see observing.tracking) for each of its
+observations are computed by a background thread (submit). This overlaps with the wait for
+the recording time. The future returns the tables as {obs_id: steps}, so no ephemeris or
+coordinate work is left on the critical path before the first observation. Unless disabled
+(e.g., for dry runs and simulations), the tables are also stored as JSON in
+POINTING_DIR/<session_mode_name>/<obs_id>.json, along with the observation parameters they
+were computed for, and can be read back with load(). Executor sessions point through mnc's
+control_bf, which computes its own pointings, so the executor does not compute tables.
+"""
+
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import astropy.units as u
+from astropy.coordinates import EarthLocation
+from observing import parsesdf, tracking
+
+logger = logging.getLogger('observing')
+
+POINTING_DIR = os.environ.get('LWA_POINTING_DIR', '/opt/devel/pipeline/pointing')
+
+#: Days after which stored tables are removed
+POINTING_TTL = 7.
+
+#: OBS_MODE values that track a solar system body
+BODY_MODES = {'TRK_SOL': 'sun', 'TRK_JOV': 'jupiter', 'TRK_LUN': 'moon'}
+
+# parameters that define a table, as in the observation dictionaries of run_sdf
+_KEYS = ('mjd', 'mpm', 'dur', 'azalt', 'ra', 'dec')
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_site():
+    """ Return the EarthLocation of OVRO-LWA.
+    """
+
+    from lwa_antpos.station import ovro
+
+    return EarthLocation.from_geocentric(*ovro.ecef, unit=u.m)
+
+
+def tracking_obs(sdf_entry):
+    """ Return {obs_id: observation dictionary} for observations in a parsed SDF (parsesdf.sdf_to_dict) that track
+    RA/dec or a solar system body. Observation dictionaries have the keys used by tracking.get_tracking_updates.
+    """
+
+    obs = {}
+    for oo in sdf_entry['OBSERVATIONS'].values():
+        if 'OBS_START_MJD' not in oo or 'OBS_START_MPM' not in oo:
+            continue
+
+        mode = oo.get('OBS_MODE')
+        if mode in BODY_MODES:
+            ra, dec = BODY_MODES[mode], None
+        elif mode == 'TRK_RADEC' and 'OBS_RA' in oo and 'OBS_DEC' in oo:
+            ra, dec = float(oo['OBS_RA']), float(oo['OBS_DEC'])
+        else:
+            continue
+
+        obs[int(oo['OBS_ID'])] = {'mjd': int(oo['OBS_START_MJD']), 'mpm': int(oo['OBS_START_MPM']),
+                                  'dur': int(oo['OBS_DUR']), 'azalt': False, 'ra': ra, 'dec': dec}
+
+    return obs
+
+
+def _filename(session_mode_name, obs_id, pointing_dir=None):
+    return os.path.join(pointing_dir or POINTING_DIR, session_mode_name, f"{obs_id}.json")
+
+
+def save(session_mode_name, obs_id, obs, steps, pointing_dir=None):
+    fn = _filename(session_mode_name, obs_id, pointing_dir=pointing_dir)
+    os.makedirs(os.path.dirname(fn), exist_ok=True)
+    tmp = f"{fn}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump({'obs': {key: obs[key] for key in _KEYS}, 'steps': steps}, fh)
+    os.replace(tmp, fn)
+
+
+def load(session_mode_name, obs_id, obs=None, pointing_dir=None):
+    """ Return stored tracking updates for an observation or None if there are none.
+    If obs (observation dictionary) is given, the table is only returned if it was computed for the same parameters.
+    """
+
+    try:
+        with open(_filename(session_mode_name, obs_id, pointing_dir=pointing_dir)) as fh:
+            dd = json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+    if obs is not None and any(dd['obs'][key] != obs.get(key) for key in _KEYS):
+        logger.warning(f"Stored pointing for {session_mode_name} observation {obs_id} does not match. Ignoring it.")
+        return None
+
+    return dd['steps']
+
+
+def prune(max_age=POINTING_TTL, pointing_dir=None):
+    """ Remove stored sessions older than max_age days.
+    """
+
+    pointing_dir = pointing_dir or POINTING_DIR
+    try:
+        names = os.listdir(pointing_dir)
+    except OSError:
+        return
+
+    for name in names:
+        path = os.path.join(pointing_dir, name)
+        try:
+            if time.time() - os.path.getmtime(path) > max_age*24*3600:
+                shutil.rmtree(path)
+        except OSError as exc:
+            logger.warning(f"Could not remove pointing tables in {path}: {str(exc)}")
+
+
+def precompute(filename, session_mode_name, site=None, pointing_dir=None, store=True):
+    """ Compute tracking updates for all tracking observations in an SDF. Returns {obs_id: steps}.
+    If store is True, the tables are also saved (see load). A table that cannot be saved is only logged.
+    """
+
+    t0 = time.time()
+    site = site if site is not None else get_site()
+    tables = {}
+    for obs_id, oo in tracking_obs(parsesdf.sdf_to_dict(filename)).items():
+        tables[obs_id] = tracking.get_tracking_updates(oo, site)
+        if store:
+            try:
+                save(session_mode_name, obs_id, oo, tables[obs_id], pointing_dir=pointing_dir)
+            except OSError as exc:
+                logger.warning(f"Could not store pointing table for {session_mode_name} observation {obs_id}: "
+                               f"{str(exc)}")
+    logger.info(f"Computed {len(tables)} pointing tables for {session_mode_name} in {time.time()-t0:.3f} s")
+    if store:
+        prune(pointing_dir=pointing_dir)
+
+    return tables
+
+
+def _done(fut):
+    exc = fut.exception()
+    if exc is not None:
+        logger.warning(f"Could not compute pointing tables: {str(exc)}")
+
+
+def submit(filename, session_mode_name, **kwargs):
+    """ Compute pointing tables for an SDF in a background thread (see precompute). Returns a future of
+    {obs_id: steps}.
+    """
+
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+
+    fut = _executor.submit(precompute, filename, session_mode_name, **kwargs)
+    fut.add_done_callback(_done)
+    return fut
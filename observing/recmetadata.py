@@ -10,8 +10,8 @@ import json
 import logging
 import os
 
-from astropy.time import Time
-from dsautils import dsa_store
+from observing.clock import now_mjd
+from observing.kvstore import get_store
 
 logger = logging.getLogger(__name__)
 
@@ -44,17 +44,21 @@ def build_metadata(sdf_entry, obs_id):
         "session_mode_name": session_mode_name_from_session(session),
         "session": session,
         "observation": find_observation(sdf_entry, obs_id),
-        "written_at_mjd": Time.now().mjd,
+        "written_at_mjd": now_mjd(),
     }
 
 
 def metadata_from_etcd(session_mode_name, obs_id):
-    """Load observation metadata from /mon/observing/sdfdict in etcd."""
-    ls = dsa_store.DsaStore()
-    sdfdict = ls.get_dict("/mon/observing/sdfdict") or {}
-    if session_mode_name not in sdfdict:
+    """Load observation metadata from /mon/observing/sdfdict/<session_mode_name> in etcd."""
+    ls = get_store()
+    sdf_entry = ls.get_dict(f"/mon/observing/sdfdict/{session_mode_name}")
+    if not sdf_entry:
+        # entries written before per-session keys were stored whole in the index
+        legacy = (ls.get_dict("/mon/observing/sdfdict") or {}).get(session_mode_name)
+        sdf_entry = legacy if isinstance(legacy, dict) else None
+    if not sdf_entry:
         raise KeyError(f"{session_mode_name} not found in /mon/observing/sdfdict")
-    return build_metadata(sdfdict[session_mode_name], obs_id)
+    return build_metadata(sdf_entry, obs_id)
 
 
 def write_sidecar(data_path: str, metadata: dict) -> str:
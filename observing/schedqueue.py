@@ -0,0 +1,182 @@
+""" Heap-backed schedule of sessions for the executor.
+
+Sessions are kept as per-session command DataFrames (as made by parsesdf) and ordered by the
+time of their first command in a heap. Insert, cancel-by-session and pop-next are O(log n);
+cancelled sessions are dropped lazily when they reach the top of the heap.
+A combined DataFrame is only built on request for display.
+A dispatcher can sleep in wait() until the next start time and is woken early when a session
+is added ahead of it.
+"""
+
+import heapq
+import itertools
+import threading
+import logging
+from pandas import concat, DataFrame
+
+logger = logging.getLogger('observing')
+
+
+class ScheduleQueue:
+    """ Schedule of sessions keyed by session_id and ordered by start time.
+    len() is the number of commands, as for the schedule DataFrame it replaces.
+    version is incremented by every change, so callers can tell when to republish.
+    """
+
+    def __init__(self, sched=None):
+        self._heap = []   # (start mjd, sequence number, session_id)
+        self._sessions = {}   # session_id -> (start mjd, rows)
+        self._counter = itertools.count()
+        self._ncommands = 0
+        self.version = 0
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        if sched is not None and len(sched):
+            self.add(sched)
+
+    def __len__(self):
+        return self._ncommands
+
+    def __contains__(self, session_id):
+        return str(session_id) in self._sessions
+
+    @property
+    def nsessions(self):
+        return len(self._sessions)
+
+    def session_ids(self):
+        """ Return session_ids in order of start time.
+        """
+
+        with self._lock:
+            return [sid for sid, _ in sorted(self._sessions.items(), key=lambda kv: kv[1][0])]
+
+    def get(self, session_id):
+        """ Return the command rows of a session or None.
+        """
+
+        entry = self._sessions.get(str(session_id))
+        return entry[1] if entry is not None else None
+
+    def add(self, sched):
+        """ Add rows of one or more sessions. Rows for a session_id that is already queued are merged.
+        """
+
+        with self._lock:
+            for session_id, rows in sched.groupby('session_id', sort=False):
+                session_id = str(session_id)
+                old = self._sessions.get(session_id)
+                if old is not None:
+                    self._ncommands -= len(old[1])
+                    rows = concat([old[1], rows])
+                rows = rows.sort_index()
+                start = rows.index[0]
+                nxt = self.peek()
+                self._sessions[session_id] = (start, rows)
+                self._ncommands += len(rows)
+                self.version += 1
+                heapq.heappush(self._heap, (start, next(self._counter), session_id))
+                if nxt is None or start < nxt[0]:
+                    self._wakeup.set()
+
+    def cancel(self, session_id):
+        """ Remove a session. Returns its rows or None if it is not queued.
+        """
+
+        with self._lock:
+            entry = self._sessions.pop(str(session_id), None)
+            if entry is None:
+                return None
+            self._ncommands -= len(entry[1])
+            self.version += 1
+            return entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._sessions.clear()
+            self._ncommands = 0
+            self.version += 1
+        self._wakeup.set()
+
+    def wait(self, timeout=None):
+        """ Sleep up to timeout seconds or until a session is added ahead of the next one.
+        Returns True if woken early. Callers should peek() again afterwards.
+        """
+
+        woken = self._wakeup.wait(timeout)
+        self._wakeup.clear()
+        return woken
+
+    def _discard_stale(self):
+        while self._heap:
+            start, _, session_id = self._heap[0]
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry[0] == start:
+                return
+            heapq.heappop(self._heap)
+
+    def peek(self):
+        """ Return (start mjd, session_id) of the next session or None if empty.
+        """
+
+        with self._lock:
+            self._discard_stale()
+            if not self._heap:
+                return None
+            start, _, session_id = self._heap[0]
+            return start, session_id
+
+    def pop_next(self):
+        """ Remove and return rows of the next session or None if empty.
+        """
+
+        with self._lock:
+            nxt = self.peek()
+            if nxt is None:
+                return None
+            heapq.heappop(self._heap)
+            return self.cancel(nxt[1])
+
+    def pop_due(self, mjd):
+        """ Remove and return rows of all sessions starting at or before mjd, in order of start time.
+        """
+
+        due = []
+        with self._lock:
+            while True:
+                nxt = self.peek()
+                if nxt is None or nxt[0] > mjd:
+                    break
+                due.append(self.pop_next())
+        return due
+
+    def next_session_id(self):
+        """ Return an integer session_id larger than any queued numeric session_id.
+        """
+
+        with self._lock:
+            ids = [int(sid) for sid in self._sessions if sid.isdigit()]
+        return max(ids) + 1 if ids else 1
+
+    def to_dict(self):
+        """ Return time range per session_mode_name per mode, as schedule.create_dict does.
+        """
+
+        dd = {}
+        with self._lock:
+            for start, rows in self._sessions.values():
+                session_mode_name = rows.session_mode_name.iloc[0]
+                mode = session_mode_name.split('_')[1]
+                dd.setdefault(mode, {})[session_mode_name] = [rows.index[0], rows.index[-1]]
+        return dd
+
+    def to_frame(self):
+        """ Return the whole schedule as a DataFrame sorted by time (for display).
+        """
+
+        with self._lock:
+            frames = [rows for _, rows in self._sessions.values()]
+        if not frames:
+            return DataFrame([])
+        return concat(frames).sort_index()
@@ -1,12 +1,21 @@
-from time import sleep
 from pandas import concat, DataFrame
-from astropy import time
 import logging
-from dsautils import dsa_store
-from observing import obsstate, parsesdf
+from observing import obsstate, parsesdf, conflicts, timing, commands, statusqueue
+from observing.clock import get_clock
+from observing.kvstore import get_store
+from observing.schedqueue import ScheduleQueue
 
 logger = logging.getLogger('observing')
-ls = dsa_store.DsaStore()
+
+#: Sessions are submitted to the pool this long (in days) before their first command
+SUBMIT_LEAD = 2/(24*3600)
+
+#: etcd key prefixes for the schedule (per mode) and parsed SDFs (per session)
+SCHEDULE_KEY = '/mon/observing/schedule'
+SDFDICT_KEY = '/mon/observing/sdfdict'
+
+#: Days that a parsed SDF is kept in etcd after submission
+SDFDICT_TTL = 7.
 
 
 def create_dict(sched):
@@ -16,33 +25,99 @@ def create_dict(sched):
     sched.sort_index(inplace=True)
     dd = {}
     if len(sched.columns) > 1:
-        for ss in set(sched.session_mode_name):
+        for ss, rows in sched.groupby('session_mode_name'):
             session, mode = ss.split("_")
             if mode not in dd:
                 dd[mode] = {}
-            times = sched[sched.session_mode_name == ss].index    
+            times = rows.index
             dd[mode][ss] = [times.min(), times.max()]   # time range per session_mode_name per mode
 
     return dd
 
 
+class SchedulePublisher:
+    """ Publishes the schedule to etcd as one key per mode, /mon/observing/schedule/<mode>.
+    The index key /mon/observing/schedule maps each mode in the schedule to its number of sessions.
+    update() may be called many times per tick; flush() writes only the modes that changed since the last flush.
+    """
+
+    def __init__(self):
+        self._published = {}
+        self._index = None
+        self._pending = None
+
+    def update(self, sched):
+        """ Set schedule (DataFrame, ScheduleQueue or dict from create_dict) to publish at the next flush.
+        """
+
+        if isinstance(sched, ScheduleQueue):
+            self._pending = sched.to_dict()
+        elif isinstance(sched, dict):
+            self._pending = sched
+        else:
+            self._pending = create_dict(sched)
+
+    def flush(self):
+        """ Write pending changes to etcd. Returns the number of keys written.
+        """
+
+        if self._pending is None:
+            return 0
+
+        sched_dict, self._pending = self._pending, None
+        nput = 0
+        for mode in set(sched_dict) | set(self._published):
+            sessions = sched_dict.get(mode, {})
+            if sessions != self._published.get(mode):
+                get_store().put_dict(f'{SCHEDULE_KEY}/{mode}', sessions)
+                nput += 1
+
+        index = {mode: len(sessions) for mode, sessions in sched_dict.items() if sessions}
+        if index != self._index:
+            get_store().put_dict(SCHEDULE_KEY, index)
+            self._index = index
+            nput += 1
+
+        self._published = sched_dict
+        return nput
+
+
+_publisher = SchedulePublisher()
+
+
 def put_sched(sched=None):
-    """ Takes schedule dataframe and sets schedule in etcd
+    """ Takes schedule dataframe or ScheduleQueue and sets schedule in etcd
     If no schedule provided, etcd key is reset.
+    Only modes that changed since the last call in this process are written.
     """
     
-    if sched is not None:
-        sched_dict = create_dict(sched)
-    else:
+    if sched is None:
         logger.info("Resetting submitted/scheduled info in etcd")
-        sched_dict = {}
-        ls.put_dict('/mon/observing/submitted', {})
-    ls.put_dict('/mon/observing/schedule', sched_dict)
+        get_store().put_dict('/mon/observing/submitted', {})
+        sched = {}
+    _publisher.update(sched)
+    _publisher.flush()
+
+
+def get_sdf_entry(session_mode_name):
+    """ Get parsed SDF dict for a session from etcd or None if it is not (or no longer) there.
+    """
+
+    dd = get_store().get_dict(f'{SDFDICT_KEY}/{session_mode_name}')
+    if not dd:
+        # entries written before per-session keys were stored whole in the index
+        legacy = (get_store().get_dict(SDFDICT_KEY) or {}).get(session_mode_name)
+        dd = legacy if isinstance(legacy, dict) else None
+
+    return dd
 
 
 def put_dict(filename, limit=10):
     """ Parses SDF and puts dict in etcd for later retrieval by data recorders
+    Each session is written to its own key, /mon/observing/sdfdict/<session_mode_name>.
+    The index key /mon/observing/sdfdict maps session_mode_name to the MJD at which it expires (SDFDICT_TTL).
     limit defines the number of sessions in a given mode-beam that should be retained in sdfdict.
+    Expired or surplus sessions are removed from the index and their keys emptied.
     """
 
     dd = parsesdf.sdf_to_dict(filename)
@@ -50,82 +125,85 @@ def put_dict(filename, limit=10):
     if 'SESSION_DRX_BEAM' in dd['SESSION']:
         session_mode_name += dd['SESSION']['SESSION_DRX_BEAM']
 
-    dd0 = ls.get_dict('/mon/observing/sdfdict')
+    now = get_clock().mjd()
+    get_store().put_dict(f'{SDFDICT_KEY}/{session_mode_name}', dd)
+
+    index = get_store().get_dict(SDFDICT_KEY) or {}
+    for key, value in index.items():
+        if isinstance(value, dict):
+            # move entry from legacy whole-dict format to its own key
+            get_store().put_dict(f'{SDFDICT_KEY}/{key}', value)
+            index[key] = now + SDFDICT_TTL
+    index[session_mode_name] = now + SDFDICT_TTL
 
     # clear out old entries
-    mode_set = set([key.split('_')[1] for key in dd0])  # all unique modes used
-    sortid = sorted(dd0.keys(), reverse=True, key=lambda x: int(x.split('_')[0]))  # sort by session_id
-    keep = []
-    limit = 10
-    for mode in mode_set:
-        i = 0
-        for Id in sortid:
-            if mode in Id:
-                i+=1
-                keep.append(Id)
-                if i > limit:
-                    break
-    if len(dd0) < len(keep):
-        logger.info(f'sdfdict reduced from {len(dd0)} to {len(keep)}.')
-        
-    dd0 = {k:v for k, v in dd0.items() if k in keep}
-    
-    if dd0 is None:
-        dd0 = {}
-    dd0.update({session_mode_name: dd})
-    ls.put_dict('/mon/observing/sdfdict', dd0)
+    keep = {}
+    counts = {}
+    sortid = sorted(index.keys(), reverse=True, key=lambda x: int(x.split('_')[0]))  # sort by session_id
+    for key in sortid:
+        mode = key.split('_')[1]
+        if index[key] > now and counts.get(mode, 0) < limit:
+            keep[key] = index[key]
+            counts[mode] = counts.get(mode, 0) + 1
+        else:
+            get_store().put_dict(f'{SDFDICT_KEY}/{key}', {})
+    if len(keep) < len(index):
+        logger.info(f'sdfdict reduced from {len(index)} to {len(keep)}.')
+
+    get_store().put_dict(SDFDICT_KEY, keep)
 
                 
-def put_submitted(rows):
-    """ Takes submitted rows and sets values in etcd
+def put_submitted(*rows_list):
+    """ Takes rows of one or more submitted sessions and sets values in etcd
     """
 
     dd = {}
-    times = rows.index
-    session_mode_name = rows.iloc[0].session_mode_name
-    mode = session_mode_name.split('_')[1]
-    dd[mode] = {session_mode_name: [times.min(), times.max()]}   # time range per session_mode_name per mode
+    for rows in rows_list:
+        times = rows.index
+        session_mode_name = rows.iloc[0].session_mode_name
+        mode = session_mode_name.split('_')[1]
+        dd.setdefault(mode, {})[session_mode_name] = [times.min(), times.max()]   # time range per session_mode_name per mode
 
-    ls.put_dict('/mon/observing/submitted', dd)
+    get_store().put_dict('/mon/observing/submitted', dd)
 
 
-def get_sched():
+def get_sched(modes=None):
     """ Gets scheduled and active observations from etcd
+    If modes is given, only the schedule for those modes is fetched.
     """
 
-    scheduled = ls.get_dict('/mon/observing/schedule')
-    active = ls.get_dict('/mon/observing/submitted')
+    index = get_store().get_dict(SCHEDULE_KEY)
+    index = index if index is not None else {}
+    if modes is None:
+        modes = index.keys()
+
+    scheduled = {}
+    for mode in modes:
+        if mode in index:
+            scheduled[mode] = get_store().get_dict(f'{SCHEDULE_KEY}/{mode}') or {}
+    active = get_store().get_dict('/mon/observing/submitted')
 
     # use {} instead of None
-    scheduled = scheduled if scheduled is not None else {}
     active = active if active is not None else {}
 
     return scheduled, active
 
 
-def is_conflicted(sched):
-    """ Check if sched is requesting a beam that is already scheduled or submitted
+def is_conflicted(sched, index=None):
+    """ Check if sched is requesting a beam that is already scheduled or submitted.
+    A session conflicts if its time range overlaps (including contains or is contained by) another in the same mode.
+    index is a conflicts.ConflictIndex kept up to date by the caller. If None, it is built from etcd.
     """
 
-    scheduled, active = get_sched()
     sched_dict = create_dict(sched)
+    if index is None:
+        scheduled, active = get_sched(modes=sched_dict.keys())
+        index = conflicts.ConflictIndex.from_dicts(scheduled, active)
 
-    # iterate over sched_dict keys of unique observing modes to get values of (start, stop)
-    for kk,vv in sched_dict.items():
-
-        # if observing mode is scheduled, compare (start, stop)
-        if kk in scheduled.keys():
-            for trange in scheduled[kk].values():
-                for (t0, t1) in vv.values():
-                    if (t0 >= trange[0] and t0 <= trange[1]) or (t1 >= trange[0] and t1 <= trange[1]):
-                        return True
-
-        # if observing mode is active, compare (start, stop)
-        if kk in active.keys():
-            for trange in active[kk].values():
-                for (t0, t1) in vv.values():
-                    if (t0 >= trange[0] and t0 <= trange[1]) or (t1 >= trange[0] and t1 <= trange[1]):
-                        return True
+    conflict = index.find_conflict(sched_dict)
+    if conflict is not None:
+        logger.info(f"Session {conflict[0]} conflicts with {conflict[1]}")
+        return True
 
     return False
 
@@ -134,8 +212,8 @@ def print_sched(mode=None):
     """ Gets schedule from etcd and prints it
     """
 
-    dd, dd2 = get_sched()
-    mjd = time.Time.now().mjd
+    dd, dd2 = get_sched(modes=[mode] if mode is not None else None)
+    mjd = get_clock().mjd()
 
     logger.info(f"***Schedule (at MJD={mjd})***")
     if mode is None:
@@ -185,14 +263,11 @@ def sched_update(sched, mode='buffer'):
             include = [DataFrame([])]
             for s0 in sched:
                 if len(s0):
-                    if s0.index[0] > time.Time.now().mjd:
+                    if s0.index[0] > get_clock().mjd():
                         include.append(s0)
                     else:
                         logger.warning(f"Removing session starting at {s0.index[0]}")
-                        try:
-                            obsstate.update_session(int(s0.session_id.iloc[0]), 'skipped')
-                        except Exception as exc:
-                            logger.warning(f"Could not update session status: {str(exc)}.")
+                        statusqueue.post(int(s0.session_id.iloc[0]), 'skipped')
 
             sched = concat(include)
         
@@ -202,52 +277,153 @@ def sched_update(sched, mode='buffer'):
     return sched
 
 
-def submit_next(sched, pool):
-    """ Waits for mjd and submits the session rows to the pool
+def enqueue(queue, sched, mode='buffer'):
+    """ Add session rows to the ScheduleQueue.
+    If mode=='asap', then the session is added even if it starts in the past.
+    Returns True if the session was added.
     """
-    # alternatively, make sessions into a sequence with one start time
 
-    row = sched.iloc[0]
-    mjd = row.name
-    if mjd - time.Time.now().mjd < 2/(24*3600):
-        rows = sched[sched.session_id == row.session_id]
+    if not len(sched):
+        return False
+
+    if mode != 'asap' and sched.index.min() <= get_clock().mjd():
+        logger.warning(f"Removing session starting at {sched.index.min()}")
+        statusqueue.post(int(sched.session_id.iloc[0]), 'skipped')
+        return False
+
+    queue.add(sched)
+    logger.info(f"Updated sched to {len(queue)} commands.")
+
+    return True
+
+
+def submit_next(sched, pool, journal=None):
+    """ Waits for mjd and submits the session rows of the next session in the ScheduleQueue to the pool
+    If journal (journal.ScheduleJournal) is given, the dispatch is recorded.
+    """
+
+    nxt = sched.peek()
+    if nxt is None:
+        return None
+
+    mjd, session_id = nxt
+    if mjd - get_clock().mjd() < SUBMIT_LEAD:
+        rows = sched.cancel(session_id)
         print(rows)
-        fut = pool.apply_async(func=runrow, args=(rows,))
+        if journal is not None:
+            journal.dispatch(rows)
+        # status is posted first, so it is older than anything the worker posts
+        statusqueue.post(int(session_id), 'observing')
+        fut = pool.apply_async(func=runrow, args=(rows, get_clock().time()))
         put_submitted(rows)
-        try:
-            obsstate.update_session(int(row['session_id']), 'observing')
-        except Exception as exc:
-            logger.warning("Could not update session status.")
-        sched.drop(index=rows.index, axis=0, inplace=True)
         return fut
     else:
         return None
 
 
-def runrow(rows):
-    """ Runs a list of rows for a session_id in the schedule
+def submit_due(sched, pool, journal=None, publish=True):
+    """ Submits all sessions in the ScheduleQueue that start within SUBMIT_LEAD to the pool.
+    Each session is submitted as its own task, so sessions run in parallel. Sessions that share a beam or recorder
+    are rejected when they are submitted (see is_conflicted), so those due together are independent.
+    If journal (journal.ScheduleJournal) is given, the dispatches are recorded.
+    If publish is False, submissions and session status are not written to etcd or obsstate (e.g., in simulation).
+    Returns list of futures.
+    """
+
+    due = sched.pop_due(get_clock().mjd() + SUBMIT_LEAD)
+    if not due:
+        return []
+
+    submitted = get_clock().time()
+    futures = []
+    for rows in due:
+        if journal is not None:
+            journal.dispatch(rows)
+        # status is posted first, so it is older than anything the worker posts
+        if publish:
+            statusqueue.post(int(rows.session_id.iloc[0]), 'observing')
+        futures.append(pool.apply_async(func=runrow, args=(rows, submitted), kwds={'update_status': publish}))
+
+    if publish:
+        put_submitted(*due)
+
+    return futures
+
+
+def restore(journal, mode='buffer'):
+    """ Rebuild ScheduleQueue from journal (journal.ScheduleJournal) and reconcile it with session status in obsstate.
+    Sessions that obsstate shows as no longer scheduled are dropped, and sessions that start in the past are
+    skipped unless mode=='asap'. Sessions that were dispatched but not completed are logged and marked 'failed'
+    if their last command is in the past.
+    """
+
+    replayed, dispatched = journal.replay()
+    session_ids = replayed.session_ids() + list(dispatched)
+    try:
+        status = obsstate.read_session_status([sid for sid in session_ids if sid.isdigit()])
+    except Exception as exc:
+        logger.warning(f"Could not read session status: {str(exc)}.")
+        status = {}
+
+    queue = ScheduleQueue()
+    for session_id in replayed.session_ids():
+        rows = replayed.get(session_id)
+        st = status.get(int(session_id)) if session_id.isdigit() else None
+        if st is not None and st != 'scheduled':
+            logger.info(f"Not restoring session {session_id} with status {st}")
+            journal.cancel(session_id)
+        elif enqueue(queue, rows, mode=mode):
+            logger.info(f"Restored session {session_id}")
+        else:
+            journal.cancel(session_id)
+
+    now = get_clock().mjd()
+    for session_id, rows in dispatched.items():
+        if rows.index.max() < now:
+            logger.warning(f"Session {session_id} was dispatched before restart and did not complete.")
+            if session_id.isdigit() and status.get(int(session_id)) == 'observing':
+                statusqueue.post(int(session_id), 'failed')
+            journal.complete(session_id)
+        else:
+            logger.warning(f"Session {session_id} was running before restart. It is not resubmitted.")
+
+    return queue
+
+
+def runrow(rows, submitted=None, update_status=True):
+    """ Runs a list of rows for a session_id in the schedule.
+    Each command is executed at its MJD, with a namespace shared by the commands of the session.
+    Returns a summary with the lateness (in seconds) of each command.
+    submitted is the unix time the session was given to the pool, used to measure worker startup latency.
+    If update_status is False, the session is not marked completed in obsstate.
     """
 
+    startup = get_clock().time() - submitted if submitted is not None else None
+    if startup is not None:
+        logger.info(f"Worker started session {startup:.3f} s after submission")
+
+    lateness = []
+    first_command = None
+    namespace = {}
     for mjd, row in rows.iterrows():
-        if mjd - time.Time.now().mjd > 1/(24*3600):
+        if timing.mjd_to_unix(mjd) > get_clock().time():
             logger.info(f"Waiting until MJD {mjd}...")
-            while mjd - time.Time.now().mjd > 1/(24*3600):
-                sleep(0.49)
-# no longer skipping late rows
-#        elif mjd - time.Time.now().mjd < -10/(24*3600):
-#            logger.warning(f"Skipping command at MJD {mjd}...")
-#            continue
-        else:
-            logger.info(f"Submitting command:  {row.command}")
+        late = timing.wait_until_mjd(mjd)
+        lateness.append(late)
+        if first_command is None and submitted is not None:
+            first_command = get_clock().time() - submitted
+        logger.info(f"Submitting command ({late:.3f} s late):  {row.command}")
 
         try:
-            exec(row.command)
+            commands.compile_command(row.command).run(namespace)
         except Exception as exc:
             logger.warning(exc)
 
     # if loop completes, then set session to completed
-    try:
-        obsstate.update_session(int(row['session_id']), 'completed')
-    except Exception as exc:
-        logger.warning("Could not update session status.")
+    if update_status:
+        statusqueue.post(int(row['session_id']), 'completed')
+
+    return {'session_id': row['session_id'], 'ncommands': len(lateness),
+            'max_lateness': max(lateness), 'lateness': lateness,
+            'startup_latency': startup, 'first_command_latency': first_command}
 
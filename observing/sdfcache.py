@@ -0,0 +1,147 @@
+""" Content-addressed cache of parsed SDFs.
+
+A single submission parses the same SDF in the cli, executor, schedule and obsstate.
+Parsed results are keyed by a digest of the file contents, with a per-path (mtime, size)
+index in front of it so that a repeat lookup costs a single stat call. Values are shared
+between callers and must not be modified; callers that change them make their own copy.
+Entries are evicted in least-recently-used order and can optionally be persisted to disk
+(e.g., to share them with worker processes) by setting LWA_SDF_CACHE_DIR.
+"""
+
+import os
+import pickle
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger('observing')
+
+# bump when the parsed representation changes to ignore old files on disk
+_CACHE_VERSION = 1
+
+
+class SDFCache:
+    """ LRU cache of values derived from SDF contents.
+    Each entry is keyed by content digest and holds one value per kind (e.g., 'dict', 'obs_list').
+    """
+
+    def __init__(self, maxsize=256, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # digest -> {kind: value}
+        self._paths = {}   # abspath -> ((mtime_ns, size), digest)
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """ Drop all in-memory entries (files on disk are kept).
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._paths.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def digest(self, filename):
+        """ Return (digest, data) for filename.
+        data is None if the digest was found from the stat index without reading the file.
+        """
+
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        with self._lock:
+            known = self._paths.get(path)
+        if known is not None and known[0] == (st.st_mtime_ns, st.st_size):
+            return known[1], None
+
+        return self._read(path)
+
+    def _read(self, path):
+        # the stamp is taken from the open file, so it belongs to the data read
+        with open(path, 'rb') as fh:
+            st = os.fstat(fh.fileno())
+            data = fh.read()
+        digest = hashlib.sha1(data).hexdigest()
+        with self._lock:
+            self._paths[path] = ((st.st_mtime_ns, st.st_size), digest)
+
+        return digest, data
+
+    def get(self, filename, kind, builder):
+        """ Return builder(text) for the contents of filename, building it only on a miss. The value is shared.
+        """
+
+        digest, data = self.digest(filename)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                entry = self._load(digest)
+                if entry is not None:
+                    self._entries[digest] = entry
+            if entry is not None and kind in entry:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[kind]
+            self.misses += 1
+
+        if data is None:
+            # the digest came from the stat index; read again so the value is built from the contents digested
+            digest, data = self._read(os.path.abspath(filename))
+        value = builder(data.decode())
+
+        with self._lock:
+            entry = self._entries.setdefault(digest, {})
+            entry[kind] = value
+            self._entries.move_to_end(digest)
+            self._dump(digest, entry)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def _filename(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.v{_CACHE_VERSION}.pkl")
+
+    def _load(self, digest):
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with open(self._filename(digest), 'rb') as fh:
+                return pickle.load(fh)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Could not load cached SDF {digest}: {str(exc)}")
+            return None
+
+    def _dump(self, digest, entry):
+        if self.cache_dir is None:
+            return
+
+        fn = self._filename(digest)
+        tmp = f"{fn}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, 'wb') as fh:
+                pickle.dump(entry, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fn)
+        except Exception as exc:
+            logger.warning(f"Could not persist cached SDF {digest}: {str(exc)}")
+
+
+_cache = SDFCache(maxsize=int(os.environ.get('LWA_SDF_CACHE_SIZE', 256)),
+                  cache_dir=os.environ.get('LWA_SDF_CACHE_DIR', None))
+
+
+def get_cache():
+    """ Return the process-wide SDF cache.
+    """
+
+    return _cache
@@ -0,0 +1,178 @@
+""" Time-accelerated simulation of the executor.
+
+A day of SDFs is parsed with parsesdf.make_sched, checked for conflicts, and dispatched with
+schedule.submit_due/runrow to a thread pool under a clock.VirtualClock. When no session is
+running, the clock jumps to the next submission, so idle time between sessions costs nothing.
+The Controller commands run against StubController, which records each call without blocking
+instead of talking to the hardware, and nothing is written to etcd or obsstate. The report gives dispatch lateness,
+conflicts and how busy each resource (beam or recorder) was.
+StubMCSClient and StubBeamPointingControl do the same for run_sdf (see run_sdf --simulate).
+"""
+
+import logging
+import threading
+from multiprocessing.pool import ThreadPool
+from observing import clock, conflicts, controllers, parsesdf, schedule
+from observing.schedqueue import ScheduleQueue
+
+logger = logging.getLogger('observing')
+
+
+class _Stub:
+    """ Records every method call with the (virtual) time it was made.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self.calls = []   # (unix time, method, args, kwargs)
+        self._lock = threading.Lock()
+
+    def _record(self, method, args, kwargs):
+        with self._lock:
+            self.calls.append((clock.get_clock().time(), method, args, kwargs))
+        logger.debug(f"{self._name}.{method}{args} {kwargs}")
+
+
+class StubController(_Stub):
+    """ Stands in for mnc.control.Controller. Calls return at once, including control_bf with track.
+    """
+
+    def __init__(self, config_file=None):
+        super().__init__('Controller')
+        self.config_file = config_file
+        self.conf = {'xengines': {'cal_directory': None}}
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+
+        def call(*args, **kwargs):
+            self._record(method, args, kwargs)
+            return {}
+        return call
+
+
+class StubMCSClient(_Stub):
+    """ Stands in for mnc.mcs.Client.
+    """
+
+    def __init__(self):
+        super().__init__('MCSClient')
+
+    def send_command(self, name, command, **kwargs):
+        self._record('send_command', (name, command), kwargs)
+        return True, {'status': 'success', 'response': {'filename': f'simulated_{name}_{len(self.calls)}'}}
+
+
+class StubBeamPointingControl(_Stub):
+    """ Stands in for mnc.xengine_beamformer_control.BeamPointingControl.
+    """
+
+    def __init__(self, beam=None):
+        super().__init__(f'BeamPointingControl{beam}')
+        self.beam = beam
+
+    def set_beam_pointing(self, az, alt, degrees=True, load_time=None):
+        self._record('set_beam_pointing', (az, alt), {'degrees': degrees, 'load_time': load_time})
+
+
+def load(sdf_files, mode='buffer'):
+    """ Parse SDFs into a ScheduleQueue, as the executor would accept them.
+    Returns the queue and a list of (session_mode_name, conflicting session_mode_name).
+    """
+
+    queue = ScheduleQueue()
+    index = conflicts.ConflictIndex()
+    rejected = []
+    for filename in sdf_files:
+        sched = parsesdf.make_sched(filename, mode=mode)
+        sched.sort_index(inplace=True)
+        sched_dict = schedule.create_dict(sched)
+        conflict = index.find_conflict(sched_dict)
+        if conflict is not None:
+            logger.warning(f"Session {conflict[0]} conflicts with {conflict[1]}")
+            rejected.append(conflict)
+            continue
+        queue.add(sched)
+        index.add_dict(sched_dict)
+
+    return queue, rejected
+
+
+def run(sdf_files, speed=1000., processes=8, mode='buffer', lead=60.):
+    """ Simulate the executor running sdf_files at speed times real time with a pool of processes threads.
+    The virtual clock starts lead seconds before the first session is submitted and jumps to lead seconds before
+    the next submission whenever no session is running. Returns report().
+    """
+
+    queue, rejected = load(sdf_files, mode=mode)
+    sessions = {sid: queue.get(sid) for sid in queue.session_ids()}
+    if not sessions:
+        return report({}, [], rejected, speed)
+
+    nxt = queue.peek()
+    start = (nxt[0] - schedule.SUBMIT_LEAD - clock.UNIX_EPOCH_MJD)*86400 - lead
+    vclock = clock.VirtualClock(start=start, speed=speed)
+    previous_clock = clock.set_clock(vclock)
+    previous_factory = controllers.set_factory(StubController)
+    pool = ThreadPool(processes=processes)
+    results = []
+    try:
+        futures = []
+        while len(queue) or futures:
+            nxt = queue.peek()
+            if nxt is not None:
+                wait = (nxt[0] - schedule.SUBMIT_LEAD - vclock.mjd())*86400
+                if not futures and wait > lead:
+                    vclock.advance(wait - lead)   # nothing running; skip the idle time
+                vclock.sleep(min(1., wait))
+                futures += schedule.submit_due(queue, pool, publish=False)
+            else:
+                vclock.sleep(1.)
+            for fut in list(futures):
+                if fut.ready():
+                    summary = fut.get()
+                    results.append(summary)
+                    futures.remove(fut)
+    finally:
+        pool.terminate()
+        controllers.set_factory(previous_factory)
+        clock.set_clock(previous_clock)
+
+    return report(sessions, results, rejected, speed)
+
+
+def report(sessions, results, rejected, speed):
+    """ Summarize a simulation. sessions maps session_id to rows, results are runrow summaries.
+    Lateness is in virtual seconds; divide by speed for the real-time equivalent.
+    """
+
+    lateness = [late for result in results for late in result['lateness']]
+    busy = {}
+    spans = []
+    for rows in sessions.values():
+        t0, t1 = rows.index[0], rows.index[-1]
+        spans.append((t0, t1))
+        resources = conflicts.session_resources(rows.session_mode_name.iloc[0])
+        for resource in resources:
+            busy[resource] = busy.get(resource, 0.) + float(t1 - t0)*86400
+
+    # most sessions running at once
+    edges = sorted([(t0, 1) for t0, _ in spans] + [(t1, -1) for _, t1 in spans], key=lambda x: (x[0], x[1]))
+    running = max_running = 0
+    for _, step in edges:
+        running += step
+        max_running = max(max_running, running)
+
+    dd = {'nsessions': len(sessions), 'ncompleted': len(results), 'conflicts': rejected,
+          'max_lateness': max(lateness) if lateness else None,
+          'mean_lateness': sum(lateness)/len(lateness) if lateness else None,
+          'max_startup_latency': max([r['startup_latency'] for r in results if r['startup_latency'] is not None], default=None),
+          'max_concurrent_sessions': max_running, 'resource_busy_seconds': busy, 'speed': speed}
+
+    logger.info(f"Simulated {dd['ncompleted']} of {dd['nsessions']} sessions at {speed}x with {len(rejected)} conflicts")
+    if lateness:
+        logger.info(f"Command lateness: max {dd['max_lateness']:.3f} s, mean {dd['mean_lateness']:.3f} s (virtual)")
+    logger.info(f"At most {max_running} sessions at once. Busy time per resource (s): {busy}")
+
+    return dd
@@ -0,0 +1,155 @@
+""" Session status updates through a single writer.
+
+The executor creates a queue (workers.make_status_queue), passes it to its pool workers and
+runs a StatusWriter thread on it. post() then only puts (session_id, status, mjd) on the
+queue, so neither dispatch nor a session waits on the database; the writer applies events in
+batches with obsstate.write_status, which also records them in the status_history table.
+Without a queue (e.g., in the command line tools), post() writes directly.
+"""
+
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from observing import obsstate
+from observing.clock import now_mjd
+
+logger = logging.getLogger('observing')
+
+#: Most events written in one transaction
+BATCH_SIZE = 200
+#: Most events kept for retry while the database cannot be written
+MAX_PENDING = 10000
+
+_queue = None
+
+
+def set_queue(events=None):
+    """ Send status events posted in this process to events (a queue), or write them directly if None.
+    Used as (part of) a pool initializer so workers post to the executor's writer.
+    """
+
+    global _queue
+    _queue = events
+
+
+def post(session_id, status, mjd=None):
+    """ Record a change of session status at mjd (default now). Does not raise.
+    """
+
+    event = (int(session_id), status, now_mjd() if mjd is None else mjd)
+    if _queue is not None:
+        try:
+            _queue.put_nowait(event)
+            return
+        except Exception as exc:
+            logger.warning(f"Could not queue status of session {session_id}: {str(exc)}. Writing it directly.")
+
+    try:
+        obsstate.write_status([event])
+    except Exception as exc:
+        logger.warning(f"Could not update session status: {str(exc)}.")
+
+
+class StatusWriter:
+    """ Thread that applies status events from events (a queue) to the database at path in batches.
+    Events that fail to be written are kept and retried with the next batch, at least interval seconds later.
+    """
+
+    def __init__(self, events, path=None, batch_size=BATCH_SIZE, interval=0.5):
+        self.events = events
+        self.path = path or obsstate.DBPATH
+        self.batch_size = batch_size
+        self.interval = interval
+        self.nwritten = 0
+        self.nbatches = 0
+        self._pending = []
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='status-writer')
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=10.):
+        """ Write the events queued so far and stop the thread.
+        """
+
+        if self._thread is None:
+            return
+        self.events.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                event = self.events.get(timeout=self.interval)
+            except queue.Empty:
+                event = False   # nothing new; retry pending events
+            except (EOFError, OSError) as exc:
+                logger.warning(f"Status queue closed: {str(exc)}. Writing pending status updates.")
+                event = None
+
+            if event is None:
+                stopping = True
+            elif event:
+                self._pending.append(event)
+
+            # take what else is waiting, up to a batch
+            while not stopping and len(self._pending) < self.batch_size:
+                try:
+                    event = self.events.get_nowait()
+                except (queue.Empty, EOFError, OSError):
+                    break
+                if event is None:
+                    stopping = True
+                else:
+                    self._pending.append(event)
+
+            if not self._flush() and stopping:
+                time.sleep(self.interval)   # one more attempt before giving up
+                self._flush()
+
+        obsstate.close_connections()
+
+    def _flush(self):
+        """ Write pending events in batches. Returns False if the database could not be written.
+        A batch that fails for another reason is written one event at a time, and events that still fail are dropped.
+        """
+
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            try:
+                obsstate.write_status(batch, path=self.path)
+            except sqlite3.Error as exc:
+                logger.warning(f"Could not write {len(batch)} status updates: {str(exc)}")
+                if len(self._pending) > MAX_PENDING:
+                    logger.warning(f"Dropping {len(self._pending) - MAX_PENDING} status updates")
+                    del self._pending[:len(self._pending) - MAX_PENDING]
+                return False
+            except Exception as exc:
+                logger.warning(f"Could not write {len(batch)} status updates: {type(exc).__name__} {str(exc)}. "
+                               "Writing them one at a time.")
+                for i, event in enumerate(batch):
+                    try:
+                        obsstate.write_status([event], path=self.path)
+                    except sqlite3.Error as exc:
+                        logger.warning(f"Could not write {len(batch) - i} status updates: {str(exc)}")
+                        del self._pending[:i]
+                        return False
+                    except Exception as exc:
+                        logger.warning(f"Dropping status update {event}: {type(exc).__name__} {str(exc)}")
+                    else:
+                        self.nwritten += 1
+                del self._pending[:len(batch)]
+                self.nbatches += 1
+                continue
+
+            del self._pending[:len(batch)]
+            self.nwritten += len(batch)
+            self.nbatches += 1
+
+        return True
@@ -0,0 +1,67 @@
+""" Waiting for deadlines.
+
+A target time (unix seconds, MJD or astropy Time) is converted once into a deadline on the
+monotonic clock. wait_until() sleeps until shortly before the deadline and then spins for
+the rest of it, so it neither builds clock objects while it waits nor oversleeps by the
+scheduler's wake-up granularity. It returns the wake-up error, i.e., how late (positive) it
+returned relative to the deadline.
+Times come from clock.get_clock(), so waits run faster than real time under a VirtualClock.
+"""
+
+from observing.clock import get_clock, UNIX_EPOCH_MJD
+
+#: Seconds before a deadline at which wait_until stops sleeping and spins
+SPIN = 0.002
+
+
+def mjd_to_unix(mjd):
+    """ Convert UTC MJD to unix seconds.
+    """
+
+    return (mjd - UNIX_EPOCH_MJD)*86400
+
+
+def to_unix(target):
+    """ Return unix seconds for a target that is unix seconds (float) or an astropy Time.
+    """
+
+    if hasattr(target, 'unix'):
+        return target.utc.unix
+    return float(target)
+
+
+def deadline(target):
+    """ Return monotonic clock time corresponding to target (unix seconds or astropy Time).
+    """
+
+    clock = get_clock()
+    return clock.monotonic() + (to_unix(target) - clock.time())
+
+
+def wait_for(monotonic_deadline, spin=SPIN):
+    """ Wait until the monotonic clock reaches monotonic_deadline. Returns wake-up error in seconds.
+    """
+
+    clock = get_clock()
+    remaining = monotonic_deadline - clock.monotonic()
+    if remaining > spin:
+        clock.sleep(remaining - spin)
+    while clock.monotonic() < monotonic_deadline:
+        pass
+
+    return clock.monotonic() - monotonic_deadline
+
+
+def wait_until(target, spin=SPIN):
+    """ Wait until target (unix seconds or astropy Time). Returns wake-up error in seconds.
+    Returns immediately (with a positive error) if target is in the past.
+    """
+
+    return wait_for(deadline(target), spin=spin)
+
+
+def wait_until_mjd(mjd, spin=SPIN):
+    """ Wait until UTC MJD. Returns wake-up error in seconds.
+    """
+
+    return wait_until(mjd_to_unix(mjd), spin=spin)
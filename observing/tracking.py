@@ -0,0 +1,273 @@
+""" Beam tracking updates for run_sdf.
+
+The source position is transformed to az/alt for the whole observation on a grid of
+BEAM_UPDATE_STEP in one batched astropy call. Update times are then picked from the grid
+wherever the source has moved BEAM_UPDATE_DISTANCE from the last pointing, and the pointings
+for all of the intervals between updates are transformed in a second batched call.
+Solar system bodies are tracked along their positions from observing.ephemeris.
+
+For fixed RA/dec targets, the angular distance the source moves in az/alt over an hour angle
+change dH depends only on its declination, cos(theta) = sin^2(dec) + cos^2(dec) cos(dH). The
+planner uses that to predict where each update falls on the grid, transforms only the predicted
+samples, and bisects to the exact sample where a prediction misses, so the number of
+transforms scales with the number of updates rather than the length of the observation.
+Where astropy supports it, the slowly-varying parts of the transform (precession-nutation,
+Earth position) are computed on a coarse ASTROM_STEP grid and interpolated.
+"""
+
+import contextlib
+
+import numpy
+import astropy.units as u
+from astropy.time import Time, TimeDelta
+from astropy.coordinates import SkyCoord, Angle, AltAz
+try:
+    from astropy.coordinates.erfa_astrom import erfa_astrom, ErfaAstromInterpolator
+except ImportError:
+    erfa_astrom = None
+from observing import ephemeris
+
+#: Time step to use when determining beam pointings
+BEAM_UPDATE_STEP = TimeDelta(1, format='sec')
+#: Maximum distance a source can move on the sky before a beam pointing update
+BEAM_UPDATE_DISTANCE = Angle('0:04:48', unit='deg') # This set based on LWA1's MCS
+                                                    # step size of 0.2 degrees and
+                                                    # scaling that to an aperature
+                                                    # of 250 m.
+#: Earth rotation rate relative to the stars (degrees per second)
+SIDEREAL_RATE = 360/86164.0905
+#: Grid spacing used to interpolate the astrometry parameters of the az/alt transform
+ASTROM_STEP = 300*u.s
+
+
+def _astrom_context():
+    if erfa_astrom is None:
+        return contextlib.ExitStack()   # no-op
+    return erfa_astrom.set(ErfaAstromInterpolator(ASTROM_STEP))
+
+
+def separation(az0, alt0, az1, alt1):
+    """
+    Angular distance in degrees between (az0, alt0) and (az1, alt1), all in
+    radians.  Any of the inputs can be arrays.
+
+    From:
+      https://github.com/astropy/astropy/blob/main/astropy/coordinates/angle_utilities.py
+    """
+
+    sdlon = numpy.sin(az1 - az0)
+    cdlon = numpy.cos(az1 - az0)
+    slat1 = numpy.sin(alt0)
+    slat2 = numpy.sin(alt1)
+    clat1 = numpy.cos(alt0)
+    clat2 = numpy.cos(alt1)
+
+    num1 = clat2 * sdlon
+    num2 = clat1 * slat2 - slat1 * clat2 * cdlon
+    denominator = slat1 * slat2 + clat1 * clat2 * cdlon
+
+    return numpy.degrees(numpy.arctan2(numpy.hypot(num1, num2), denominator))
+
+
+def select_updates(az, alt, distance):
+    """
+    Given arrays of azimuth and altitude (radians) on the time grid, return
+    the grid indices at which the pointing is updated: the first sample and
+    then every sample that is at least distance (degrees) from the last
+    update.
+    """
+
+    n = len(az)
+    updates = [0]
+    last, lo = 0, 1
+    window = 64
+    while lo < n:
+        hi = min(n, lo + window)
+        sep = separation(az[last], alt[last], az[lo:hi], alt[lo:hi])
+        hit = numpy.flatnonzero(sep >= distance)
+        if len(hit):
+            last = lo + int(hit[0])
+            updates.append(last)
+            lo = last + 1
+        else:
+            lo = hi
+            window *= 2
+
+    return updates
+
+
+def predicted_interval(dec, distance):
+    """
+    Return the time in seconds for a fixed RA/dec source at declination dec
+    (degrees) to move distance (degrees) on the sky, or numpy.inf if it never
+    does.
+    """
+
+    sdec2 = numpy.sin(numpy.radians(dec))**2
+    cdec2 = 1 - sdec2
+    if cdec2 < 1e-12:
+        return numpy.inf
+
+    cos_dh = (numpy.cos(numpy.radians(distance)) - sdec2) / cdec2
+    if cos_dh < -1:
+        return numpy.inf
+
+    return numpy.degrees(numpy.arccos(min(cos_dh, 1.))) / SIDEREAL_RATE
+
+
+class _GridPositions:
+    """
+    Az/alt (radians) of a target at the samples of a time grid, transformed
+    on demand and in batches.
+    """
+
+    def __init__(self, obs, start, step, site):
+        self.obs = obs
+        self.start = start
+        self.step = step
+        self.site = site
+        self.ntransforms = 0
+        self._cache = {}
+
+    def evaluate(self, idx):
+        idx = sorted(set(int(i) for i in idx) - set(self._cache))
+        if idx:
+            aa = get_altaz(self.obs, self.start + TimeDelta(self.step*numpy.array(idx), format='sec'), self.site)
+            self.ntransforms += 1
+            for i, az, alt in zip(idx, numpy.atleast_1d(aa.az.rad), numpy.atleast_1d(aa.alt.rad)):
+                self._cache[i] = (az, alt)
+
+    def separation(self, i0, i1):
+        self.evaluate([i0, i1])
+        return separation(*self._cache[i0], *self._cache[i1])
+
+
+def plan_updates(positions, n, interval, distance):
+    """
+    Return grid indices (out of n) at which the pointing is updated, as
+    select_updates does, for a target whose position moves distance (degrees)
+    in about interval samples and whose separation from a given position grows
+    monotonically with time.  positions is a _GridPositions.
+    """
+
+    m = max(1, int(numpy.ceil(interval))) if numpy.isfinite(interval) else n
+
+    def predicted(last):
+        idx = [last, n-1]
+        for k in range(last + m, n, m):
+            idx += [k-1, k]
+        return idx
+
+    def first_crossing(last, lo, hi):
+        # separation is below distance at lo and at or above it at hi
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if positions.separation(last, mid) >= distance:
+                hi = mid
+            else:
+                lo = mid
+        return hi
+
+    positions.evaluate(predicted(0))
+    updates = [0]
+    last = 0
+    while True:
+        k = last + m
+        if k >= n:
+            if positions.separation(last, n-1) < distance:
+                break
+            k = first_crossing(last, last, n-1)
+        elif positions.separation(last, k) < distance:
+            # prediction too early. Search forward
+            lo, hi = k, min(n-1, last + 2*m)
+            while hi < n-1 and positions.separation(last, hi) < distance:
+                lo, hi = hi, min(n-1, hi + m)
+            if positions.separation(last, hi) < distance:
+                break
+            k = first_crossing(last, lo, hi)
+        elif positions.separation(last, k-1) >= distance:
+            # prediction too late
+            k = first_crossing(last, last, k-1)
+        else:
+            updates.append(k)
+            last = k
+            continue
+
+        # use the observed spacing for the rest of the predictions
+        m = max(1, k - last)
+        updates.append(k)
+        last = k
+        positions.evaluate(predicted(last))
+
+    return updates
+
+
+def get_target(obs, times):
+    """
+    Return a SkyCoord for the observation target, either from the RA/dec in the
+    observations dictionary or as the positions of a solar system body at
+    times.
+    """
+
+    target_or_ra = obs['ra']
+    dec = obs['dec']
+    if dec is not None:
+        ra = Angle(target_or_ra, unit='hourangle')
+        dec = Angle(dec, unit='deg')
+        sc = SkyCoord(ra, dec, frame='fk5')
+    else:
+        sc = ephemeris.get_ephemeris().position(target_or_ra, times)
+
+    return sc
+
+
+def get_altaz(obs, times, site):
+    """
+    Return the AltAz coordinates of the observation target at times.
+    """
+
+    with _astrom_context():
+        return get_target(obs, times).transform_to(AltAz(obstime=times, location=site))
+
+
+def get_tracking_updates(obs, site, step=BEAM_UPDATE_STEP, distance=BEAM_UPDATE_DISTANCE, adaptive=True):
+    """
+    Given an observations dictionary and an EarthLocation, figure out when/how
+    to update the beam pointing for the duration of the observation.  Returns
+    a list of times/pointings (unix timestamp for the update, azimuth in
+    degrees, elevation in degrees).  If adaptive, updates for fixed RA/dec
+    targets are found with the planner instead of the full grid.
+    """
+
+    # Load the start and stop times for this observation
+    start = Time(obs['mjd'], obs['mpm']/1000/86400, format='mjd', scale='utc')
+    stop =  Time(obs['mjd'], (obs['mpm']+obs['dur'])/1000/86400, format='mjd', scale='utc')
+
+    # az/alt vs ra/dec step check - If we are in az/alt mode we only need to
+    # point once at the beginning of the observation
+    if obs['azalt']:
+        return [[start.utc.unix, obs['ra'], obs['dec']],]
+
+    # Figure out when to update based on how far the sources moves on a grid
+    # of step from start to stop
+    dur = (stop - start).sec
+    step = step.sec
+    distance = distance.to_value(u.deg)
+    n = int(numpy.floor(dur/step + 1e-9)) + 1
+    if adaptive and obs['dec'] is not None:
+        interval = predicted_interval(obs['dec'], distance) / step
+        idx = plan_updates(_GridPositions(obs, start, step, site), n, interval, distance)
+    else:
+        aa = get_altaz(obs, start + TimeDelta(step*numpy.arange(n), format='sec'), site)
+        idx = select_updates(aa.az.rad, aa.alt.rad, distance)
+    updates = numpy.append(step*numpy.array(idx), dur)
+
+    # Convert to updates into pointings that happen at t[i] but point to the
+    # position of the source at the midpoint between t[i] and t[i+1].
+    midpoints = updates[:-1] + (updates[1:] - updates[:-1]) / 2.0
+    aa = get_altaz(obs, start + TimeDelta(midpoints, format='sec'), site)
+    t_update = (start + TimeDelta(updates[:-1], format='sec')).utc.unix
+    steps = [[t, az, alt] for t, az, alt in zip(t_update.tolist(), aa.az.deg.tolist(), aa.alt.deg.tolist())]
+
+    # Done
+    return steps
@@ -0,0 +1,166 @@
+""" Process pool that runs sessions in workers with their imports already done.
+
+Workers are forked from a forkserver that has imported the heavy, fork-safe modules
+(numpy, pandas, astropy). Each worker then imports the modules that open connections
+(mnc, observing.schedule) and builds Controllers for WARM_CONFIGS in its initializer,
+before it is given a session. With maxtasksperchild=1 (the default), every session still
+runs in its own process and failed or bloated workers are never reused, but the
+replacement is started and warmed while the pool is idle instead of when the next
+session arrives.
+
+Each worker claims a slot in a PoolHealth shared with the parent and records there whether
+it built the Controller for each of WARM_CONFIGS. warm_configs() returns the configs for
+which every live worker holds a Controller, so the executor only shortens the controller
+buffer (see parsesdf.make_sched) when whichever worker takes the session is warm.
+"""
+
+import os
+import time
+import logging
+import importlib
+import multiprocessing as mp
+from multiprocessing import util
+from observing import controllers, statusqueue
+from observing.classes import DEFAULT_CONFIG_FILE
+
+logger = logging.getLogger('observing')
+
+#: Imported once in the forkserver and inherited by every worker. Must be safe to fork.
+FORKSERVER_PRELOAD = ['numpy', 'pandas', 'astropy.units', 'astropy.time', 'astropy.coordinates']
+
+#: Imported by each worker after it starts (e.g., modules that connect to etcd at import).
+WORKER_PRELOAD = ['observing.schedule', 'observing.recmetadata', 'mnc.control']
+
+#: Configuration files for which each worker builds a Controller before it is given a session.
+WARM_CONFIGS = [DEFAULT_CONFIG_FILE]
+
+_health = None   # PoolHealth of the pool made by this process
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class PoolHealth:
+    """ Which Controllers the workers of a pool hold, in arrays shared between the parent and the workers.
+    Each worker claims a slot (see claim), which is freed when the worker exits or is found dead.
+    """
+
+    def __init__(self, ctx, nslots, configs):
+        self.configs = list(configs)
+        self.pids = ctx.Array('i', nslots)   # 0 for a free slot
+        self.flags = ctx.Array('b', nslots*len(self.configs))   # slot-major, one per config
+
+    def claim(self):
+        """ Claim a slot for this process and return its index, or None if all slots are taken.
+        """
+
+        with self.pids.get_lock():
+            for slot, pid in enumerate(self.pids):
+                if pid == 0 or not _alive(pid):
+                    self.pids[slot] = os.getpid()
+                    for i in range(len(self.configs)):
+                        self.flags[slot*len(self.configs) + i] = False
+                    return slot
+        return None
+
+    def release(self, slot):
+        with self.pids.get_lock():
+            if self.pids[slot] == os.getpid():
+                self.pids[slot] = 0
+
+    def set(self, slot, index, ok):
+        self.flags[slot*len(self.configs) + index] = ok
+
+    def warm_configs(self):
+        """ Return the configs for which every live worker holds a Controller (none if there are no workers).
+        """
+
+        with self.pids.get_lock():
+            live = [slot for slot, pid in enumerate(self.pids) if pid != 0 and _alive(pid)]
+            flags = self.flags[:]
+        if not live:
+            return []
+        return [config_file for i, config_file in enumerate(self.configs)
+                if all(flags[slot*len(self.configs) + i] for slot in live)]
+
+
+def warm(preload=WORKER_PRELOAD, configs=WARM_CONFIGS, status_queue=None, health=None):
+    """ Pool initializer that imports preload modules and builds Controllers for configs.
+    If status_queue is given, session status changes are posted to it (see observing.statusqueue).
+    If health (PoolHealth for configs) is given, the worker records in a slot of it which Controllers were built.
+    """
+
+    t0 = time.time()
+    if status_queue is not None:
+        statusqueue.set_queue(status_queue)
+    slot = health.claim() if health is not None else None
+    if slot is not None:
+        util.Finalize(health, health.release, args=(slot,), exitpriority=10)
+    elif health is not None:
+        logger.warning(f"No health slot free for worker {os.getpid()}")
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception as exc:
+            logger.warning(f"Could not preload {name} in worker: {str(exc)}")
+    for i, config_file in enumerate(configs):
+        try:
+            controllers.get_controller(config_file)
+            ok = True
+        except Exception as exc:
+            logger.warning(f"Could not build controller for {config_file} in worker: {str(exc)}")
+            ok = False
+        if slot is not None:
+            health.set(slot, i, ok)
+    logger.debug(f"Worker {os.getpid()} warmed in {time.time()-t0:.3f} s")
+
+
+def _context(method):
+    if method not in mp.get_all_start_methods():
+        logger.warning(f"Start method {method} not available. Using spawn.")
+        method = 'spawn'
+    return mp.get_context(method)
+
+
+def make_status_queue(method='forkserver'):
+    """ Create a queue for session status events that can be given to make_pool.
+    """
+
+    return _context(method).Queue()
+
+
+def make_pool(processes=8, method='forkserver', maxtasksperchild=1, preload=WORKER_PRELOAD,
+              forkserver_preload=FORKSERVER_PRELOAD, configs=WARM_CONFIGS, status_queue=None):
+    """ Create a multiprocessing Pool with preloaded workers.
+    method is a multiprocessing start method. Falls back to 'spawn' if it is not available.
+    Workers post session status changes to status_queue (see make_status_queue), if given.
+    """
+
+    global _health
+
+    ctx = _context(method)
+    if ctx.get_start_method() == 'forkserver':
+        ctx.set_forkserver_preload(forkserver_preload)
+
+    # room for a worker that is exiting next to the one replacing it
+    health = PoolHealth(ctx, 2*(processes or os.cpu_count()), configs)
+    _health = health
+
+    return ctx.Pool(processes=processes, maxtasksperchild=maxtasksperchild, initializer=warm,
+                    initargs=(preload, configs, status_queue, health))
+
+
+def warm_configs():
+    """ Return the config files for which every live worker of the pool built a Controller (see make_pool).
+    """
+
+    if _health is None:
+        return []
+    return _health.warm_configs()
@@ -8,15 +8,11 @@ Created on Mon Jun  5 09:59:15 2023
 
 import os.path
 import sys
-from time import sleep
-
-import multiprocessing as mp
 
 from pandas import DataFrame
-from astropy.time import Time
 from mnc import common  # inherited by threads
-from observing import parsesdf, schedule, obsstate
-from dsautils import dsa_store
+from observing import parsesdf, schedule, obsstate, conflicts, workers, journal, kvstore, statusqueue
+from observing.clock import now_mjd
 
 logger = common.get_logger(__name__)
 #logging.basicConfig(level=logging.INFO)  # This configures the root logger
@@ -27,43 +23,48 @@ if __name__ == "__main__":
     """ Run commands parsed from SDF.
     """
 
-    ctx = mp.get_context('spawn')
-    pool = ctx.Pool(processes=8, maxtasksperchild=1)
-    ls = dsa_store.DsaStore()
+    status_queue = workers.make_status_queue()
+    writer = statusqueue.StatusWriter(status_queue).start()   # the one writer of session status to obsstate
+    statusqueue.set_queue(status_queue)
+    pool = workers.make_pool(processes=8, status_queue=status_queue)   # one session per worker, started with imports done
+    ls = kvstore.get_store()
 
-    logger.info("Set up ProcessPool and DsaStore")
+    logger.info(f"Set up ProcessPool and {type(ls).__name__}")
 
-    sched0 = DataFrame([])
+    log = journal.ScheduleJournal()   # local record of schedule changes, to restore schedule on restart
+    sched0 = schedule.restore(log)
+    index = conflicts.ConflictIndex()   # time ranges of scheduled and submitted sessions per mode
+    index.add_dict(sched0.to_dict())
     def sched_callback():
         def a(event):
-            global sched0
             mode = event['mode']
             if mode == 'reset':
                 # option to reset schedule
                 logger.info("Resetting schedule...")
-                sched0 = DataFrame([])
-                sched0 = schedule.sched_update(sched0)
+                sched0.clear()
+                index.clear()
+                log.reset()
             elif 'filename' in event and mode == 'cancel':
                 # option to cancel session
                 filename = event['filename']
                 if os.path.exists(filename):
                     logger.info(f"Cancelling session {filename}")
                     sched = parsesdf.make_sched(filename)
-                    sched0 = sched0[sched0.session_id != sched.session_id.iloc[0]]
+                    if sched0.cancel(sched.session_id.iloc[0]) is not None:
+                        log.cancel(sched.session_id.iloc[0])
+                    index.remove(sched.session_mode_name.iloc[0])
                     # remove session from obsstate
-                    try:
-                        obsstate.update_session(int(sched.session_id.iloc[0]), 'cancelled')
-                    except Exception as exc:
-                        logger.warning("Could not update session status.")
+                    statusqueue.post(int(sched.session_id.iloc[0]), 'cancelled')
             elif 'filename' in event and mode in ['asap', 'buffer']:
                 # option to submit session with option to execute asap
                 filename = event['filename']
                 if os.path.exists(filename):
                     logger.info(f"Checking session in {filename}")
-                    sched = parsesdf.make_sched(filename, mode=mode)
+                    sched = parsesdf.make_sched(filename, mode=mode, warm_configs=workers.warm_configs())
                     sched.sort_index(inplace=True)
 
-                    if not schedule.is_conflicted(sched):
+                    index.prune(now_mjd())
+                    if not schedule.is_conflicted(sched, index=index):
                         logger.info(f"Adding session {filename}")
                         # add session to obsstate
                         try:
@@ -71,7 +72,9 @@ if __name__ == "__main__":
                         except Exception as exc:
                             logger.warning("Could not add session to obsstate.")
 
-                        sched0 = schedule.sched_update([sched0, sched], mode=mode)
+                        if schedule.enqueue(sched0, sched, mode=mode):
+                            log.add(sched0.get(sched.session_id.iloc[0]))
+                            index.add_dict(schedule.create_dict(sched))
 
                         # make function to parse and add dictionary there, keyed by session_id
                         schedule.put_dict(filename)
@@ -92,19 +95,18 @@ if __name__ == "__main__":
                     logger.warning(f"Command ({command}) not allowed.")
                 else:
                     # get arbitrary unique session_id and add as column (to avoid submitting multiple commands at once)
-                    if len(sched0):
-                        settings_id = int(max(set(list(sched0.session_id)))) + 1  # "settings" is a misnomer since this can include x-engine restart too
-                    else:
-                        settings_id = 1
+                    settings_id = sched0.next_session_id()  # "settings" is a misnomer since this can include x-engine restart too
 
                     # handy name 
                     sched.insert(1, column='session_id', value=int(settings_id))
                     session_mode_name = f"{settings_id}_settings"
                     sched.insert(1, column='session_mode_name', value=session_mode_name)
 
-                    if not schedule.is_conflicted(sched):
+                    if not schedule.is_conflicted(sched, index=index):
                         logger.info(f"Adding command {command} at MJD {mjd}")
-                        sched0 = schedule.sched_update([sched0, sched], mode=mode)
+                        if schedule.enqueue(sched0, sched, mode=mode):
+                            log.add(sched)
+                            index.add_dict(schedule.create_dict(sched))
                     else:
                         logger.warning(f"Command {command} conflicts with existing command.")
             else:
@@ -114,35 +116,55 @@ if __name__ == "__main__":
 
     if len(sys.argv) == 2:
         logger.info(f"Initializing schedule with {sys.argv[1]}")
-        sched0 = parsesdf.make_sched(sys.argv[1])
+        sched = parsesdf.make_sched(sys.argv[1])
+        sched0.add(sched)
+        log.add(sched0.get(sched.session_id.iloc[0]))
+        index.add_dict(schedule.create_dict(sched))
 
     # initialize
     futures = []
     nextmjd = 0
-    lsched0 = len(sched0)
+    vsched0 = sched0.version
     lfutures = len(futures)
     schedule.put_sched(sched0)  # TODO: do we initialize each time or try to save all schedule in etcd?
+    housekeeping = 1.   # longest sleep (s) between checks of futures and schedule changes
 
     while True:
         try:
+            # sleep until the next session is due, or wake early if an earlier session is added
+            timeout = housekeeping
+            nxt = sched0.peek()
+            if nxt is not None:
+                timeout = min(timeout, (nxt[0] - schedule.SUBMIT_LEAD - now_mjd())*24*3600)
+            if timeout > 0:
+                sched0.wait(timeout)
+
             if len(sched0):
-                fut = schedule.submit_next(sched0, pool)    # when time comes, fire and forget
-                if fut is not None:
-                    futures.append(fut)
-                    logger.info(f"Submitted one. {len(futures)} futures")
-                if len(sched0):
-                    if sched0.iloc[0].name != nextmjd:
-                        nextmjd = sched0.iloc[0].name
-                        logger.info(f"Next session at MJD {nextmjd}, in {(nextmjd-Time.now().mjd)*24*3600}s")
+                submitted = schedule.submit_due(sched0, pool, journal=log)    # when time comes, fire and forget
+                if submitted:
+                    futures += submitted
+                    logger.info(f"Submitted {len(submitted)}. {len(futures)} futures")
+                nxt = sched0.peek()
+                if nxt is not None:
+                    if nxt[0] != nextmjd:
+                        nextmjd = nxt[0]
+                        logger.info(f"Next session at MJD {nextmjd}, in {(nextmjd-now_mjd())*24*3600}s")
                 else:
                     logger.info("Schedule contains 0 session commands.")
 
             # clean up futures
-            for fut in futures:
+            for fut in list(futures):
                 if fut.ready():
-                    logger.info(f"Completed command: {fut.get(timeout=1)}")
+                    try:
+                        result = fut.get(timeout=1)
+                        logger.info(f"Completed command: {result}")
+                        log.complete(result['session_id'])
+                    except Exception as exc:
+                        logger.warning(f"Session failed: {str(exc)}")
                     futures.remove(fut)
-            sleep(0.49)  # at least two per second
+
+            if log.needs_compaction:
+                log.compact(sched0)
         except KeyboardInterrupt:
             logger.info("Interrupting execution of schedule. Clearing schedule and waiting on submissions (Ctrl-C again to interrupt)...")
             schedule.put_sched(DataFrame([]))
@@ -159,13 +181,15 @@ if __name__ == "__main__":
 #                    if not res:
 #                        logger.warning("\tCould not cancel a submission...")
             pool.terminate()
+            log.close()
+            writer.stop()
             break
             
-        if len(sched0) != lsched0 or len(futures) != lfutures:
-            if len(sched0) != lsched0:
-                schedule.put_sched(sched0)   # this will remove ones still being observed...
-            lsched0 = len(sched0)
+        if sched0.version != vsched0 or len(futures) != lfutures:
+            if sched0.version != vsched0:
+                schedule.put_sched(sched0)   # writes only modes changed in this tick. this will remove ones still being observed...
+            vsched0 = sched0.version
             lfutures = len(futures)
             logger.info(f'Change to length of schedule or futures: {len(sched0)}, {len(futures)}')
-            if lsched0:
-                logger.info(f'Current schedule: {sched0}')
+            if len(sched0):
+                logger.info(f'Current schedule: {sched0.to_frame()}')
@@ -7,11 +7,14 @@ from fastapi.responses import HTMLResponse, FileResponse
 from fastapi import HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
 from observing import obsstate as obs
+from observing.dashboard import DashboardData
 import os
 import fnmatch
 import logging
-from astropy import time
+import time
+from observing.clock import get_clock, unix_to_mjd
 logging.basicConfig(level=logging.INFO)  # This configures the root logger
 logger = logging.getLogger(__name__)
 
@@ -24,6 +27,7 @@ PIPELINE_EVENTS_ROOT = os.environ.get(
 
 app.mount("/static", StaticFiles(directory=image_dir), name="static")
 templates = Jinja2Templates(directory="templates")
+data = DashboardData()
 
 
 def _list_pipeline_events(root: Path):
@@ -84,29 +88,33 @@ def _pipeline_event_png_full_path(events_root: str, event: str, filename: str):
 @app.on_event("startup")
 async def startup_event():
     """Create database on startup."""
-    obs.create_db()
+    await run_in_threadpool(obs.create_db)
 
 
 @app.get("/sessions", response_class=HTMLResponse)
-async def get_all_sessions(request: Request):
-    rows = obs.read_sessions()
-    sessions = [obs.Session(time_loaded=row[0], PI_ID=row[1], PI_NAME=row[2], PROJECT_ID=row[3],
-                            SESSION_ID=row[4], SESSION_MODE=row[5], SESSION_DRX_BEAM=row[6],
-                            CONFIG_FILE=row[7], CAL_DIR=row[8], STATUS=row[9]) for row in rows]
-    return templates.TemplateResponse("sessions.html", {"request": request, "sessions": sessions})
+async def get_all_sessions(request: Request, status: str = None, mode: str = None, pi: str = None,
+                           start: float = None, stop: float = None, before: str = None,
+                           limit: int = 500):
+    """Page through sessions, newest first. before is the cursor ("time_loaded,rowid") of the previous page."""
+    cursor = tuple(before.split(',')) if before else None
+    sessions, cursor = await run_in_threadpool(data.query_sessions, start=start, stop=stop, status=status,
+                                               mode=mode, pi=pi, limit=limit, before=cursor)
+    next_page = None
+    if cursor is not None:
+        next_page = str(request.url.include_query_params(before=f"{cursor[0]!r},{cursor[1]}"))
+    return templates.TemplateResponse("sessions.html", {"request": request, "sessions": sessions,
+                                                        "next_page": next_page})
 
 
 @app.get("/settings", response_class=HTMLResponse)
 async def get_settings(request: Request):
-    rows = obs.read_settings()
-    settings = [obs.Settings(time_loaded=row[0], user=row[1], filename=row[2]) for row in rows]
+    settings = await run_in_threadpool(data.settings)
     return templates.TemplateResponse("settings.html", {"request": request, "settings": settings})
 
 
 @app.get("/calibrations", response_class=HTMLResponse)
 async def get_calibrations(request: Request):
-    rows = obs.read_calibrations()
-    calibrations = [obs.Calibrations(time_loaded=row[0], filename=row[1], beam=row[2]) for row in rows]
+    calibrations = await run_in_threadpool(data.calibrations)
     return templates.TemplateResponse("calibrations.html", {"request": request, "calibrations": calibrations})
 
 
@@ -149,23 +157,13 @@ async def download_html_file(filename: str):
 
 @app.get("/", response_class=HTMLResponse)
 async def get_combined(request: Request):
-    # Fetch data from the calibrations table
-    calibrations = [obs.Calibrations(time_loaded=row[0], filename=row[1], beam=row[2]) 
-                    for row in obs.read_calibrations()]
-
-    # Fetch data from the settings table
-    settings = [obs.Settings(time_loaded=row[0], user=row[1], filename=row[2]) 
-                for row in obs.read_settings()]
-
-    # Fetch data from the sessions table
-    sessions = [obs.Session(time_loaded=row[0], PI_ID=row[1], PI_NAME=row[2], PROJECT_ID=row[3],
-                            SESSION_ID=row[4], SESSION_MODE=row[5], SESSION_DRX_BEAM=row[6],
-                            CONFIG_FILE=row[7], CAL_DIR=row[8], STATUS=row[9]) for row in obs.read_sessions()]
+    # Fetch data from the sessions, settings and calibrations tables
+    sessions, settings, calibrations = await run_in_threadpool(data.combined)
 
     # Calculate the time in MJD and as a date string
-    current_time = time.Time.now()
-    mjd = current_time.mjd
-    date_string = current_time.strftime("%Y-%m-%d %H:%M:%S")
+    unix = get_clock().time()
+    mjd = unix_to_mjd(unix)
+    date_string = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(unix))
 
     # Render the data into three tables
     return templates.TemplateResponse("combined.html", {"request": request, "calibrations": calibrations,
@@ -2,13 +2,11 @@
 
 import os
 import sys
+import io
 import time
 import numpy
-import shutil
+import signal
 import argparse
-import subprocess
-
-from slack_sdk import WebClient
 
 import logging
 logging.basicConfig(level=logging.INFO,
@@ -28,23 +26,13 @@ from mnc.common import LWATime, NCHAN as NCHAN_NATIVE, CLOCK as CLOCK_NATIVE
 from mnc.xengine_beamformer_control import BeamPointingControl
 
 from observing import schedule as ovro_schedule, parsesdf as ovro_parsesdf
-from observing import recmetadata
-
-# Slack setup
-if "SLACK_TOKEN_LWA" in os.environ:
-    cl = WebClient(token=os.environ["SLACK_TOKEN_LWA"])
-else:
-    cl = None
-
+from observing import recmetadata, tracking, pointing, timing, archive, clock, simulate, notify
 
 # Beam tracking update control
 #: Time step to use when determining beam pointings
-_BEAM_UPDATE_STEP = TimeDelta(1, format='sec')
+_BEAM_UPDATE_STEP = tracking.BEAM_UPDATE_STEP
 #: Maximum distance a source can move on the sky before a beam pointing update
-_BEAM_UPDATE_DISTANCE = Angle('0:04:48', unit='deg') # This set based on LWA1's MCS
-                                                     # step size of 0.2 degrees and
-                                                     # scaling that to an aperature
-                                                     # of 250 m.
+_BEAM_UPDATE_DISTANCE = tracking.BEAM_UPDATE_DISTANCE
 
 
 def _tag_to_step(tag):
@@ -61,26 +49,9 @@ def _separation(aa0, aa1):
     """
     Wrapper around the astropy angular_separation function that takes in two
     AzAlt instances and returns the angular distance between them.
-    
-    From:
-      https://github.com/astropy/astropy/blob/main/astropy/coordinates/angle_utilities.py
     """
     
-    lon1, lat1 = aa0.az.rad, aa0.alt.rad
-    lon2, lat2 = aa1.az.rad, aa1.alt.rad
-    
-    sdlon = numpy.sin(lon2 - lon1)
-    cdlon = numpy.cos(lon2 - lon1)
-    slat1 = numpy.sin(lat1)
-    slat2 = numpy.sin(lat2)
-    clat1 = numpy.cos(lat1)
-    clat2 = numpy.cos(lat2)
-    
-    num1 = clat2 * sdlon
-    num2 = clat1 * slat2 - slat1 * clat2 * cdlon
-    denominator = slat1 * slat2 + clat1 * clat2 * cdlon
-    
-    return Angle(numpy.arctan2(numpy.hypot(num1, num2), denominator), unit='rad').to('deg')
+    return Angle(tracking.separation(aa0.az.rad, aa0.alt.rad, aa1.az.rad, aa1.alt.rad), unit='deg')
 
 
 def _get_tracking_updates(obs):
@@ -94,49 +65,7 @@ def _get_tracking_updates(obs):
     # Load the site
     site = EarthLocation.from_geocentric(*ovro.ecef, unit=u.m)
     
-    # Load the start and stop times for this observation
-    start = LWATime(obs['mjd'], obs['mpm']/1000/86400, format='mjd', scale='utc')
-    stop =  LWATime(obs['mjd'], (obs['mpm']+obs['dur'])/1000/86400, format='mjd', scale='utc')
-    
-    # az/alt vs ra/dec step check - If we are in az/alt mode we only need to
-    # point once at the beginning of the observation
-    if obs['azalt']:
-        return [[start.utc.unix, obs['ra'], obs['dec']],]
-        
-    # Load in the target - coordinates or a solar system body
-    target_or_ra = obs['ra']
-    dec = obs['dec']
-    if dec is not None:
-        ra = Angle(target_or_ra, unit='hourangle')
-        dec = Angle(dec, unit='deg')
-        sc = SkyCoord(ra, dec, frame='fk5')
-    else:
-        sc = get_body(target_or_ra.lower(), start+(stop-start)/2, location=site)
-        
-    # Figure out when to update based on how far the sources moves
-    t = start
-    updates = [t,]
-    aa = sc.transform_to(AltAz(obstime=t, location=site))
-    last_azalt = aa
-    while t <= stop:
-        aa = sc.transform_to(AltAz(obstime=t, location=site))
-        if _separation(aa, last_azalt) >= _BEAM_UPDATE_DISTANCE:
-            updates.append(t)
-            last_azalt = aa
-        t += _BEAM_UPDATE_STEP
-    updates.append(stop)
-    
-    # Convert to updates into pointings that happen at t[i] but point to the
-    # position of the source at the midpoint between t[i] and t[i+1].
-    steps = []
-    for i in range(len(updates)-1):
-        t_diff = updates[i+1] - updates[i]
-        t_step = updates[i] + t_diff / 2.0
-        aa = sc.transform_to(AltAz(obstime=t_step, location=site))
-        steps.append([updates[i].utc.unix, aa.az.deg, aa.alt.deg])
-        
-    # Done
-    return steps
+    return tracking.get_tracking_updates(obs, site)
 
 
 def _get_sdf_observer(filename):
@@ -190,6 +119,8 @@ def parse_sdf(filename):
     dictionaries that describe all of pointing and dwell times that we needed.
     
     The dictionaries contain:
+     * 'obs_id' - the SDF observation ID (not set for the steps of a stepped
+                  observation)
      * 'mjd'   - the start time of the observation as an integer MJD
      * 'mpm'   - the start time of the observation as an integer ms past midnight
      * 'dur'   - the observation duration in ms
@@ -215,7 +146,7 @@ def parse_sdf(filename):
                     obs.append(temp)
                 except NameError:
                     pass
-                temp = {'gain1': 6, 'gain2': 6}
+                temp = {'obs_id': int(line.rsplit(None, 1)[1], 10), 'gain1': 6, 'gain2': 6}
             elif line.startswith('OBS_START_MJD'):
                 ## Observation start MJD
                 temp['mjd'] = int(line.rsplit(None, 1)[1], 10)
@@ -401,15 +332,24 @@ def parse_sdf(filename):
     return expanded_obs
 
 
+def _terminate(signum, frame):
+    """ Turn SIGTERM into SystemExit so the metadata tarball is finished on the way out.
+    """
+    
+    raise SystemExit(f"Terminated by signal {signum}")
+
+
 def main(args):
     # Back to DEBUG now that we've imported everything
     logger.setLevel(logging.DEBUG)
+    signal.signal(signal.SIGTERM, _terminate)
     
-    # Setup another log handler that writes to a file as a crude form of metadata
+    # Setup another log handler that keeps a history in memory as a crude form of metadata
     pi_id, pi_name = _get_sdf_observer(args.filename)
     obs_pid, obs_sid = _get_sdf_id(args.filename)
     metadata_name = "%s_%04i.history" % (obs_pid, obs_sid)
-    metadata_handler = logging.FileHandler(metadata_name, mode='w')
+    history = io.StringIO()
+    metadata_handler = logging.StreamHandler(history)
     metadata_handler.setLevel(logging.DEBUG)
     metadata_formatter = logging.Formatter('%(asctime)s [%(levelname)-7s] %(message)s',
                                            datefmt='%Y-%m-%d %H:%M:%S')
@@ -434,74 +374,84 @@ def main(args):
     rec_dur = (rec_stop - rec_start).sec
     logger.info(f"Recording starts at {rec_start.datetime} and continutes for {rec_dur:.3f} s")
     
+    ## Simulation - run against stubs on a clock that starts a minute before the recording
+    if args.simulate:
+        clock.set_clock(clock.VirtualClock(start=rec_start.unix - 60, speed=args.simulate))
+        logger.info(f"Simulating at {args.simulate}x real time")
+        
     ## Validate
-    if rec_start < LWATime.now() + TimeDelta(30, format='sec'):
+    now = LWATime(clock.get_clock().time(), format='unix', scale='utc')
+    if rec_start < now + TimeDelta(30, format='sec'):
         logger.error("Insufficient advanced notice to run this SDF, aborting")
         sys.exit(1)
-    elif rec_start < LWATime.now():
+    elif rec_start < now:
         logger.error("SDF start time appears to be in the past, aborting")
         sys.exit(1)
         
-    # Setup the beamformer stepping
-    for o in obs:
-        o['sdf_steps'] = _get_tracking_updates(o)
-        for step in o['sdf_steps']:
-            logger.debug(f"Beam to az {step[1]:.3f} deg, alt {step[2]:.3f} deg at {step[0]:.3f}")
-            
+    # Start computing the beamformer stepping in the background, so it is ready by the first observation
+    session_mode_name = recmetadata.session_mode_name_from_session(ovro_parsesdf.sdf_to_dict(args.filename)['SESSION'])
+    pointing_fut = pointing.submit(args.filename, session_mode_name, store=not (args.dry_run or args.simulate))
+    
     # Setup the control
     ## Recording
     try:
-        dr = MCSClient()
+        dr = simulate.StubMCSClient() if args.simulate else MCSClient()
     except Exception:
         logger.warn("Cannot create DR control object, will not send DR commands")
         dr = None
     ## Beamforming
     try:
-        bf = BeamPointingControl(obs[0]['beam'])
+        bf = simulate.StubBeamPointingControl(obs[0]['beam']) if args.simulate else BeamPointingControl(obs[0]['beam'])
     except Exception:
         logger.warn("Cannot create beamformer control object, will not send beamformer commands")
         bf = None
         
     # Register
-    ovro_sched = ovro_parsesdf.make_sched(args.filename)
-    ovro_schedule.put_sched(ovro_sched)
-    if cl is not None:
-        response = cl.chat_postMessage(channel="#observing",
-                                       text=f"{obs_pid} Session {obs_sid} submitted for {pi_name} using {os.path.basename(__file__)}",
-                                       icon_emoji = ":robot_face::")
+    if not args.simulate:
+        ovro_sched = ovro_parsesdf.make_sched(args.filename)
+        ovro_schedule.put_sched(ovro_sched)
+        notify.notify(f"{obs_pid} Session {obs_sid} submitted for {pi_name} using {os.path.basename(__file__)}")
     
-    # Recording
-    ## Wait for the right time
-    logger.info("Waiting for the recording time...")
-    while LWATime.now() < rec_start - TimeDelta(15, format='sec'):
-        time.sleep(0.01)
+    # Metadata tarball that contains the SDF, recording metadata, history and
+    # system configuration, written as they become available
+    tarball = None
+    if not args.dry_run and not args.simulate:
+        tarball = archive.open_archive("%s_%04i" % (obs_pid, obs_sid), compression=args.compression,
+                                       compresslevel=args.compresslevel)
+        tarball.add_file("%s_%04i.txt" % (obs_pid, obs_sid), args.filename)
+        tarball.flush()
         
-    ## Schedule it
-    logger.info("Sending recorder command")
-    if dr is not None and not args.dry_run:
-        if obs[0]['beam'] == 1 and obs[0]['time_avg'] == 0:
-            status = dr.send_command(f"drt{obs[0]['beam']}", 'record',
-                                     beam=obs[0]['beam'],
-                                     start_mjd=obs[0]['mjd'],
-                                     start_mpm=obs[0]['mpm'],
-                                     duration_ms=int(rec_dur*1000))
-        else:
-            status = dr.send_command(f"dr{obs[0]['beam']}", 'record',
-                                     start_mjd=obs[0]['mjd'],
-                                     start_mpm=obs[0]['mpm'],
-                                     duration_ms=int(rec_dur*1000),
-                                     time_avg=obs[0]['time_avg'],
-                                     stokes_mode=obs[0]['stokes_mode'])
-        if status[0]:
-            logger.info("Record command succeeded: %s" % str(status[1:]))
-            try:
-                os.unlink("%s_%04i_metadata.txt" % (obs_pid, obs_sid))
-            except OSError:
-                pass
-            with open("%s_%04i_metadata.txt" % (obs_pid, obs_sid), 'w') as fh:
-                if status[1]['status'] == 'success':
-                    fh.write("  1 [%s] ['%s']  0 [UNK]\n" % (os.path.basename(status[1]['response']['filename']),
-                                                             os.path.dirname(status[1]['response']['filename'])))
+    try:
+        # Recording
+        ## Wait for the right time
+        logger.info("Waiting for the recording time...")
+        err = timing.wait_until(rec_start - TimeDelta(15, format='sec'))
+        logger.debug(f"Woke up {err*1000:.3f} ms after the recording command time")
+        
+        ## Schedule it
+        logger.info("Sending recorder command")
+        if dr is not None and not args.dry_run:
+            if obs[0]['beam'] == 1 and obs[0]['time_avg'] == 0:
+                status = dr.send_command(f"drt{obs[0]['beam']}", 'record',
+                                         beam=obs[0]['beam'],
+                                         start_mjd=obs[0]['mjd'],
+                                         start_mpm=obs[0]['mpm'],
+                                         duration_ms=int(rec_dur*1000))
+            else:
+                status = dr.send_command(f"dr{obs[0]['beam']}", 'record',
+                                         start_mjd=obs[0]['mjd'],
+                                         start_mpm=obs[0]['mpm'],
+                                         duration_ms=int(rec_dur*1000),
+                                         time_avg=obs[0]['time_avg'],
+                                         stokes_mode=obs[0]['stokes_mode'])
+            if status[0]:
+                logger.info("Record command succeeded: %s" % str(status[1:]))
+                if status[1]['status'] == 'success' and tarball is not None:
+                    metadata_txt = "  1 [%s] ['%s']  0 [UNK]\n" % (os.path.basename(status[1]['response']['filename']),
+                                                                   os.path.dirname(status[1]['response']['filename']))
+                    tarball.add_bytes("%s_%04i_metadata.txt" % (obs_pid, obs_sid), metadata_txt)
+                    tarball.flush()
+                if status[1]['status'] == 'success' and not args.simulate:
                     try:
                         sdf_entry = ovro_parsesdf.sdf_to_dict(args.filename)
                         first_obs_id = next(iter(sdf_entry['OBSERVATIONS'].values()))['OBS_ID']
@@ -518,114 +468,114 @@ def main(args):
                         )
                     except Exception as exc:
                         logger.warning("Could not write recorder sidecar metadata: %s", exc)
-        else:
-            logger.error("Record command failed: %s", str(status[1]))
+            else:
+                logger.error("Record command failed: %s", str(status[1]))
             
-    # Beamforming/tracking
-    ## Wait for the right time
-    logger.info("Waiting for the start of the first observation...")
-    while LWATime.now() + TimeDelta(1, format='sec') < start:
-        time.sleep(0.01)
-        
-    ## Iterate through the observations
-    last_freq1 = 0
-    last_filter1 = -1
-    last_gain1 = -1
-    last_freq2 = 0
-    last_filter2 = -1
-    last_gain2 = -1
-    for i,o in enumerate(obs):
-        if obs[0]['beam'] == 1 and obs[0]['time_avg'] == 0:
-            if o['freq1'] != last_freq1 \
-               or o['filter'] != last_filter1 \
-               or o['gain1'] != last_gain1:
-                logger.info(f"Moving tuning 1 to {(o['freq1']/1e6):.3f} MHz, filter {o['filter']} at gain {o['gain1']}")
-                if dr is not None and not args.dry_run:
-                    dr.send_command(f"drt{obs[0]['beam']}", 'drx',
-                                    beam=obs[0]['beam'],
-                                    tuning=1,
-                                    central_freq=_freq_to_freq(o['freq1']),
-                                    filter=o['filter'],
-                                    gain=o['gain1'])
-                last_freq1 = o['freq1']
-                last_filter1 = o['filter']
-                last_gain1 = o['gain1']
-            if o['freq2'] != last_freq2 \
-               or o['filter'] != last_filter2 \
-               or o['gain2'] != last_gain2:
-                logger.info(f"Moving tuning 2 to {(o['freq2']/1e6):.3f} MHz, filter {o['filter']} at gain {o['gain2']}")
-                if dr is not None and not args.dry_run:
-                    dr.send_command(f"drt{obs[0]['beam']}", 'drx',
-                                    beam=obs[0]['beam'],
-                                    tuning=2,
-                                    central_freq=_freq_to_freq(o['freq2']),
-                                    filter=o['filter'],
-                                    gain=o['gain2'])
-                last_freq2 = o['freq2']
-                last_filter2 = o['filter']
-                last_gain2 = o['gain2']
-                
-        name = o['ra']
-        if o['dec'] is not None:
-            if not o['azalt']:
-                name = f"{o['ra']} hr, {o['dec']} deg"
+        # Setup the beamformer stepping, using the tables computed in the background if possible
+        try:
+            pointing_tables = pointing_fut.result()
+        except Exception:
+            pointing_tables = {}   # logged by pointing; computed below instead
+        for o in obs:
+            o['sdf_steps'] = None if o['azalt'] else pointing_tables.get(o.get('obs_id'))
+            if o['sdf_steps'] is None:
+                o['sdf_steps'] = _get_tracking_updates(o)
             else:
-                name = f"{o['ra']} deg az, {o['dec']} deg el"
-        logger.info(f"Tracking pointing #{i+1} ('{name}') for {o['dur']/1000.0:.3f} s")
-        for step in o['sdf_steps']:
-            while time.time() + 1 < step[0]:
-                time.sleep(0.01)
-            if bf is not None and not args.dry_run:
-                bf.set_beam_pointing(step[1], step[2], degrees=True, load_time=step[0])
+                logger.debug("Loaded precomputed beam pointings")
+            for step in o['sdf_steps']:
+                logger.debug(f"Beam to az {step[1]:.3f} deg, alt {step[2]:.3f} deg at {step[0]:.3f}")
                 
-    # Close it out
-    logger.info("Finished with the observations, waiting for the recording to finish...")
-    while LWATime.now() < rec_stop:
-        time.sleep(0.01)
+        # Beamforming/tracking
+        ## Wait for the right time
+        logger.info("Waiting for the start of the first observation...")
+        err = timing.wait_until(start - TimeDelta(1, format='sec'))
+        logger.debug(f"Woke up {err*1000:.3f} ms after the observation setup time")
         
-    # Write a metadata tarball that contains the history and the SDF
-    if not args.dry_run:
-        ## History and SDF
-        sdf_name = "%s_%04i.txt" % (obs_pid, obs_sid)
-        sdf_copied = False
-        if os.path.basename(args.filename) != sdf_name:
-            shutil.copy(args.filename, sdf_name)
-            sdf_copied = True
-        to_include = [sdf_name, '%s_%04i.history' % (obs_pid, obs_sid)]
-        ## Data file metdata
-        if os.path.exists("%s_%04i_metadata.txt" % (obs_pid, obs_sid)):
-            to_include.append("%s_%04i_metadata.txt" % (obs_pid, obs_sid))
-        ## Try to also save the system configuration information
-        try:
-            os.unlink('system.config')
-        except OSError:
-            pass
-        if dr is not None:
-            try:
-                config, _ = dr.client.get('/cfg/system')
-                with open('system.config', 'wb') as fh:
-                    fh.write(config)
-                to_include.append('system.config')
-            except Exception as e:
-                logger.warning("Could not save system configuration: %s", str(e))
+        ## Iterate through the observations
+        last_freq1 = 0
+        last_filter1 = -1
+        last_gain1 = -1
+        last_freq2 = 0
+        last_filter2 = -1
+        last_gain2 = -1
+        for i,o in enumerate(obs):
+            if obs[0]['beam'] == 1 and obs[0]['time_avg'] == 0:
+                if o['freq1'] != last_freq1 \
+                   or o['filter'] != last_filter1 \
+                   or o['gain1'] != last_gain1:
+                    logger.info(f"Moving tuning 1 to {(o['freq1']/1e6):.3f} MHz, filter {o['filter']} at gain {o['gain1']}")
+                    if dr is not None and not args.dry_run:
+                        dr.send_command(f"drt{obs[0]['beam']}", 'drx',
+                                        beam=obs[0]['beam'],
+                                        tuning=1,
+                                        central_freq=_freq_to_freq(o['freq1']),
+                                        filter=o['filter'],
+                                        gain=o['gain1'])
+                    last_freq1 = o['freq1']
+                    last_filter1 = o['filter']
+                    last_gain1 = o['gain1']
+                if o['freq2'] != last_freq2 \
+                   or o['filter'] != last_filter2 \
+                   or o['gain2'] != last_gain2:
+                    logger.info(f"Moving tuning 2 to {(o['freq2']/1e6):.3f} MHz, filter {o['filter']} at gain {o['gain2']}")
+                    if dr is not None and not args.dry_run:
+                        dr.send_command(f"drt{obs[0]['beam']}", 'drx',
+                                        beam=obs[0]['beam'],
+                                        tuning=2,
+                                        central_freq=_freq_to_freq(o['freq2']),
+                                        filter=o['filter'],
+                                        gain=o['gain2'])
+                    last_freq2 = o['freq2']
+                    last_filter2 = o['filter']
+                    last_gain2 = o['gain2']
                 
-        ## Save
-        cmd = ['tar', 'czf', '%s_%04i.tgz' % (obs_pid, obs_sid)]
-        cmd.extend(to_include)
-        subprocess.check_call(cmd)
-        
-        ## Cleanup
-        if sdf_copied:
-            try:
-                os.unlink(sdf_name)
-            except OSError:
-                pass
-        for name in cmd[4:]:
-            try:
-                os.unlink(name)
-            except OSError:
-                pass
+            name = o['ra']
+            if o['dec'] is not None:
+                if not o['azalt']:
+                    name = f"{o['ra']} hr, {o['dec']} deg"
+                else:
+                    name = f"{o['ra']} deg az, {o['dec']} deg el"
+            logger.info(f"Tracking pointing #{i+1} ('{name}') for {o['dur']/1000.0:.3f} s")
+            for step in o['sdf_steps']:
+                timing.wait_until(step[0] - 1)
+                if bf is not None and not args.dry_run:
+                    bf.set_beam_pointing(step[1], step[2], degrees=True, load_time=step[0])
                 
+        # Close it out
+        logger.info("Finished with the observations, waiting for the recording to finish...")
+        timing.wait_until(rec_stop)
+    except BaseException as exc:
+        logger.error(f"Session interrupted: {type(exc).__name__} {str(exc)}")
+        raise
+    finally:
+        if args.simulate:
+            clock.set_clock()
+            
+        # Finish the metadata tarball, also if the session was interrupted
+        if tarball is not None:
+            try:
+                ## Try to also save the system configuration information
+                if dr is not None:
+                    try:
+                        config, _ = dr.client.get('/cfg/system')
+                        tarball.add_bytes('system.config', config)
+                    except Exception as e:
+                        logger.warning("Could not save system configuration: %s", str(e))
+                        
+                ## History
+                metadata_handler.flush()
+                tarball.add_bytes(metadata_name, history.getvalue())
+            finally:
+                tarball.close()
+            
+    if args.simulate:
+        dr_calls = dr.calls if dr is not None else []
+        bf_calls = bf.calls if bf is not None else []
+        leads = [kw['load_time'] - tt for tt, _, _, kw in bf_calls]
+        logger.info(f"Sent {len(dr_calls)} recorder and {len(bf_calls)} beamformer command(s)")
+        if leads:
+            logger.info(f"Beam pointings sent {min(leads):.3f} s to {max(leads):.3f} s before their load time")
+        
     logger.info("Done")
 
 
@@ -638,5 +588,11 @@ if __name__ == '__main__':
                         help='filename to parse and run')
     parser.add_argument('-n', '--dry-run', action='store_true',
                         help='parse and print commands but do not send them')
+    parser.add_argument('-z', '--compression', type=str, default='gz', choices=list(archive.EXTENSIONS),
+                        help='compression for the metadata tarball (zst requires zstandard)')
+    parser.add_argument('--compresslevel', type=int, default=6,
+                        help='compression level for the metadata tarball (lower is faster)')
+    parser.add_argument('--simulate', type=float, default=0, metavar='SPEED',
+                        help='run against stub controls on a virtual clock this many times faster than real time')
     args = parser.parse_args()
     main(args)
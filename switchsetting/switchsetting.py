@@ -4,13 +4,12 @@ import logging
 import subprocess
 
 from astropy.coordinates import SkyCoord, EarthLocation, ICRS, AltAz
-from astropy.coordinates import solar_system_ephemeris, EarthLocation
-from astropy.coordinates import get_body
 from astropy.time import Time, TimeDelta
 from astropy import units as u
 import numpy as np
 
 from mnc.control import settings
+from observing import ephemeris
 
 OVRO_LWA_LOCATION = EarthLocation(lat=37.2398 * u.deg, lon=-118.282 * u.deg, height=1216 * u.m)
 
@@ -57,8 +56,7 @@ if __name__ == '__main__':
     altaz_frame = AltAz(location=OVRO_LWA_LOCATION)
     # Calculate Altitude for the next 16 hours at 10 min cadence.
     times = Time.now() + TimeDelta((10 * np.arange(16 * 60 // 10)) * u.minute)
-    with solar_system_ephemeris.set('builtin'):
-        sun = get_body('sun', times, OVRO_LWA_LOCATION)
+    sun = ephemeris.get_ephemeris().position('sun', times)
     sun_coords = sun.transform_to(altaz_frame)
     current_sun_alt = sun_coords.alt[0].to(u.deg)
     if current_sun_alt < ALT_THRESHOLD:
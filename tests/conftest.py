@@ -0,0 +1,15 @@
+import pytest
+from pandas import DataFrame
+
+
+@pytest.fixture
+def make_session():
+    """ Return a function that builds the schedule rows of a session with one command per start time.
+    """
+
+    def make(session_id, times, mode='POWER3'):
+        return DataFrame({'command': [f'cmd{i}' for i in range(len(times))],
+                          'session_mode_name': f'{session_id}_{mode}',
+                          'session_id': str(session_id)}, index=times)
+
+    return make
@@ -0,0 +1,42 @@
+import os
+import zlib
+import tarfile
+import pytest
+from observing import archive
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+def test_gzip_archive(tmp_path):
+    path = str(tmp_path / 'LWA_0001.tgz')
+    with archive.MetadataArchive(path, compresslevel=1) as tarball:
+        tarball.add_file('LWA_0001.txt', os.path.join(_install_dir, 'test.sdf'))
+        tarball.add_bytes('LWA_0001.history', 'line 1\nline 2\n')
+        tarball.add_bytes('system.config', b'\x00\x01')
+
+    with tarfile.open(path, 'r:gz') as tf:
+        assert tf.getnames() == ['LWA_0001.txt', 'LWA_0001.history', 'system.config']
+        assert tf.extractfile('LWA_0001.history').read() == b'line 1\nline 2\n'
+        with open(os.path.join(_install_dir, 'test.sdf'), 'rb') as fh:
+            assert tf.extractfile('LWA_0001.txt').read() == fh.read()
+    assert os.listdir(str(tmp_path)) == ['LWA_0001.tgz']
+
+
+def test_flush_makes_partial_archive_readable(tmp_path):
+    path = str(tmp_path / 'LWA_0002.tgz')
+    tarball = archive.MetadataArchive(path)
+    tarball.add_bytes('first.txt', 'x'*10000)
+    tarball.flush()
+    with open(path, 'rb') as fh:
+        data = zlib.decompressobj(31).decompress(fh.read())
+    assert data[:9] == b'first.txt' and b'x'*10000 in data
+    tarball.close()
+
+
+def test_open_archive(tmp_path):
+    tarball = archive.open_archive(str(tmp_path / 'LWA_0003'), compression='zst')
+    tarball.add_bytes('a', 'b')
+    tarball.close()
+    assert tarball.path.endswith(archive.EXTENSIONS[tarball.compression])
+    with pytest.raises(ValueError):
+        archive.MetadataArchive(str(tmp_path / 'x'), compression='bz2')
@@ -0,0 +1,89 @@
+import time
+import pytest
+from astropy.time import Time
+from observing import clock, timing
+
+
+@pytest.fixture
+def virtual():
+    vc = clock.VirtualClock(start=1.7e9, speed=1000.)
+    previous = clock.set_clock(vc)
+    yield vc
+    clock.set_clock(previous)
+
+
+def test_system_clock():
+    cc = clock.SystemClock()
+    assert cc.time() == pytest.approx(time.time(), abs=0.01)
+    assert cc.mjd() == pytest.approx(Time.now().mjd, abs=1e-6)
+
+
+def test_virtual_clock_runs_fast(virtual):
+    assert virtual.time() == pytest.approx(1.7e9, abs=10)
+    t0 = time.monotonic()
+    virtual.sleep(20.)
+    assert time.monotonic() - t0 < 0.5
+    assert virtual.time() >= 1.7e9 + 20
+
+
+def test_wait_under_virtual_clock(virtual):
+    t0 = time.monotonic()
+    target = virtual.time() + 60
+    err = timing.wait_until(target)
+    assert time.monotonic() - t0 < 1
+    assert err >= 0
+    assert virtual.time() >= target
+    timing.wait_until_mjd(virtual.mjd() + 30/86400)
+
+
+def test_set_clock_restores():
+    previous = clock.set_clock(clock.VirtualClock(speed=10))
+    assert isinstance(clock.get_clock(), clock.VirtualClock)
+    clock.set_clock(previous)
+    assert clock.get_clock() is previous
+
+
+def test_mjd_matches_astropy():
+    unix = time.time()
+    tt = Time(unix, format='unix')
+    assert clock.unix_to_mjd(unix) == pytest.approx(tt.mjd, abs=1e-9)
+    assert clock.unix_to_mjd(unix, scale='tai') == pytest.approx(tt.tai.mjd, abs=1e-9)
+    assert clock.now_mjd() == pytest.approx(Time.now().mjd, abs=1e-6)
+
+
+def test_tai_minus_utc():
+    assert clock.tai_minus_utc(57000.) == 35
+    assert clock.tai_minus_utc(57754.) == 37
+    assert clock.tai_minus_utc(60000.) == 37
+    with pytest.raises(ValueError):
+        clock.unix_to_mjd(0., scale='tt')
+
+
+def test_virtual_clock_advance(virtual):
+    t0 = virtual.time()
+    virtual.advance(86400.)
+    assert virtual.time() == pytest.approx(t0 + 86400, abs=10)
+    virtual.advance(-10.)
+    assert virtual.time() >= t0 + 86400
+
+
+def test_leap_seconds_without_erfa(monkeypatch):
+    def no_erfa(erfa):
+        raise AttributeError('no leap_seconds')   # e.g., neither pyerfa nor astropy._erfa has the table
+
+    monkeypatch.setattr(clock, '_erfa_table', no_erfa)
+    monkeypatch.setattr(clock, '_leap_mjds', None)
+    monkeypatch.setattr(clock, '_leap_offsets', None)
+    assert clock.tai_minus_utc(57000.) == 35.
+    assert clock.tai_minus_utc(60000.) == 37.
+
+
+def test_leap_seconds_fallback_warns(monkeypatch, caplog):
+    def fail():
+        raise OSError('no table')
+
+    monkeypatch.setattr(clock, '_read_leap_seconds', fail)
+    monkeypatch.setattr(clock, '_leap_mjds', None)
+    monkeypatch.setattr(clock, '_leap_offsets', None)
+    assert clock.tai_minus_utc(60000.) == clock.TAI_UTC
+    assert 'leap second table' in caplog.text
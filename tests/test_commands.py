@@ -0,0 +1,44 @@
+import pickle
+import pytest
+from pandas import DataFrame
+from observing import commands, parsesdf, schedule
+from observing.clock import now_mjd
+
+
+def test_compile_and_cache():
+    cmd = commands.compile_command("x = 1")
+    assert cmd == "x = 1"
+    assert commands.compile_command("x = 1") is cmd
+    assert commands.compile_command(cmd) is cmd
+
+    with pytest.raises(SyntaxError):
+        commands.compile_command("x = (")
+
+
+def test_pickle_keeps_code():
+    cmd = commands.compile_command("y = x + 1")
+    cmd2 = pickle.loads(pickle.dumps(cmd))
+    assert isinstance(cmd2, commands.Command)
+    namespace = {'x': 1}
+    cmd2.run(namespace)
+    assert namespace['y'] == 2
+
+
+def test_make_sched_compiles():
+    sched = parsesdf.make_sched('tests/test.sdf')
+    assert all(isinstance(cmd, commands.Command) for cmd in sched.command)
+    assert parsesdf.make_command(60000.5, "from mnc import settings; settings.update(") is None
+
+
+def test_runrow_session_namespace(caplog):
+    mjd = now_mjd()
+    rows = DataFrame({'command': ["import math; total = []", "total.append(math.pi)",
+                                  "assert total == [math.pi], 'namespace not shared'"],
+                      'session_mode_name': ['1_POWER2']*3, 'session_id': [1]*3},
+                     index=[mjd - 3e-5, mjd - 2e-5, mjd - 1e-5])
+    commands.compile_frame(rows)
+    summary = schedule.runrow(rows, update_status=False)
+    assert summary['ncommands'] == 3
+    assert 'namespace not shared' not in caplog.text
+    assert 'is not defined' not in caplog.text
+    assert 'total' not in schedule.__dict__
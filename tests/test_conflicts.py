@@ -0,0 +1,116 @@
+import pytest
+from observing import conflicts
+from observing.conflicts import IntervalIndex, ConflictIndex
+
+
+def test_overlap_endpoints():
+    index = IntervalIndex()
+    index.add('1_POWER3', 10., 20.)
+    assert index.first_conflict(15., 25.) == '1_POWER3'
+    assert index.first_conflict(5., 10.) == '1_POWER3'
+    assert index.first_conflict(21., 30.) is None
+
+
+def test_new_contains_existing():
+    index = IntervalIndex()
+    index.add('1_POWER3', 10., 20.)
+    assert index.first_conflict(5., 25.) == '1_POWER3'
+    assert index.contained(5., 25.) == ['1_POWER3']
+    assert index.containing(5., 25.) == []
+
+
+def test_existing_contains_new():
+    index = IntervalIndex()
+    index.add('1_POWER3', 10., 20.)
+    assert index.containing(12., 18.) == ['1_POWER3']
+    assert index.overlapping(12., 18.) == ['1_POWER3']
+
+
+def test_first_conflict_is_earliest():
+    index = IntervalIndex()
+    index.add('2_POWER3', 30., 40.)
+    index.add('1_POWER3', 10., 20.)
+    index.add('3_POWER3', 50., 60.)
+    assert index.first_conflict(15., 55.) == '1_POWER3'
+    assert index.overlapping(15., 55.) == ['1_POWER3', '2_POWER3', '3_POWER3']
+
+
+def test_long_interval_found_from_far_start():
+    index = IntervalIndex()
+    index.add('1_SLOW', 0., 100.)
+    index.add('2_SLOW', 101., 102.)
+    assert index.first_conflict(90., 91.) == '1_SLOW'
+
+
+def test_window_shrinks_after_long_interval_removed():
+    index = IntervalIndex()
+    index.add('1_SLOW', 0., 100.)
+    for i in range(2, 10):
+        index.add(f'{i}_SLOW', 100. + i, 100.5 + i)
+    assert index._maxdur == 100.
+    index.prune(101.)
+    assert index._maxdur == 0.5
+    assert [name for _, _, name in index._candidates(108.2, 108.3)] == ['8_SLOW']
+    index.remove('9_SLOW')
+    index.remove('8_SLOW')
+    assert index._maxdur == 0.5
+
+
+def test_remove_and_prune():
+    index = IntervalIndex()
+    index.add('1_POWER3', 10., 20.)
+    index.add('2_POWER3', 30., 40.)
+    assert index.remove('1_POWER3')
+    assert not index.remove('1_POWER3')
+    assert index.first_conflict(10., 20.) is None
+    assert index.prune(41.) == ['2_POWER3']
+    assert len(index) == 0
+
+
+def test_conflict_index_modes():
+    scheduled = {'POWER3': {'1_POWER3': [10., 20.]}}
+    active = {'FAST': {'2_FAST': [0., 100.]}}
+    index = ConflictIndex.from_dicts(scheduled, active)
+    assert index.find_conflict({'POWER4': {'3_POWER4': [10., 20.]}}) is None
+    assert index.find_conflict({'POWER3': {'3_POWER3': [5., 25.]}}) == ('3_POWER3', '1_POWER3')
+    assert index.find_conflict({'FAST': {'3_FAST': [50., 60.]}}) == ('3_FAST', '2_FAST')
+
+    index.remove('2_FAST')
+    assert index.find_conflict({'FAST': {'3_FAST': [50., 60.]}}) is None
+    assert index.to_dict() == scheduled
+
+
+def test_conflict_index_prune():
+    index = ConflictIndex.from_dicts({'POWER3': {'1_POWER3': [10., 20.]}, 'FAST': {'2_FAST': [0., 5.]}})
+    assert index.prune(10.) == ['2_FAST']
+    assert '2_FAST' not in index
+    assert '1_POWER3' in index
+
+
+def test_session_resources():
+    assert conflicts.session_resources('1_POWER3') == {'dr3'}
+    assert conflicts.session_resources('2_VOLT1') == {'dr1', 'drt1'}
+    assert conflicts.session_resources('3_FAST') == {'drvf'}
+    assert conflicts.session_resources('4_settings') == set()
+    assert not conflicts.session_resources('2_VOLT1') & conflicts.session_resources('5_VOLT2')
+
+
+def test_shared_resource_conflict():
+    index = conflicts.ConflictIndex.from_dicts({'POWER1': {'1_POWER1': [60000.0, 60000.1]},
+                                                'FAST': {'2_FAST': [60000.0, 60000.1]},
+                                                'settings': {'3_settings': [60000.05, 60000.05]}})
+    assert index.find_conflict({'VOLT1': {'4_VOLT1': [60000.05, 60000.2]}}) == ('4_VOLT1', '1_POWER1')
+    assert index.find_conflict({'POWER2': {'5_POWER2': [60000.05, 60000.2]}}) is None
+    assert index.find_conflict({'POWER1': {'6_POWER1': [60000.2, 60000.3]}}) is None
+    assert index.sharing_modes('settings') == []
+
+
+def test_voltraw_conflicts():
+    assert conflicts.mode_resources('VOLTRAW1') == {'dr1', 'drt1'}
+
+    index = conflicts.ConflictIndex.from_dicts({'POWER1': {'1_POWER1': [60000.0, 60000.1]}})
+    assert index.find_conflict({'VOLTRAW1': {'2_VOLTRAW1': [60000.05, 60000.2]}}) == ('2_VOLTRAW1', '1_POWER1')
+
+    index = conflicts.ConflictIndex.from_dicts({'VOLT1': {'1_VOLT1': [60000.0, 60000.1]}})
+    assert index.find_conflict({'VOLTRAW1': {'2_VOLTRAW1': [60000.05, 60000.2]}}) == ('2_VOLTRAW1', '1_VOLT1')
+    assert index.find_conflict({'VOLTRAW1': {'3_VOLTRAW1': [60000.2, 60000.3]}}) is None
@@ -0,0 +1,68 @@
+import os
+import pytest
+from observing import controllers
+
+
+class FakeController:
+    built = 0
+
+    def __init__(self, config_file):
+        FakeController.built += 1
+        self.config_file = config_file
+        self.conf = {'xengines': {'cal_directory': '/default'}}
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    fn = tmp_path / 'config.yaml'
+    fn.write_text('xengines: {}\n')
+    FakeController.built = 0
+    controllers.invalidate()
+    yield str(fn)
+    controllers.invalidate()
+
+
+def test_controller_reused(config_file):
+    con1 = controllers.get_controller(config_file, factory=FakeController)
+    con2 = controllers.get_controller(config_file, factory=FakeController)
+    assert con1 is con2
+    assert FakeController.built == 1
+    assert controllers.is_warm(config_file)
+
+
+def test_conf_restored_on_checkout(config_file):
+    con = controllers.get_controller(config_file, factory=FakeController)
+    con.conf['xengines']['cal_directory'] = '/session'
+    con = controllers.get_controller(config_file, factory=FakeController)
+    assert con.conf['xengines']['cal_directory'] == '/default'
+
+
+def test_rebuilt_on_config_change(config_file):
+    controllers.get_controller(config_file, factory=FakeController)
+    os.utime(config_file, (0, 0))
+    assert not controllers.is_warm(config_file)
+    controllers.get_controller(config_file, factory=FakeController)
+    assert FakeController.built == 2
+
+
+def test_rebuilt_on_failed_check(config_file):
+    controllers.get_controller(config_file, factory=FakeController)
+    controllers.get_controller(config_file, factory=FakeController, check=lambda con: False)
+    assert FakeController.built == 2
+
+
+def test_invalidate(config_file):
+    controllers.get_controller(config_file, factory=FakeController)
+    controllers.invalidate(config_file)
+    assert not controllers.is_warm(config_file)
+
+
+def test_set_factory(config_file):
+    previous = controllers.set_factory(FakeController)
+    try:
+        con = controllers.get_controller(config_file)
+        assert isinstance(con, FakeController)
+        assert FakeController.built == 1
+    finally:
+        assert controllers.set_factory(previous) is FakeController
+    assert not controllers.is_warm(config_file)
@@ -0,0 +1,63 @@
+import pytest
+from observing import obsstate, dashboard
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'obsstate.db')
+    obsstate.create_db(path)
+    yield path
+    obsstate.close_connections()
+
+
+def add_session(path, sid, status='scheduled'):
+    with obsstate.connection_factory(path) as conn:
+        conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (60000. + sid, '1', 'pi', '0', sid, 'POWER', '2', '', '', status))
+
+
+def test_rows(db):
+    add_session(db, 1)
+    with obsstate.connection_factory(db) as conn:
+        conn.execute("INSERT INTO settings VALUES (?, ?, ?)", (60000., 'user', 'settings.mat'))
+        conn.execute("INSERT INTO calibrations VALUES (?, ?, ?)", (60000., 'cal.tgz', '1'))
+
+    data = dashboard.DashboardData(path=db)
+    sessions, settings, calibrations = data.combined()
+    assert sessions[0].SESSION_ID == 1 and sessions[0].STATUS == 'scheduled'
+    assert settings[0].filename == 'settings.mat'
+    assert calibrations[0].beam == '1'
+    assert set(sessions[0]._fields) == set(obsstate.Session.__annotations__)
+
+
+def test_cached_until_write(db):
+    add_session(db, 1)
+    data = dashboard.DashboardData(path=db, ttl=60)
+    assert len(data.sessions()) == 1
+    assert len(data.sessions()) == 1
+    assert data.nqueries == 1
+
+    add_session(db, 2)
+    assert len(data.sessions()) == 2
+    assert data.nqueries == 2
+
+
+def test_ttl(db):
+    add_session(db, 1)
+    data = dashboard.DashboardData(path=db, ttl=0)
+    data.sessions()
+    data.sessions()
+    assert data.nqueries == 2
+
+
+def test_query_sessions(db):
+    for sid in range(5):
+        add_session(db, sid, status='completed' if sid % 2 else 'scheduled')
+    data = dashboard.DashboardData(path=db, ttl=60)
+
+    sessions, cursor = data.query_sessions(status='completed', limit=10)
+    assert [ss.SESSION_ID for ss in sessions] == [3, 1]
+    assert cursor is None
+    data.query_sessions(status='completed', limit=10)
+    data.query_sessions(status=['completed'], limit=10)
+    assert data.nqueries == 2
@@ -0,0 +1,30 @@
+import numpy
+import pytest
+from astropy.time import Time
+from astropy.coordinates import get_body
+from observing.ephemeris import Ephemeris
+
+
+@pytest.mark.parametrize('body', ['sun', 'moon', 'jupiter'])
+def test_matches_get_body(body):
+    ephem = Ephemeris()
+    mjd = 60000 + numpy.linspace(0.01, 1.99, 17)
+    pos = ephem.position(body, Time(mjd, format='mjd', scale='utc'))
+    ref = get_body(body, Time(mjd, format='mjd', scale='utc'))
+    assert pos.separation(ref).arcsec.max() < 0.5
+    ra, dec = ephem.radec(body, mjd[0])
+    assert ra == pytest.approx(ref[0].ra.deg, abs=1e-4) and dec == pytest.approx(ref[0].dec.deg, abs=1e-4)
+
+
+def test_disk_cache(tmp_path):
+    ephem = Ephemeris(cache_dir=str(tmp_path))
+    ra, dec = ephem.radec('Sun', 60000.5)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    ephem2 = Ephemeris(cache_dir=str(tmp_path))
+    assert ephem2.radec('sun', 60000.5) == (ra, dec)
+
+
+def test_unknown_body():
+    with pytest.raises(ValueError):
+        Ephemeris().table('pluto', 60000)
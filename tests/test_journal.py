@@ -0,0 +1,66 @@
+import os
+from observing.journal import ScheduleJournal
+
+
+def test_replay(tmp_path, make_session):
+    path = str(tmp_path / 'schedule.journal')
+    journal = ScheduleJournal(path, fsync=False)
+    journal.add(make_session(1, [99991.0, 99992.0]))
+    journal.add(make_session(2, [99993.0]))
+    journal.add(make_session(3, [99994.0], mode='FAST'))
+    journal.cancel(2)
+    journal.dispatch(make_session(1, [99991.0, 99992.0]))
+    journal.close()
+
+    queue, dispatched = ScheduleJournal(path).replay()
+    assert queue.session_ids() == ['3']
+    assert queue.get(3).command.tolist() == ['cmd0']
+    assert list(dispatched) == ['1']
+    assert dispatched['1'].index.tolist() == [99991.0, 99992.0]
+
+
+def test_complete_and_reset(tmp_path, make_session):
+    path = str(tmp_path / 'schedule.journal')
+    journal = ScheduleJournal(path, fsync=False)
+    journal.add(make_session(1, [99991.0]))
+    journal.dispatch(make_session(1, [99991.0]))
+    journal.complete(1)
+    journal.add(make_session(2, [99993.0]))
+    journal.reset()
+    journal.close()
+
+    queue, dispatched = ScheduleJournal(path).replay()
+    assert len(queue) == 0 and not dispatched
+
+
+def test_compact(tmp_path, make_session):
+    path = str(tmp_path / 'schedule.journal')
+    journal = ScheduleJournal(path, compact_every=3, fsync=False)
+    for i in range(3):
+        journal.add(make_session(i, [99990.0 + i]))
+    assert journal.needs_compaction
+    queue, _ = ScheduleJournal(path).replay()
+    journal.compact(queue)
+    assert not journal.needs_compaction
+    assert os.path.getsize(path) == 0
+    journal.add(make_session(5, [99995.0]))
+    journal.close()
+
+    queue, _ = ScheduleJournal(path).replay()
+    assert queue.session_ids() == ['0', '1', '2', '5']
+
+
+def test_replay_after_crash_during_compaction(tmp_path, make_session):
+    path = str(tmp_path / 'schedule.journal')
+    journal = ScheduleJournal(path, fsync=False)
+    journal.add(make_session(1, [99991.0, 99992.0]))
+    queue, _ = ScheduleJournal(path).replay()
+    # snapshot written but journal not truncated, and an incomplete last record
+    journal._file.close()
+    journal._file = None
+    saved = open(path).read()
+    journal.compact(queue)
+    with open(path, 'w') as ff:
+        ff.write(saved + '{"seq": 2, "op": "ad')
+    queue, _ = ScheduleJournal(path).replay()
+    assert len(queue) == 2
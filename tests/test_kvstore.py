@@ -0,0 +1,69 @@
+import time
+import pytest
+from observing import kvstore
+
+
+@pytest.fixture
+def store():
+    store = kvstore.MemoryStore()
+    previous = kvstore.set_store(store)
+    yield store
+    kvstore.set_store(previous)
+
+
+def test_put_get(store):
+    value = {'a': [1, 2]}
+    store.put_dict('/test/key', value)
+    value['a'].append(3)
+    assert store.get_dict('/test/key') == {'a': [1, 2]}
+    assert store.get_dict('/test/missing') == {}
+    assert kvstore.get_store() is store
+
+
+def test_watch_in_order(store):
+    events = []
+    wid = store.add_watch('/test/key', events.append)
+    store.put_dict('/test/other', {'n': -1})
+    for i in range(20):
+        store.put_dict('/test/key', {'n': i})
+    store.join()
+    assert [ev['n'] for ev in events] == list(range(20))
+    assert store.watch_ids == [wid]
+
+    store.cancel(wid)
+    store.put_dict('/test/key', {'n': 20})
+    time.sleep(0.01)
+    assert len(events) == 20
+    assert store.watch_ids == []
+
+
+def test_failing_callback(store):
+    events = []
+
+    def callback(event):
+        if event['n'] == 0:
+            raise ValueError('bad event')
+        events.append(event)
+
+    store.add_watch('/test/key', callback)
+    store.put_dict('/test/key', {'n': 0})
+    store.put_dict('/test/key', {'n': 1})
+    store.join()
+    assert events == [{'n': 1}]
+
+
+def test_latency():
+    store = kvstore.MemoryStore(latency=0.01)
+    t0 = time.perf_counter()
+    store.put_dict('/test/key', {})
+    store.get_dict('/test/key')
+    assert time.perf_counter() - t0 >= 0.02
+
+
+def test_memory_from_environment(monkeypatch):
+    monkeypatch.setenv('LWA_KVSTORE', 'memory')
+    previous = kvstore.set_store(None)
+    try:
+        assert isinstance(kvstore.get_store(), kvstore.MemoryStore)
+    finally:
+        kvstore.set_store(previous)
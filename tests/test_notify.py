@@ -0,0 +1,97 @@
+import time
+import pytest
+from observing import notify
+
+
+class RecordingSink:
+    def __init__(self, nfail=0, retry_after=None):
+        self.texts = []
+        self.times = []
+        self.nfail = nfail
+        self.retry_after = retry_after
+
+    def send(self, text):
+        if self.nfail:
+            self.nfail -= 1
+            exc = RuntimeError('ratelimited')
+            if self.retry_after is not None:
+                exc.retry_after = self.retry_after
+            raise exc
+        self.texts.append(text)
+        self.times.append(time.monotonic())
+
+
+def test_batch_and_coalesce():
+    sink = RecordingSink()
+    notifier = notify.Notifier(sink, interval=0.2, min_interval=0.)
+    for sid in range(12):
+        notifier.post(f"Session {sid} submitted", kind='session', summary="{n} sessions submitted: {items}", item=sid)
+    notifier.post("Settings updated")
+    notifier.stop()
+
+    assert sink.texts == ["12 sessions submitted: 0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11\nSettings updated"]
+
+
+def test_few_not_coalesced():
+    notifier = notify.Notifier(notify.NullSink(), coalesce_min=4)
+    batch = [(f"Session {sid} submitted", 'session', "{n} sessions submitted", sid) for sid in range(2)]
+    assert notifier.format(batch) == "Session 0 submitted\nSession 1 submitted"
+
+
+def test_retry():
+    sink = RecordingSink(nfail=2, retry_after=0.05)
+    notifier = notify.Notifier(sink, interval=0.01, min_interval=0.01)
+    notifier.post("hello")
+    notifier.stop()
+
+    assert sink.texts == ["hello"]
+    assert notifier.nsent == 1
+
+
+def test_drop_after_retries():
+    sink = RecordingSink(nfail=10)
+    notifier = notify.Notifier(sink, interval=0.01, min_interval=0.01, max_retries=1)
+    notifier.post("hello")
+    notifier.stop()
+
+    assert sink.texts == []
+    assert notifier.ndropped == 1
+
+
+def test_rate_limit():
+    sink = RecordingSink()
+    notifier = notify.Notifier(sink, interval=0., min_interval=0.1)
+    for ii in range(3):
+        notifier.post(f"message {ii}")
+        time.sleep(0.02)
+    notifier.stop()
+
+    assert len(sink.texts) >= 2
+    assert all(t1 - t0 >= 0.09 for t0, t1 in zip(sink.times, sink.times[1:]))
+
+
+def test_post_does_not_block():
+    class SlowSink:
+        def send(self, text):
+            time.sleep(1)
+
+    notifier = notify.Notifier(SlowSink(), interval=0., max_pending=2)
+    t0 = time.monotonic()
+    for ii in range(10):
+        notifier.post(f"message {ii}")
+    assert time.monotonic() - t0 < 0.5
+    assert notifier.ndropped > 0
+
+
+def test_file_sink(tmp_path, monkeypatch):
+    path = tmp_path / 'notifications.log'
+    monkeypatch.delenv('SLACK_TOKEN_LWA', raising=False)
+    monkeypatch.setenv('LWA_NOTIFY_FILE', str(path))
+    previous = notify.set_notifier()
+    try:
+        notify.notify("Settings updated")
+        notify.get_notifier().stop()
+    finally:
+        notify.set_notifier(previous)
+
+    assert path.read_text().strip().endswith("Settings updated")
@@ -1,5 +1,8 @@
+import sqlite3
+import threading
 import pytest
-from observing.obsstate import create_db, connection_factory, add_calibrations
+from observing import obsstate
+from observing.obsstate import create_db, connection_factory, close_connections, add_calibrations
 from astropy.time import Time
 
 
@@ -21,3 +24,111 @@ def test_create_db():
         c.execute("SELECT * FROM calibrations")
         result = c.fetchone()
         assert result is not None
+
+
+def test_connection_reused(tmp_path):
+    path = str(tmp_path / 'obsstate.db')
+    create_db(path)
+    conn = connection_factory(path)
+    assert connection_factory(path) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connection_factory(path)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+    close_connections()
+    assert connection_factory(path) is not conn
+    close_connections()
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path / 'obsstate.db')
+    create_db(path)
+    errors = []
+
+    def write(beam):
+        try:
+            for i in range(50):
+                with connection_factory(path) as conn:
+                    conn.execute("INSERT INTO calibrations VALUES (?, ?, ?)", (float(i), 'cal', str(beam)))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            close_connections()
+
+    threads = [threading.Thread(target=write, args=(beam,)) for beam in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with connection_factory(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM calibrations").fetchone()[0] == 400
+    close_connections()
+
+
+def test_migrate_legacy_db(tmp_path):
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (time_loaded float, PI_ID text, PI_NAME text, PROJECT_ID text, "
+                 "SESSION_ID integer, SESSION_MODE text, SESSION_DRX_BEAM text, CONFIG_FILE text, CAL_DIR text, "
+                 "STATUS text)")
+    conn.commit()
+    conn.close()
+
+    conn = obsstate.connection_factory(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == obsstate.SCHEMA_VERSION
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(sessions)")}
+    assert {'sessions_session_id', 'sessions_time_loaded', 'sessions_status'} <= indexes
+    plan = conn.execute("EXPLAIN QUERY PLAN UPDATE sessions SET STATUS = ? WHERE SESSION_ID = ?",
+                        ('completed', 1)).fetchall()
+    assert 'sessions_session_id' in str(plan)
+    close_connections()
+
+
+def test_migrate_adds_status_history(tmp_path):
+    path = str(tmp_path / 'version1.db')
+    conn = sqlite3.connect(path)
+    obsstate.MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'status_history'").fetchone() is None
+    conn.close()
+
+    conn = obsstate.connection_factory(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == obsstate.SCHEMA_VERSION
+    indexes = {row[1] for row in conn.execute("PRAGMA index_list(status_history)")}
+    assert 'status_history_session_id' in indexes
+    close_connections()
+
+
+def test_query_sessions_pages(tmp_path):
+    path = str(tmp_path / 'obsstate.db')
+    create_db(path)
+    with connection_factory(path) as conn:
+        for i in range(25):
+            conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (60000. + i//2, str(i % 3), f'pi{i % 3}', '0', i, 'POWER' if i % 2 else 'FAST', '2', '',
+                          '', 'completed' if i < 20 else 'scheduled'))
+
+    pages = []
+    cursor = None
+    while True:
+        rows, cursor = obsstate.query_sessions(limit=7, before=cursor, path=path)
+        pages += rows
+        if cursor is None:
+            break
+    assert sorted(row[4] for row in pages) == list(range(25))
+    assert [row[0] for row in pages] == sorted((row[0] for row in pages), reverse=True)
+
+    rows, _ = obsstate.query_sessions(status='scheduled', path=path)
+    assert sorted(row[4] for row in rows) == [20, 21, 22, 23, 24]
+    rows, _ = obsstate.query_sessions(status=['scheduled'], mode='FAST', pi='pi0', path=path)
+    assert [row[4] for row in rows] == [24]
+    rows, _ = obsstate.query_sessions(start=60002, stop=60004, path=path)
+    assert sorted(row[4] for row in rows) == [4, 5, 6, 7]
+    close_connections()
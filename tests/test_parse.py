@@ -93,3 +93,12 @@ def test_make_command_script_nm():
                 ra = ra.split('(', 1)[-1]
                 dec = dec.split(')', 1)[0]
                 assert float(ra) == obs_ra.pop(0)
+
+def test_make_warm_controller():
+    fn = os.path.join(_install_dir, 'test.sdf')
+    session, obs_list = parsesdf.read_obs_list(fn)
+    df = parsesdf.power_beam_obs(obs_list, session)
+    df_warm = parsesdf.power_beam_obs(obs_list, session, warm=True)
+    assert df_warm.index[0] > df.index[0]
+    assert df_warm.index[-1] == df.index[-1]
+    assert any('controllers.get_controller' in c for c in df_warm['command'])
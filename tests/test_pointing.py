@@ -0,0 +1,47 @@
+import os.path
+import pytest
+import astropy.units as u
+from astropy.coordinates import EarthLocation
+from observing import parsesdf, pointing, tracking
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+SITE = EarthLocation(lat=37.2398*u.deg, lon=-118.2817*u.deg, height=1183*u.m)
+
+
+def test_tracking_obs():
+    fn = os.path.join(_install_dir, 'test.sdf')
+    obs = pointing.tracking_obs(parsesdf.sdf_to_dict(fn))
+    assert obs[1] == {'mjd': 60161, 'mpm': 3300000, 'dur': 60000, 'azalt': False, 'ra': 0., 'dec': 90.}
+
+
+def test_precompute_and_load(tmp_path):
+    fn = os.path.join(_install_dir, 'test.sdf')
+    tables = pointing.precompute(fn, '777_POWER3', site=SITE, pointing_dir=str(tmp_path))
+    obs = pointing.tracking_obs(parsesdf.sdf_to_dict(fn))[1]
+    assert list(tables) == [1]
+    assert tables[1] == tracking.get_tracking_updates(obs, SITE)
+
+    steps = pointing.load('777_POWER3', 1, obs=obs, pointing_dir=str(tmp_path))
+    assert steps == tables[1]
+
+    changed = dict(obs, dur=30000)
+    assert pointing.load('777_POWER3', 1, obs=changed, pointing_dir=str(tmp_path)) is None
+    assert pointing.load('778_POWER3', 1, obs=obs, pointing_dir=str(tmp_path)) is None
+
+
+def test_precompute_without_store(tmp_path):
+    fn = os.path.join(_install_dir, 'test.sdf')
+    tables = pointing.precompute(fn, '777_POWER3', site=SITE, pointing_dir=str(tmp_path / 'pointing'), store=False)
+    assert list(tables) == [1]
+    assert not os.path.exists(tmp_path / 'pointing')
+
+    readonly = tmp_path / 'readonly'
+    readonly.write_text('')   # a file where the directory should be
+    assert pointing.precompute(fn, '777_POWER3', site=SITE, pointing_dir=str(readonly)) == tables
+
+
+def test_submit(tmp_path):
+    fn = os.path.join(_install_dir, 'test.sdf')
+    fut = pointing.submit(fn, '777_POWER3', site=SITE, pointing_dir=str(tmp_path))
+    assert list(fut.result(timeout=60)) == [1]
+    assert os.path.exists(tmp_path / '777_POWER3' / '1.json')
@@ -0,0 +1,93 @@
+import os
+import pytest
+from pandas import DataFrame
+from observing import kvstore, schedule
+from observing.clock import now_mjd
+from observing.schedqueue import ScheduleQueue
+
+SDF = os.path.join(os.path.dirname(__file__), 'test.sdf')   # session 777_POWER3
+
+
+@pytest.fixture
+def store():
+    store = kvstore.MemoryStore()
+    previous = kvstore.set_store(store)
+    yield store
+    kvstore.set_store(previous)
+
+
+def test_publish_only_changed_modes(store):
+    publisher = schedule.SchedulePublisher()
+    publisher.update({'POWER3': {'1_POWER3': [60000., 60000.1]}, 'FAST': {'2_FAST': [60000., 60001.]}})
+    assert publisher.flush() == 3   # two modes and the index
+    assert store.get_dict(schedule.SCHEDULE_KEY) == {'POWER3': 1, 'FAST': 1}
+    assert store.get_dict(f'{schedule.SCHEDULE_KEY}/FAST') == {'2_FAST': [60000., 60001.]}
+
+    publisher.update({'POWER3': {'1_POWER3': [60000., 60000.1]}, 'FAST': {'2_FAST': [60000., 60001.]}})
+    assert publisher.flush() == 0
+    assert publisher.flush() == 0   # nothing pending
+
+    publisher.update({'POWER3': {'1_POWER3': [60000., 60000.1], '3_POWER3': [60000.2, 60000.3]},
+                      'FAST': {'2_FAST': [60000., 60001.]}})
+    nput = store.nput
+    assert publisher.flush() == 2   # POWER3 and the index
+    assert store.nput == nput + 2
+    assert store.get_dict(schedule.SCHEDULE_KEY) == {'POWER3': 2, 'FAST': 1}
+
+    publisher.update({'POWER3': {'3_POWER3': [60000.2, 60000.3]}})
+    assert publisher.flush() == 3   # POWER3, FAST emptied and the index
+    assert store.get_dict(f'{schedule.SCHEDULE_KEY}/FAST') == {}
+    assert store.get_dict(schedule.SCHEDULE_KEY) == {'POWER3': 1}
+
+
+def test_get_sched_reads_published_modes(store):
+    queue = ScheduleQueue()
+    queue.add(DataFrame({'command': ['a', 'b'], 'session_mode_name': '1_POWER3', 'session_id': 1},
+                        index=[60000., 60000.1]))
+    publisher = schedule.SchedulePublisher()
+    publisher.update(queue)
+    publisher.flush()
+
+    scheduled, active = schedule.get_sched()
+    assert scheduled == {'POWER3': {'1_POWER3': [60000., 60000.1]}}
+    assert active == {}
+    assert schedule.get_sched(modes=['VOLT1'])[0] == {}
+
+
+def test_put_dict_per_session_key(store):
+    schedule.put_dict(SDF)
+    index = store.get_dict(schedule.SDFDICT_KEY)
+    assert list(index) == ['777_POWER3']
+    assert index['777_POWER3'] == pytest.approx(now_mjd() + schedule.SDFDICT_TTL, abs=1e-3)
+    assert schedule.get_sdf_entry('777_POWER3')['SESSION']['SESSION_ID'] == '777'
+
+
+def test_put_dict_prunes_expired_and_surplus(store):
+    now = now_mjd()
+    index = {'5_POWER3': now - 1}
+    index.update({f'{i}_POWER3': now + 1 for i in range(10, 20)})
+    for key in index:
+        store.put_dict(f'{schedule.SDFDICT_KEY}/{key}', {'SESSION': {'SESSION_ID': key.split('_')[0]}})
+    store.put_dict(schedule.SDFDICT_KEY, index)
+
+    schedule.put_dict(SDF, limit=10)
+
+    index = store.get_dict(schedule.SDFDICT_KEY)
+    assert sorted(index, key=lambda key: int(key.split('_')[0])) == [f'{i}_POWER3' for i in range(11, 20)] + ['777_POWER3']
+    assert store.get_dict(f'{schedule.SDFDICT_KEY}/5_POWER3') == {}    # expired
+    assert store.get_dict(f'{schedule.SDFDICT_KEY}/10_POWER3') == {}   # beyond limit
+    assert schedule.get_sdf_entry('5_POWER3') is None
+
+
+def test_put_dict_migrates_legacy_index(store):
+    legacy = {'SESSION': {'SESSION_ID': 8, 'SESSION_MODE': 'POWER'}, 'OBSERVATIONS': {}}
+    store.put_dict(schedule.SDFDICT_KEY, {'8_POWER3': legacy})
+    assert schedule.get_sdf_entry('8_POWER3') == legacy   # read from the legacy index before migration
+
+    schedule.put_dict(SDF)
+
+    index = store.get_dict(schedule.SDFDICT_KEY)
+    assert set(index) == {'8_POWER3', '777_POWER3'}
+    assert all(isinstance(value, float) for value in index.values())
+    assert store.get_dict(f'{schedule.SDFDICT_KEY}/8_POWER3') == legacy
+    assert schedule.get_sdf_entry('8_POWER3') == legacy
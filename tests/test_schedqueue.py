@@ -0,0 +1,93 @@
+import time
+import threading
+import pytest
+from observing.schedqueue import ScheduleQueue
+
+
+def test_pop_next_in_start_order(make_session):
+    queue = ScheduleQueue()
+    queue.add(make_session(2, [99993.0, 99994.0]))
+    queue.add(make_session(1, [99991.0, 99992.0]))
+    assert len(queue) == 4
+    assert queue.peek() == (99991.0, '1')
+    rows = queue.pop_next()
+    assert rows.index.tolist() == [99991.0, 99992.0]
+    assert queue.peek() == (99993.0, '2')
+    assert len(queue) == 2
+
+
+def test_same_start_time_sessions_kept_separate(make_session):
+    queue = ScheduleQueue()
+    queue.add(make_session(1, [99991.0, 99992.0], mode='POWER3'))
+    queue.add(make_session(2, [99991.0, 99995.0], mode='POWER4'))
+    first = queue.pop_next()
+    second = queue.pop_next()
+    assert {first.session_id.iloc[0], second.session_id.iloc[0]} == {'1', '2'}
+    assert len(second) == 2
+    assert queue.pop_next() is None
+
+
+def test_cancel(make_session):
+    queue = ScheduleQueue()
+    queue.add(make_session(1, [99991.0, 99992.0]))
+    queue.add(make_session(2, [99993.0]))
+    assert queue.cancel(1) is not None
+    assert queue.cancel(1) is None
+    assert 1 not in queue
+    assert queue.peek() == (99993.0, '2')
+    assert len(queue) == 1
+
+
+def test_pop_due(make_session):
+    queue = ScheduleQueue()
+    for i in range(5):
+        queue.add(make_session(i, [99990.0 + i, 99990.5 + i]))
+    due = queue.pop_due(99992.0)
+    assert [rows.session_id.iloc[0] for rows in due] == ['0', '1', '2']
+    assert queue.nsessions == 2
+
+
+def test_next_session_id_and_views(make_session):
+    queue = ScheduleQueue()
+    assert queue.next_session_id() == 1
+    queue.add(make_session(7, [99991.0, 99992.0]))
+    queue.add(make_session(3, [99995.0], mode='FAST'))
+    assert queue.next_session_id() == 8
+    assert queue.to_dict() == {'POWER3': {'7_POWER3': [99991.0, 99992.0]}, 'FAST': {'3_FAST': [99995.0, 99995.0]}}
+    assert queue.to_frame().index.tolist() == [99991.0, 99992.0, 99995.0]
+    queue.clear()
+    assert len(queue) == 0 and queue.peek() is None
+
+
+def test_wait_woken_by_earlier_session(make_session):
+    queue = ScheduleQueue()
+    queue.add(make_session(1, [99995.0]))
+    queue.wait(0)
+    timer = threading.Timer(0.05, queue.add, args=(make_session(2, [99991.0]),))
+    timer.start()
+    t0 = time.time()
+    assert queue.wait(5)
+    assert time.time() - t0 < 1
+    assert queue.peek() == (99991.0, '2')
+    timer.join()
+
+
+def test_wait_not_woken_by_later_session(make_session):
+    queue = ScheduleQueue()
+    queue.add(make_session(1, [99991.0]))
+    queue.wait(0)
+    queue.add(make_session(2, [99995.0]))
+    assert not queue.wait(0.01)
+
+
+def test_version_changes_on_mutation(make_session):
+    queue = ScheduleQueue()
+    v0 = queue.version
+    queue.add(make_session(1, [99991.0]))
+    assert queue.version > v0
+    v1 = queue.version
+    queue.peek()
+    queue.cancel(5)
+    assert queue.version == v1
+    queue.pop_next()
+    assert queue.version > v1
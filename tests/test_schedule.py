@@ -30,4 +30,27 @@ def test_sched_update_remove_old_sessions():
     sched = [sched1, sched2]
     updated_sched = sched_update(sched)
     assert len(updated_sched) == 4
-    assert updated_sched.index.tolist() == [99991.0, 99992.0, 99993.0, 99994.0]
\ No newline at end of file
+    assert updated_sched.index.tolist() == [99991.0, 99992.0, 99993.0, 99994.0]
+
+def test_submit_due_one_task_per_session():
+    from observing import schedule
+    from observing.clock import now_mjd
+    from observing.schedqueue import ScheduleQueue
+
+    class Pool:
+        def __init__(self):
+            self.calls = []
+
+        def apply_async(self, func, args=(), kwds=None):
+            self.calls.append((func, args[0].session_id.iloc[0]))
+
+    mjd = now_mjd() + 1/86400
+    queue = ScheduleQueue()
+    for sid, smn in [(1, '1_POWER3'), (2, '2_VOLT1'), (3, '3_settings'), (4, '4_settings')]:
+        queue.add(DataFrame({'command': ['cmd'], 'session_mode_name': [smn], 'session_id': [sid]}, index=[mjd]))
+
+    pool = Pool()
+    futures = schedule.submit_due(queue, pool, publish=False)
+    assert len(futures) == 4
+    assert {func for func, _ in pool.calls} == {schedule.runrow}
+    assert sorted(sid for _, sid in pool.calls) == [1, 2, 3, 4]
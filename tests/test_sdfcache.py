@@ -0,0 +1,113 @@
+import os
+import shutil
+import os.path
+import pytest
+from observing import parsesdf, sdfcache
+
+
+_install_dir = os.path.abspath(os.path.dirname(__file__))
+
+
+@pytest.fixture
+def sdffile(tmp_path):
+    fn = str(tmp_path / 'test.sdf')
+    shutil.copy(os.path.join(_install_dir, 'test.sdf'), fn)
+    return fn
+
+
+def test_repeat_parse_hits(sdffile):
+    cache = sdfcache.SDFCache()
+    d1 = cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    d2 = cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    assert d1 is d2
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_evicted_entry_is_built_from_current_contents(sdffile, tmp_path):
+    cache = sdfcache.SDFCache()
+    cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    stamp = os.stat(sdffile)
+    with open(sdffile) as fh:
+        text = fh.read()
+    with open(sdffile, 'w') as fh:
+        fh.write(text.replace('SESSION_ID       777', 'SESSION_ID       778'))
+    os.utime(sdffile, ns=(stamp.st_atime_ns, stamp.st_mtime_ns))   # same size and mtime, so the stat index matches
+    cache._entries.clear()
+
+    d = cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    assert d['SESSION']['SESSION_ID'] == '778'
+    assert cache.get(sdffile, 'dict', parsesdf._text_to_dict) is d
+
+    original = str(tmp_path / 'original.sdf')
+    with open(original, 'w') as fh:
+        fh.write(text)
+    assert cache.get(original, 'dict', parsesdf._text_to_dict)['SESSION']['SESSION_ID'] == '777'
+
+
+def test_read_obs_list_validates_hits(sdffile, tmp_path):
+    cal_dir = tmp_path / 'cal'
+    cal_dir.mkdir()
+    with open(sdffile) as fh:
+        text = fh.read()
+    with open(sdffile, 'w') as fh:
+        fh.write(text.replace('\nOBS_ID', f'\nCAL_DIR          {cal_dir}\n\nOBS_ID', 1))
+
+    session, _ = parsesdf.read_obs_list(sdffile)
+    assert session.cal_directory == str(cal_dir)
+    cal_dir.rmdir()
+    with pytest.raises(AssertionError):
+        parsesdf.read_obs_list(sdffile)
+
+
+def test_modified_file_is_reparsed(sdffile):
+    cache = sdfcache.SDFCache()
+    cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    with open(sdffile) as fh:
+        text = fh.read()
+    with open(sdffile, 'w') as fh:
+        fh.write(text.replace('SESSION_ID       777', 'SESSION_ID       778'))
+    os.utime(sdffile, ns=(0, 0))
+    d = cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    assert d['SESSION']['SESSION_ID'] == '778'
+    assert cache.misses == 2
+
+
+def test_same_content_shares_entry(sdffile, tmp_path):
+    cache = sdfcache.SDFCache()
+    other = str(tmp_path / 'copy.sdf')
+    shutil.copy(sdffile, other)
+    cache.get(sdffile, 'dict', parsesdf._text_to_dict)
+    cache.get(other, 'dict', parsesdf._text_to_dict)
+    assert len(cache) == 1
+    assert cache.hits == 1
+
+
+def test_lru_eviction(tmp_path):
+    cache = sdfcache.SDFCache(maxsize=2)
+    for i in range(3):
+        fn = str(tmp_path / f'{i}.sdf')
+        with open(fn, 'w') as fh:
+            fh.write(f'SESSION_ID {i}\nOBS_ID 1\n')
+        cache.get(fn, 'dict', parsesdf._text_to_dict)
+    assert len(cache) == 2
+
+
+def test_disk_persistence(sdffile, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = sdfcache.SDFCache(cache_dir=cache_dir)
+    builder = lambda text: parsesdf.make_obs_list(parsesdf._text_to_dict(text))
+    session, obs_list = cache.get(sdffile, 'obs_list', builder)
+    assert len(os.listdir(cache_dir)) == 1
+
+    cache2 = sdfcache.SDFCache(cache_dir=cache_dir)
+    session2, obs_list2 = cache2.get(sdffile, 'obs_list', lambda text: pytest.fail('should not reparse'))
+    assert cache2.hits == 1
+    assert session2.session_id == session.session_id
+    assert [obs.obs_start for obs in obs_list2] == [obs.obs_start for obs in obs_list]
+
+
+def test_read_obs_list():
+    fn = os.path.join(_install_dir, 'test.sdf')
+    session, obs_list = parsesdf.read_obs_list(fn)
+    assert session.beam_num == 3
+    assert obs_list[0].session is session
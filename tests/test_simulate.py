@@ -0,0 +1,65 @@
+import time
+import pytest
+from pandas import DataFrame
+from astropy.time import Time
+from observing import classes, makesdf, simulate
+
+
+def write_sdf(directory, session_id, start, mode='POWER', beam=2, obs_dur=60000):
+    text = makesdf.make_session_preamble(session_id, classes.ObsType(mode), pi_id=1, pi_name='Test', beam_num=beam)
+    text += makesdf.make_obs_block(1, Time(start, format='unix').isot[:23], obs_dur, ra=180., dec=40., obj_name='src',
+                                   integration_time=None if mode == 'VOLT' else 1,
+                                   obs_mode=classes.EphemModes.trk_radec)
+    filename = str(directory / f'session_{session_id}.sdf')
+    with open(filename, 'w') as fh:
+        fh.write(text + '\n')
+    return filename
+
+
+def test_run_skips_idle_time(tmp_path):
+    start = Time.now().unix + 86400
+    files = [write_sdf(tmp_path, 1, start), write_sdf(tmp_path, 2, start + 102*86400),
+             write_sdf(tmp_path, 3, start + 102*86400, mode='VOLT', beam=1)]
+
+    t0 = time.monotonic()
+    dd = simulate.run(files, speed=1000, processes=4)
+    assert time.monotonic() - t0 < 60
+
+    assert dd['nsessions'] == 3 and dd['ncompleted'] == 3
+    assert dd['conflicts'] == []
+    assert dd['max_lateness'] < 5   # virtual seconds
+    assert dd['max_concurrent_sessions'] == 2
+    assert set(dd['resource_busy_seconds']) == {'dr2', 'dr1', 'drt1'}
+
+
+def test_run_rejects_conflict(tmp_path):
+    start = Time.now().unix + 86400
+    files = [write_sdf(tmp_path, 1, start, mode='POWER', beam=1), write_sdf(tmp_path, 2, start, mode='VOLT', beam=1)]
+    dd = simulate.run(files, speed=1000)
+    assert dd['ncompleted'] == 1
+    assert dd['conflicts'] == [('2_VOLT1', '1_POWER1')]
+
+
+def test_report():
+    sessions = {'1': DataFrame({'command': ['a', 'b'], 'session_mode_name': '1_POWER2', 'session_id': 1},
+                               index=[60000., 60000. + 100/86400]),
+                '2': DataFrame({'command': ['a', 'b'], 'session_mode_name': '2_settings', 'session_id': 2},
+                               index=[60000. + 50/86400, 60000. + 60/86400])}
+    results = [{'session_id': 1, 'lateness': [0.5, 1.5], 'startup_latency': 0.1},
+               {'session_id': 2, 'lateness': [0.25], 'startup_latency': 0.2}]
+    dd = simulate.report(sessions, results, [], speed=100)
+
+    assert dd['ncompleted'] == 2
+    assert dd['max_lateness'] == 1.5
+    assert dd['mean_lateness'] == pytest.approx(0.75)
+    assert dd['max_startup_latency'] == 0.2
+    assert dd['max_concurrent_sessions'] == 2
+    assert dd['resource_busy_seconds'] == {'dr2': pytest.approx(100, abs=1e-3)}
+
+
+def test_stub_controller_does_not_block():
+    con = simulate.StubController('config.yaml')
+    t0 = time.monotonic()
+    con.control_bf(num=2, coord=(12., 40.), track=True, duration=3600)
+    assert time.monotonic() - t0 < 0.1
+    assert con.calls[0][1] == 'control_bf'
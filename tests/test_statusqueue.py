@@ -0,0 +1,97 @@
+import queue
+import pytest
+from observing import obsstate, statusqueue
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / 'obsstate.db')
+    obsstate.create_db(path)
+    with obsstate.connection_factory(path) as conn:
+        for sid in range(10):
+            conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (60000. + sid, '1', 'pi', '0', sid, 'POWER', '2', '', '', 'scheduled'))
+    yield path
+    obsstate.close_connections()
+
+
+def test_writer_batches(db):
+    events = queue.Queue()
+    statusqueue.set_queue(events)
+    try:
+        for sid in range(10):
+            statusqueue.post(sid, 'observing', mjd=60100. + sid)
+            statusqueue.post(sid, 'completed', mjd=60100.5 + sid)
+        writer = statusqueue.StatusWriter(events, path=db, batch_size=8, interval=0.01).start()
+        writer.stop()
+    finally:
+        statusqueue.set_queue(None)
+
+    assert writer.nwritten == 20
+    assert writer.nbatches >= 3
+    history = obsstate.read_status_history([3], path=db)
+    assert history[3] == [('observing', 60103.), ('completed', 60103.5)]
+    with obsstate.connection_factory(db) as conn:
+        assert {row[0] for row in conn.execute("SELECT STATUS FROM sessions")} == {'completed'}
+
+
+def test_writer_retries(db, tmp_path):
+    events = queue.Queue()
+    writer = statusqueue.StatusWriter(events, path=str(tmp_path / 'missing' / 'obsstate.db'), interval=0.01)
+    writer.start()
+    events.put((1, 'observing', 60101.))
+    while not writer._pending:
+        pass
+    writer.path = db
+    writer.stop()
+
+    assert writer.nwritten == 1
+    assert obsstate.read_status_history(path=db) == {1: [('observing', 60101.)]}
+
+
+def test_post_without_queue(monkeypatch):
+    written = []
+    monkeypatch.setattr(obsstate, 'write_status', written.extend)
+    statusqueue.post('4', 'cancelled', mjd=60000.)
+    assert written == [(4, 'cancelled', 60000.)]
+
+
+def test_write_status_ignores_older_change(db):
+    obsstate.write_status([(2, 'completed', 60100.5)], path=db)
+    obsstate.write_status([(2, 'observing', 60100.)], path=db)
+
+    with obsstate.connection_factory(db) as conn:
+        assert conn.execute("SELECT STATUS FROM sessions WHERE SESSION_ID = 2").fetchone()[0] == 'completed'
+    assert obsstate.read_status_history([2], path=db)[2] == [('observing', 60100.), ('completed', 60100.5)]
+
+
+def test_writer_flushes_when_queue_closes(db):
+    class ClosedQueue(queue.Queue):
+        def get(self, block=True, timeout=None):
+            if self.empty():
+                raise EOFError('closed')
+            return super().get(block=block, timeout=timeout)
+
+    events = ClosedQueue()
+    events.put((1, 'observing', 60101.))
+    events.put((2, 'observing', 60102.))
+    writer = statusqueue.StatusWriter(events, path=db, batch_size=1, interval=0.01).start()
+    writer._thread.join(5)
+    assert not writer._thread.is_alive()
+
+    assert writer.nwritten == 2
+    assert set(obsstate.read_status_history(path=db)) == {1, 2}
+
+
+def test_writer_drops_bad_event(db):
+    events = queue.Queue()
+    writer = statusqueue.StatusWriter(events, path=db, interval=0.01)
+    events.put((1, 'observing', 60101.))
+    events.put((2, 'observing', 'soon'))
+    events.put((3, 'observing', 60103.))
+    writer.start()
+    writer.stop()
+
+    assert writer.nwritten == 2
+    assert not writer._pending
+    assert set(obsstate.read_status_history(path=db)) == {1, 3}
@@ -0,0 +1,27 @@
+import time
+import pytest
+from astropy.time import Time
+from observing import timing
+
+
+def test_wait_until_unix():
+    target = time.time() + 0.05
+    err = timing.wait_until(target)
+    assert 0 <= err < 0.01
+    assert time.time() >= target - 1e-3
+
+
+def test_wait_until_time_and_mjd():
+    t0 = time.time()
+    timing.wait_until(Time(t0 + 0.02, format='unix'))
+    assert time.time() - t0 >= 0.019
+    timing.wait_until_mjd(Time(t0 + 0.04, format='unix').mjd)
+    assert time.time() - t0 >= 0.039
+
+
+def test_wait_until_past():
+    assert timing.wait_until(time.time() - 1) == pytest.approx(1, abs=0.01)
+
+
+def test_mjd_to_unix():
+    assert timing.mjd_to_unix(60000.5) == pytest.approx(Time(60000.5, format='mjd').unix)
@@ -0,0 +1,108 @@
+import time
+import numpy
+import pytest
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates import EarthLocation, AltAz, get_body
+from observing import tracking
+
+SITE = EarthLocation(lat=37.2398*u.deg, lon=-118.2817*u.deg, height=1183*u.m)
+
+
+def make_obs(dur_ms, ra='12:00:00', dec=37.):
+    return {'mjd': 60000, 'mpm': 20*3600*1000, 'dur': dur_ms, 'azalt': False, 'ra': ra, 'dec': dec}
+
+
+def reference_updates(obs, site):
+    """ One transform per step, as run_sdf did before vectorizing. """
+
+    start = Time(obs['mjd'], obs['mpm']/1000/86400, format='mjd', scale='utc')
+    stop = Time(obs['mjd'], (obs['mpm']+obs['dur'])/1000/86400, format='mjd', scale='utc')
+    t = start
+    updates = [t]
+    last = tracking.get_target(obs, t).transform_to(AltAz(obstime=t, location=site))
+    while t <= stop:
+        aa = tracking.get_target(obs, t).transform_to(AltAz(obstime=t, location=site))
+        if tracking.separation(aa.az.rad, aa.alt.rad, last.az.rad, last.alt.rad) >= tracking.BEAM_UPDATE_DISTANCE.deg:
+            updates.append(t)
+            last = aa
+        t += tracking.BEAM_UPDATE_STEP
+    updates.append(stop)
+
+    steps = []
+    for i in range(len(updates)-1):
+        t_step = updates[i] + (updates[i+1] - updates[i])/2.0
+        aa = tracking.get_target(obs, t_step).transform_to(AltAz(obstime=t_step, location=site))
+        steps.append([updates[i].utc.unix, aa.az.deg, aa.alt.deg])
+    return steps
+
+
+def test_matches_reference():
+    obs = make_obs(240*1000)
+    steps = tracking.get_tracking_updates(obs, SITE)
+    ref = reference_updates(obs, SITE)
+    assert len(steps) == len(ref) > 2
+    numpy.testing.assert_allclose(numpy.array(steps), numpy.array(ref), rtol=0, atol=1e-6)
+
+
+def test_body_matches_reference():
+    obs = make_obs(120*1000, ra='moon', dec=None)
+    steps = tracking.get_tracking_updates(obs, SITE)
+    ref = reference_updates(obs, SITE)
+    assert len(steps) == len(ref) > 2
+    numpy.testing.assert_allclose(numpy.array(steps), numpy.array(ref), rtol=0, atol=1e-6)
+
+
+def test_body_follows_ephemeris():
+    obs = make_obs(3600*1000, ra='moon', dec=None)
+    steps = tracking.get_tracking_updates(obs, SITE)
+    t = Time([step[0] for step in steps], format='unix')
+    mid = t[:-1] + (t[1:] - t[:-1])/2
+    aa = get_body('moon', mid, location=SITE).transform_to(AltAz(obstime=mid, location=SITE))
+    sep = tracking.separation(aa.az.rad, aa.alt.rad, numpy.radians([s[1] for s in steps[:-1]]),
+                              numpy.radians([s[2] for s in steps[:-1]]))
+    assert sep.max() < 1./3600
+
+
+def test_long_track_is_fast():
+    obs = make_obs(4*3600*1000)
+    t0 = time.time()
+    steps = tracking.get_tracking_updates(obs, SITE)
+    assert time.time() - t0 < 5
+    assert steps[0][0] == pytest.approx(Time(60000 + 20/24, format='mjd').unix)
+    assert all(t1 > t0 for (t0, _, _), (t1, _, _) in zip(steps[:-1], steps[1:]))
+
+
+def test_azalt():
+    obs = make_obs(1000, ra=180., dec=45.)
+    obs['azalt'] = True
+    steps = tracking.get_tracking_updates(obs, SITE)
+    assert len(steps) == 1
+    assert steps[0] == [pytest.approx(Time(60000 + 20/24, format='mjd').unix), 180., 45.]
+
+
+def test_select_updates():
+    alt = numpy.zeros(1000)
+    az = numpy.radians(numpy.arange(1000)*0.03)
+    assert tracking.select_updates(az, alt, 0.08) == list(range(0, 1000, 3))
+
+
+@pytest.mark.parametrize('dec', [-30., 0., 37., 80., 89.9, 90.])
+def test_adaptive_matches_grid(dec):
+    obs = make_obs(3600*1000, dec=dec)
+    assert tracking.get_tracking_updates(obs, SITE) == tracking.get_tracking_updates(obs, SITE, adaptive=False)
+
+
+def test_adaptive_transforms_scale_with_updates():
+    obs = make_obs(4*3600*1000, dec=80.)
+    start = Time(obs['mjd'], obs['mpm']/1000/86400, format='mjd', scale='utc')
+    positions = tracking._GridPositions(obs, start, 1., SITE)
+    idx = tracking.plan_updates(positions, 4*3600 + 1, tracking.predicted_interval(80., 0.08), 0.08)
+    assert positions.ntransforms < 20
+    assert len(positions._cache) < 5*len(idx)
+
+
+def test_predicted_interval():
+    assert tracking.predicted_interval(0., 0.08) == pytest.approx(0.08/tracking.SIDEREAL_RATE)
+    assert tracking.predicted_interval(60., 0.08) == pytest.approx(2*0.08/tracking.SIDEREAL_RATE, rel=1e-3)
+    assert tracking.predicted_interval(90., 0.08) == numpy.inf
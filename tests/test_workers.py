@@ -0,0 +1,69 @@
+import os
+import multiprocessing
+import pytest
+from observing import workers
+
+
+def test_make_pool_recycles_workers():
+    pool = workers.make_pool(processes=1, preload=['json'], forkserver_preload=['json'], configs=[])
+    try:
+        pid1 = pool.apply(os.getpid)
+        pid2 = pool.apply(os.getpid)
+    finally:
+        pool.terminate()
+    assert pid1 != pid2
+
+
+def test_make_pool_unknown_method():
+    pool = workers.make_pool(processes=1, method='unknown', preload=[], maxtasksperchild=None, configs=[])
+    try:
+        assert pool.apply(os.getpid) != os.getpid()
+    finally:
+        pool.terminate()
+
+
+def test_warm_sets_health():
+    from observing import controllers
+
+    class FakeController:
+        def __init__(self, config_file):
+            if 'bad' in config_file:
+                raise RuntimeError('cannot connect')
+
+    previous = controllers.set_factory(FakeController)
+    health = workers.PoolHealth(multiprocessing.get_context(), 2, ['good.yaml', 'bad.yaml'])
+    try:
+        workers.warm(preload=[], configs=['good.yaml', 'bad.yaml'], health=health)
+    finally:
+        controllers.set_factory(previous)
+    assert health.pids[0] == os.getpid()
+    assert health.flags[:2] == [True, False]
+    assert health.warm_configs() == ['good.yaml']
+
+
+def test_pool_health_needs_every_live_worker():
+    health = workers.PoolHealth(multiprocessing.get_context(), 3, ['a.yaml', 'b.yaml'])
+    assert health.warm_configs() == []
+
+    slot = health.claim()
+    health.set(slot, 0, True)
+    health.set(slot, 1, True)
+    assert health.warm_configs() == ['a.yaml', 'b.yaml']
+
+    health.pids[1] = os.getppid()   # another live worker, warmed only for a.yaml
+    health.set(1, 0, True)
+    assert health.warm_configs() == ['a.yaml']
+
+    health.release(1)   # only the worker itself releases its slot
+    assert health.warm_configs() == ['a.yaml']
+    health.pids[1] = 0
+    assert health.warm_configs() == ['a.yaml', 'b.yaml']
+
+
+def test_warm_configs_only_after_successful_warmup():
+    pool = workers.make_pool(processes=1, preload=[], forkserver_preload=['json'], configs=['missing.yaml'])
+    try:
+        pool.apply(os.getpid)   # initializer has run
+        assert workers.warm_configs() == []
+    finally:
+        pool.terminate()